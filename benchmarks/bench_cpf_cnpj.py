@@ -0,0 +1,65 @@
+"""
+Benchmark da validação de CPF/CNPJ: implementação vetorizada x pycpfcnpj linha a linha.
+
+Uso: python benchmarks/bench_cpf_cnpj.py [--registros N]
+"""
+import argparse
+import random
+import re
+import time
+
+import pandas as pd
+from pycpfcnpj import cpfcnpj, gen
+
+from profiler_dq.cpf_cnpj import validar_cpf_cnpj
+
+
+def gerar_amostra(n, seed=0):
+    """
+    Gera uma amostra com CPFs e CNPJs válidos (com e sem pontuação), números aleatórios, textos e nulos.
+    """
+    random.seed(seed)
+    geradores = [gen.cpf, gen.cnpj, gen.cpf_with_punctuation, gen.cnpj_with_punctuation,
+                 lambda: str(random.randrange(10**10, 10**14)),
+                 lambda: random.choice(['Maria da Silva', 'Rua A, 123', '', None])]
+    # Gera um conjunto menor de valores e o replica, pois a geração pela pycpfcnpj é lenta
+    base = [random.choice(geradores)() for _ in range(min(n, 100000))]
+    return pd.Series((base * (n // len(base) + 1))[:n], dtype=object)
+
+
+def validar_linha_a_linha(s):
+    r = re.compile(r'[^0-9]')
+    cpf_cnpj_digitos = s.apply(lambda x : len(r.sub('', str(x))))
+    cpf_cnpj_validos = s.apply(lambda x : cpfcnpj.validate(str(x)) if x else False)
+    return cpf_cnpj_digitos.to_numpy(), cpf_cnpj_validos.to_numpy(dtype=bool)
+
+
+def cronometrar(func, s):
+    inicio = time.perf_counter()
+    resultado = func(s)
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark da validação de CPF/CNPJ.')
+    parser.add_argument('--registros', type=int, metavar="N", default=1000000,
+                        help='Número de registros da amostra (padrão: 1000000).')
+    args = parser.parse_args()
+
+    s = gerar_amostra(args.registros)
+
+    t_original, (digitos_original, validos_original) = cronometrar(validar_linha_a_linha, s)
+    t_vetorizado, (digitos_vetorizado, validos_vetorizado) = cronometrar(validar_cpf_cnpj, s)
+
+    assert (digitos_original == digitos_vetorizado).all(), "Contagem de dígitos divergente"
+    assert (validos_original == validos_vetorizado).all(), "Validação divergente"
+
+    print(f"Registros:   {len(s)}")
+    print(f"Válidos:     {validos_vetorizado.sum()}")
+    print(f"pycpfcnpj:   {t_original:.2f}s ({len(s)/t_original:,.0f} registros/s)")
+    print(f"Vetorizado:  {t_vetorizado:.2f}s ({len(s)/t_vetorizado:,.0f} registros/s)")
+    print(f"Speedup:     {t_original/t_vetorizado:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+Benchmark do profiler_dq sobre um banco SQLite sintético (ver gerar_banco.py).
+
+Mede o pipeline completo (contagem de registros, análise das amostras, validações SQL e gravação do relatório)
+e cada função de análise isoladamente. Para cada caso são registrados o tempo, a vazão (registros/s e colunas/s)
+e o pico de memória (RSS). Cada caso é executado em um processo próprio, para que o pico de memória de um caso
+não seja afetado pelos demais.
+
+O resultado é gravado em um arquivo JSON, que pode ser usado como linha de base em execuções seguintes:
+
+    python benchmarks/bench_profiler.py --salvar baseline.json
+    python benchmarks/bench_profiler.py --comparar baseline.json
+
+Deve ser executado a partir da raiz do repositório (com PYTHONPATH=.), onde fica a pasta validacao.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from gerar_banco import TIPOS, colunas_tabela, gerar_banco, gerar_dataframe
+
+# Tolerância padrão da comparação com a linha de base (20% de queda de vazão ou aumento de memória)
+TOLERANCIA_PADRAO = 0.2
+
+
+def pico_rss_mb():
+    """
+    Pico de memória (RSS) do processo atual, em MB, ou None se não disponível na plataforma.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é dado em KB no Linux e em bytes no macOS
+    return pico / 2**20 if sys.platform == 'darwin' else pico / 2**10
+
+
+def _medir(func, repeticoes):
+    """
+    Executa o caso repeticoes vezes e considera a execução mais rápida, reduzindo a variação entre medições.
+
+    :param func: Função que executa o caso e retorna (tempo de cada etapa ou None, registros processados, colunas processadas).
+    """
+    segundos = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        # A saída do profiler_dq é descartada, para não interferir na medição
+        with contextlib.redirect_stdout(io.StringIO()):
+            r = func()
+        duracao = time.perf_counter() - inicio
+        if segundos is None or duracao < segundos:
+            segundos = duracao
+            etapas, registros, colunas = r
+
+    return {
+        'segundos': segundos,
+        'registros': registros,
+        'colunas': colunas,
+        'registros_por_s': registros / segundos,
+        'colunas_por_s': colunas / segundos,
+        'pico_rss_mb': pico_rss_mb(),
+        'etapas': etapas,
+    }
+
+
+def caso_pipeline(arquivo, amostra, workers, formatos, diretorio_saida, repeticoes=1):
+    """
+    Executa o pipeline completo, como em profiler_dq.__main__.main.
+    """
+    from profiler_dq.ambientes import Ambiente
+    from profiler_dq.info_colunas import analise_colunas_sample, analise_colunas_sql
+    from profiler_dq.saida import Saida
+    from profiler_dq.__main__ import gerar_xlsx
+
+    def executar():
+        ambiente = Ambiente({'url': f'sqlite:///{arquivo}'}, conexoes=workers)
+        etapas = {}
+        relogio = time.perf_counter()
+
+        def etapa(nome):
+            nonlocal relogio
+            agora = time.perf_counter()
+            etapas[nome] = agora - relogio
+            relogio = agora
+
+        df_tabelas = ambiente.obter_tabelas()
+        etapa('obter_tabelas')
+
+        saida = Saida(os.path.join(diretorio_saida, 'dicionario'), formatos)
+        df_colunas_sample = analise_colunas_sample(ambiente, sample_size=amostra, workers=workers)
+        etapa('analise_colunas_sample')
+
+        df_colunas_validacao = analise_colunas_sql(ambiente, df_colunas_sample)
+        etapa('analise_colunas_sql')
+
+        saida.escrever('Tabelas', df_tabelas)
+        saida.escrever('Colunas', df_colunas_sample)
+        saida.escrever('Validacao', df_colunas_validacao)
+        saida.fechar()
+        if 'xlsx' in formatos:
+            gerar_xlsx(os.path.join(diretorio_saida, 'dicionario.xlsx'), df_tabelas, df_colunas_sample, df_colunas_validacao)
+        etapa('gravar_saida')
+
+        registros = int(df_tabelas.num_registros.clip(upper=amostra).sum())
+        return etapas, registros, len(df_colunas_sample)
+
+    return _medir(executar, repeticoes)
+
+
+def caso_funcao(nome_funcao, registros, mix, seed, repeticoes=1):
+    """
+    Executa uma função de análise sobre todas as colunas de um DataFrame sintético.
+    """
+    import numpy as np
+    from profiler_dq import data_types
+    from profiler_dq.info_colunas import funcoes_analises
+
+    tipos_profiler = {'cpf': data_types.STRING, 'cnpj': data_types.STRING, 'hash': data_types.STRING,
+                      'nome': data_types.STRING, 'data': data_types.STRING, 'inteiro': data_types.NUMERIC,
+                      'real': data_types.FLOAT, 'texto': data_types.STRING}
+
+    definicao = colunas_tabela(len(mix), mix)
+    df = gerar_dataframe(np.random.default_rng(seed), definicao, registros)
+    # Colunas numéricas com o mesmo tipo lido do banco
+    for nome, tipo in definicao:
+        if tipo in ('inteiro', 'real'):
+            df[nome] = df[nome].astype(float)
+
+    analise_f = dict((f.__name__, f) for _, f in funcoes_analises)[nome_funcao]
+
+    def executar():
+        for nome, tipo in definicao:
+            analise_f(nome, tipos_profiler[tipo], df[nome])
+        return None, registros * len(definicao), len(definicao)
+
+    return _medir(executar, repeticoes)
+
+
+def executar_caso(func, *args):
+    # Cada caso é executado em um processo novo, para que o pico de memória seja o do próprio caso
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(func, *args).result()
+
+
+def comparar(resultados, baseline, tolerancia):
+    """
+    Compara os resultados com a linha de base.
+
+    :return: Lista de regressões (casos cuja vazão caiu ou cuja memória aumentou além da tolerância).
+    """
+    regressoes = []
+    print(f"{'Caso':45} {'registros/s':>14} {'base':>14} {'var.':>8} {'RSS MB':>8} {'base':>8} {'var.':>8}")
+    for caso, r in resultados.items():
+        b = baseline.get('resultados', {}).get(caso)
+        if b is None:
+            print(f"{caso:45} {r['registros_por_s']:14,.0f} {'-':>14}")
+            continue
+
+        var_vazao = r['registros_por_s'] / b['registros_por_s'] - 1
+        linha = f"{caso:45} {r['registros_por_s']:14,.0f} {b['registros_por_s']:14,.0f} {var_vazao:+8.1%}"
+        if var_vazao < -tolerancia:
+            regressoes.append(f"{caso}: vazão {var_vazao:+.1%}")
+
+        if r['pico_rss_mb'] and b.get('pico_rss_mb'):
+            var_rss = r['pico_rss_mb'] / b['pico_rss_mb'] - 1
+            linha += f" {r['pico_rss_mb']:8.0f} {b['pico_rss_mb']:8.0f} {var_rss:+8.1%}"
+            if var_rss > tolerancia:
+                regressoes.append(f"{caso}: memória {var_rss:+.1%}")
+        print(linha)
+
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do profiler_dq sobre um banco sintético.')
+    parser.add_argument('--tabelas', type=int, metavar="N", default=10,
+                        help='Número de tabelas do banco sintético (padrão: 10).')
+    parser.add_argument('--registros', type=int, metavar="N", default=100000,
+                        help='Número de registros por tabela (padrão: 100000).')
+    parser.add_argument('--colunas', type=int, metavar="N", default=8,
+                        help='Número de colunas por tabela (padrão: 8).')
+    parser.add_argument('--mix', type=str, nargs='+', metavar="TIPO", choices=TIPOS, default=list(TIPOS),
+                        help=f'Tipos das colunas, atribuídos em ordem circular: {list(TIPOS)}.')
+    parser.add_argument('--amostra', type=int, metavar="N", default=10000,
+                        help='Número de registros na amostra de cada tabela (padrão: 10000).')
+    parser.add_argument('--workers', type=int, metavar="N", default=1,
+                        help='Número de tabelas analisadas em paralelo (padrão: 1).')
+    parser.add_argument('--format', type=str, nargs='+', metavar="FORMATO", default=['xlsx'],
+                        help='Formatos do relatório gravado no pipeline (padrão: xlsx).')
+    parser.add_argument('--banco', type=str, metavar="ARQUIVO",
+                        help='Banco sintético a ser usado. Se não existir, é gerado (padrão: arquivo temporário).')
+    parser.add_argument('--seed', type=int, metavar="N", default=0,
+                        help='Semente dos valores aleatórios (padrão: 0).')
+    parser.add_argument('--repeticoes', type=int, metavar="N", default=3,
+                        help='Número de execuções de cada caso. É considerada a mais rápida (padrão: 3).')
+    parser.add_argument('--salvar', type=str, metavar="ARQUIVO",
+                        help='Grava o resultado em um arquivo JSON (linha de base).')
+    parser.add_argument('--comparar', type=str, metavar="ARQUIVO",
+                        help='Compara o resultado com uma linha de base gravada anteriormente.')
+    parser.add_argument('--tolerancia', type=float, metavar="T", default=TOLERANCIA_PADRAO,
+                        help=f'Variação máxima aceita na comparação (padrão: {TOLERANCIA_PADRAO}).')
+    args = parser.parse_args()
+
+    parametros = {k: getattr(args, k) for k in ('tabelas', 'registros', 'colunas', 'mix', 'amostra', 'workers', 'format', 'seed')}
+
+    with tempfile.TemporaryDirectory(prefix='profiler_dq_bench_') as diretorio:
+        arquivo = args.banco or os.path.join(diretorio, 'bench.db')
+        if not os.path.exists(arquivo):
+            print(f"Gerando banco sintético {arquivo}")
+            gerar_banco(arquivo, args.tabelas, args.registros, args.colunas, args.mix, args.seed)
+
+        resultados = {}
+        print("Executando pipeline")
+        resultados['pipeline'] = executar_caso(caso_pipeline, arquivo, args.amostra, args.workers, args.format, diretorio,
+                                             args.repeticoes)
+
+        from profiler_dq.info_colunas import funcoes_analises
+        for _, analise_f in funcoes_analises:
+            print(f"Executando {analise_f.__name__}")
+            resultados[f'funcao.{analise_f.__name__}'] = executar_caso(caso_funcao, analise_f.__name__, args.amostra, args.mix, args.seed,
+                                                                     args.repeticoes)
+
+    for caso, r in resultados.items():
+        print(f"{caso:45} {r['segundos']:8.2f}s {r['registros_por_s']:14,.0f} registros/s "
+              f"{r['colunas_por_s']:10,.1f} colunas/s {r['pico_rss_mb'] or 0:8.0f} MB")
+        for etapa, segundos in (r['etapas'] or {}).items():
+            print(f"  {etapa:43} {segundos:8.2f}s")
+
+    if args.salvar:
+        with open(args.salvar, 'w') as f:
+            json.dump({'parametros': parametros, 'plataforma': platform.platform(), 'python': platform.python_version(),
+                       'resultados': resultados}, f, indent=2)
+        print(f"Resultado gravado em {args.salvar}")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            baseline = json.load(f)
+        if baseline.get('parametros') != parametros:
+            print(f"WARNING: Parâmetros diferentes da linha de base: {baseline.get('parametros')}")
+
+        regressoes = comparar(resultados, baseline, args.tolerancia)
+        if regressoes:
+            print("Regressões encontradas:")
+            for r in regressoes:
+                print(f"  {r}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Geração de bancos SQLite sintéticos para os benchmarks.
+
+Cada tabela t_<i> tem o número de registros e de colunas indicados. Os tipos das colunas seguem a composição
+(mix) informada, em ordem circular: cpf, cnpj, hash, nome, data, inteiro, real e texto. Uma fração dos valores
+é nula e os CPFs/CNPJs são válidos. O banco também contém a tabela cpf (cpf, name), usada pelos scripts da
+pasta validacao.
+
+Uso: python benchmarks/gerar_banco.py ARQUIVO [--tabelas N] [--registros N] [--colunas N] [--mix TIPO ...]
+"""
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from profiler_dq.cpf_cnpj import PESOS_CPF, PESOS_CNPJ
+
+TIPOS = ('cpf', 'cnpj', 'hash', 'nome', 'data', 'inteiro', 'real', 'texto')
+TIPOS_SQLITE = {'cpf': 'TEXT', 'cnpj': 'TEXT', 'hash': 'TEXT', 'nome': 'TEXT', 'data': 'DATE',
+                'inteiro': 'INTEGER', 'real': 'REAL', 'texto': 'TEXT'}
+
+PRENOMES = np.array(['MARIA', 'JOSE', 'ANA', 'JOAO', 'ANTONIO', 'FRANCISCA', 'CARLOS', 'PAULO', 'LUCAS', 'JULIANA',
+                     'PEDRO', 'ADRIANA', 'MARCOS', 'LUIZ', 'PATRICIA', 'GABRIEL', 'RAFAEL', 'ALINE', 'DANIEL', 'BRUNA'])
+SOBRENOMES = np.array(['SILVA', 'SANTOS', 'OLIVEIRA', 'SOUZA', 'RODRIGUES', 'FERREIRA', 'ALVES', 'PEREIRA', 'LIMA',
+                       'GOMES', 'COSTA', 'RIBEIRO', 'MARTINS', 'CARVALHO', 'ALMEIDA', 'LOPES', 'SOARES', 'FERNANDES'])
+
+# Fração de valores nulos em cada coluna
+FRACAO_NULOS = 0.05
+
+# Número de registros gravados por vez
+TAMANHO_LOTE = 50000
+
+
+def _digitos_verificadores(base, pesos):
+    for p in pesos:
+        resto = (base[:, :len(p)] @ p) % 11
+        base = np.column_stack([base, np.where(resto < 2, 0, 11 - resto)])
+    return base
+
+
+def _documentos(rng, n, tamanho, pesos):
+    digitos = _digitos_verificadores(rng.integers(0, 10, size=(n, tamanho - 2)), pesos)
+    return (digitos.astype(np.uint8) + ord('0')).view(f'S{tamanho}').ravel().astype(str)
+
+
+def gerar_coluna(rng, tipo, n):
+    """
+    Gera n valores do tipo indicado.
+    """
+    if tipo == 'cpf':
+        return _documentos(rng, n, 11, PESOS_CPF)
+    if tipo == 'cnpj':
+        return _documentos(rng, n, 14, PESOS_CNPJ)
+    if tipo == 'hash':
+        return np.array([f'{x:016x}{y:016x}' for x, y in rng.integers(0, 2**63, size=(n, 2))])
+    if tipo == 'nome':
+        return np.char.add(np.char.add(rng.choice(PRENOMES, n), ' '), rng.choice(SOBRENOMES, n))
+    if tipo == 'data':
+        dias = rng.integers(0, 365 * 50, n)
+        return (np.datetime64('1970-01-01') + dias).astype(str)
+    if tipo == 'inteiro':
+        return rng.integers(0, 10**6, n)
+    if tipo == 'real':
+        return rng.normal(1000, 250, n).round(2)
+    if tipo == 'texto':
+        return np.char.add('texto ', rng.integers(0, n // 10 + 1, n).astype(str))
+    raise ValueError(f"Tipo de coluna desconhecido: {tipo}")
+
+
+def gerar_dataframe(rng, colunas, n):
+    """
+    Gera um DataFrame com n registros, um campo para cada (nome, tipo) em colunas.
+    """
+    df = pd.DataFrame({nome: gerar_coluna(rng, tipo, n) for nome, tipo in colunas})
+    for nome, _ in colunas:
+        df[nome] = df[nome].astype(object).where(rng.random(n) >= FRACAO_NULOS, None)
+    return df
+
+
+def colunas_tabela(colunas, mix):
+    return [(f'c{j}_{mix[j % len(mix)]}', mix[j % len(mix)]) for j in range(colunas)]
+
+
+def gerar_banco(arquivo, tabelas=10, registros=100000, colunas=8, mix=TIPOS, seed=0):
+    """
+    Gera o banco SQLite sintético. Um arquivo existente é substituído.
+    """
+    if os.path.exists(arquivo):
+        os.remove(arquivo)
+
+    rng = np.random.default_rng(seed)
+    definicao = colunas_tabela(colunas, mix)
+
+    with sqlite3.connect(arquivo) as conn:
+        for i in range(tabelas):
+            nome_tabela = f't_{i}'
+            ddl = ', '.join(f'{nome} {TIPOS_SQLITE[tipo]}' for nome, tipo in definicao)
+            conn.execute(f'CREATE TABLE {nome_tabela} ({ddl})')
+            for inicio in range(0, registros, TAMANHO_LOTE):
+                n = min(TAMANHO_LOTE, registros - inicio)
+                gerar_dataframe(rng, definicao, n).to_sql(nome_tabela, conn, index=False, if_exists='append')
+
+        # Tabela de referência dos scripts de validação
+        n = min(registros, TAMANHO_LOTE)
+        pd.DataFrame({'cpf': gerar_coluna(rng, 'cpf', n), 'name': gerar_coluna(rng, 'nome', n)}).to_sql(
+            'cpf', conn, index=False, dtype={'cpf': 'TEXT', 'name': 'TEXT'})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gera um banco SQLite sintético para benchmarks.')
+    parser.add_argument('arquivo', type=str, metavar="ARQUIVO",
+                        help='Arquivo do banco a ser gerado.')
+    parser.add_argument('--tabelas', type=int, metavar="N", default=10,
+                        help='Número de tabelas (padrão: 10).')
+    parser.add_argument('--registros', type=int, metavar="N", default=100000,
+                        help='Número de registros por tabela (padrão: 100000).')
+    parser.add_argument('--colunas', type=int, metavar="N", default=8,
+                        help='Número de colunas por tabela (padrão: 8).')
+    parser.add_argument('--mix', type=str, nargs='+', metavar="TIPO", choices=TIPOS, default=list(TIPOS),
+                        help=f'Tipos das colunas, atribuídos em ordem circular: {list(TIPOS)}.')
+    parser.add_argument('--seed', type=int, metavar="N", default=0,
+                        help='Semente dos valores aleatórios (padrão: 0).')
+    args = parser.parse_args()
+
+    gerar_banco(args.arquivo, args.tabelas, args.registros, args.colunas, args.mix, args.seed)
+    print(f"Banco {args.arquivo} gerado: {args.tabelas} tabelas, {args.registros} registros, {args.colunas} colunas")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,17 @@ import argparse
 import json
 import os
 
+from functools import partial
 
-from .ambientes import Ambiente
-from .info_colunas import analise_colunas_sample, analise_colunas_sql
+from .ambientes import Ambiente, AmbienteLocal, ESTRATEGIAS_AMOSTRAGEM
+from .info_colunas import analise_colunas_sample, analise_colunas_sql, carregar_validacoes
+from .cache import Cache, DIR_CACHE_PADRAO
+from .checkpoint import Checkpoint, ARQUIVO_CHECKPOINT_PADRAO
+from .chaves import DescobridorChaves
+from .relacionamentos import DescobridorRelacionamentos, confirmar as confirmar_relacionamentos
+from .saida import Saida, FORMATOS
+from . import desempenho
+from . import nomes
 
 AMOSTRA_PADRAO = 10000
 
@@ -47,11 +55,168 @@ def tratar_argumentos(id_ambientes):
     parser.add_argument('--amostra', type=int, metavar="N", default=AMOSTRA_PADRAO,
                         help=f'Número de registros na amostra.')
     
+    parser.add_argument('--sampling', type=str, metavar="ESTRATEGIA", choices=ESTRATEGIAS_AMOSTRAGEM, required=False,
+                        help=f'Estratégia de amostragem: {list(ESTRATEGIAS_AMOSTRAGEM)}. Estratégias não suportadas pelo SGBD '
+                             f'usam amostragem reservoir sobre a leitura completa da tabela (padrão: amostragem do SGBD).')
+    
+    parser.add_argument('--estrato', type=str, metavar="COLUNA", required=False,
+                        help=f'Coluna de estrato da amostragem stratified. Tabelas sem a coluna usam a amostragem random.')
+    
+    parser.add_argument('--adaptativa', action='store_true',
+                        help=f'Amostragem adaptativa: amplia a amostra de cada tabela, a partir de --amostra-inicial e até --amostra '
+                             f'registros, até que os intervalos de confiança das métricas alcancem a --precisao (opcional).')
+    
+    parser.add_argument('--amostra-inicial', type=int, metavar="N", default=1000,
+                        help=f'Tamanho da primeira amostra da amostragem adaptativa, dobrado a cada rodada (padrão: 1000).')
+    
+    parser.add_argument('--precisao', type=float, metavar="E", default=0.01,
+                        help=f'Semiamplitude máxima dos intervalos de confiança na amostragem adaptativa: absoluta nas proporções '
+                             f'e relativa à amplitude P01-P99 nos percentis (padrão: 0.01).')
+    
+    parser.add_argument('--confianca', type=float, metavar="C", default=0.95,
+                        help=f'Nível de confiança dos intervalos na amostragem adaptativa (padrão: 0.95).')
+    
+    parser.add_argument('--workers', type=int, metavar="N", default=1,
+                        help=f'Número de tabelas amostradas em paralelo (padrão: 1).')
+    
+    parser.add_argument('--analisadores', type=int, metavar="N", default=1,
+                        help=f'Número de amostras analisadas em paralelo, enquanto outras amostras são obtidas (padrão: 1).')
+    
+    parser.add_argument('--processos', type=int, metavar="N", required=False,
+                        help=f'Executa as funções de análise em um pool de N processos, usando todos os núcleos (opcional).')
+    
+    parser.add_argument('--chunksize', type=int, metavar="N", required=False,
+                        help=f'Lê as amostras em blocos de N registros, limitando o uso de memória. As métricas estimadas são '
+                             f'indicadas na coluna "metricas_estimadas" (opcional).')
+    
+    parser.add_argument('--full-scan', action='store_true',
+                        help=f'Lê todos os registros das tabelas, estimando distintos, percentis e moda com sketches e resumos de '
+                             f'memória limitada, indicados na coluna "metricas_estimadas". As chaves candidatas estimadas são '
+                             f'confirmadas por contagem exata no SGBD (opcional).')
+    
+    parser.add_argument('--erro-unique', type=float, metavar="E", default=0.01,
+                        help=f'Erro relativo da estimativa de distintos no modo --full-scan (padrão: 0.01).')
+    
+    parser.add_argument('--erro-percentis', type=float, metavar="E", default=0.01,
+                        help=f'Erro de rank da estimativa de percentis no modo --full-scan (padrão: 0.01).')
+    
+    parser.add_argument('--pushdown', action='store_true',
+                        help=f'Calcula missing, unique, min e max por agregação no SGBD, sem transferir registros (opcional).')
+    
+    parser.add_argument('--stats-only', action='store_true',
+                        help=f'Obtém missing, unique, min e max das estatísticas do otimizador do SGBD, sem consultar as tabelas. '
+                             f'Apenas as tabelas sem estatísticas completas e atualizadas são analisadas (opcional).')
+    
+    parser.add_argument('--timeout-sql', type=float, metavar="SEGUNDOS", required=False,
+                        help=f'Tempo máximo de cada consulta ao SGBD. A consulta que excede o tempo é cancelada pelo driver (opcional).')
+    
+    parser.add_argument('--tempo-tabela', type=float, metavar="SEGUNDOS", required=False,
+                        help=f'Tempo máximo das consultas de cada tabela. As tabelas que excedem o tempo (ou --timeout-sql) são '
+                             f'analisadas sobre uma amostra reduzida, obtida com a amostragem block ou first-n, e marcadas na '
+                             f'coluna "tempo_excedido" (opcional).')
+    
+    parser.add_argument('--cache', type=str, metavar="DIR", nargs='?', const=DIR_CACHE_PADRAO,
+                        help=f'Reaproveita resultados de execuções anteriores gravados no diretório DIR (padrão: {DIR_CACHE_PADRAO}).')
+    
+    parser.add_argument('--cache-ttl', type=float, metavar="HORAS", default=24,
+                        help=f'Validade dos resultados no cache, em horas (padrão: 24).')
+    
+    parser.add_argument('--refresh', action='store_true',
+                        help=f'Ignora os resultados existentes no cache e os atualiza.')
+    
+    parser.add_argument('--checkpoint', type=str, metavar="ARQUIVO", nargs='?', const=ARQUIVO_CHECKPOINT_PADRAO,
+                        help=f'Grava as métricas e as validações de cada tabela concluída no arquivo ARQUIVO, para que uma execução '
+                             f'interrompida possa ser retomada com --resume (padrão: {ARQUIVO_CHECKPOINT_PADRAO}).')
+    
+    parser.add_argument('--resume', action='store_true',
+                        help=f'Retoma a execução gravada em --checkpoint, processando apenas as tabelas não concluídas. '
+                             f'Requer os mesmos parâmetros da execução interrompida.')
+    
+    parser.add_argument('--validacao-local', action='store_true',
+                        help=f'Executa as validações SQL sobre as amostras, em um banco SQLite local, em vez do banco de origem.')
+    
+    parser.add_argument('--chaves', action='store_true',
+                        help=f'Procura nas amostras as chaves compostas mínimas e as dependências funcionais aproximadas entre as '
+                             f'colunas de cada tabela, gravadas na planilha "Chaves".')
+    
+    parser.add_argument('--chaves-max-colunas', type=int, metavar="N", default=3,
+                        help=f'Número máximo de colunas das chaves e das dependências procuradas com --chaves (padrão: 3).')
+    
+    parser.add_argument('--chaves-erro', type=float, metavar="E", default=0.01,
+                        help=f'Fração máxima de registros que violam as dependências aproximadas procuradas com --chaves (padrão: 0.01).')
+    
+    parser.add_argument('--relacionamentos', action='store_true',
+                        help=f'Propõe relacionamentos (chave estrangeira -> chave primária) entre as colunas das tabelas, a partir '
+                             f'de assinaturas dos valores das amostras, gravados na planilha "Relacionamentos".')
+    
+    parser.add_argument('--confirmar-relacionamentos', type=int, metavar="N", default=0,
+                        help=f'Confirma no SGBD os N relacionamentos mais prováveis, contando os valores sem correspondente '
+                             f'na coluna referenciada (padrão: 0).')
+    
+    parser.add_argument('--nomes', type=str, metavar="ARQUIVO", required=False,
+                        help=f'Lista de nomes usada na métrica "prenome": texto (um nome por linha), CSV (coluna "nome") ou '
+                             f'JSON da API de nomes do IBGE (padrão: nomes mais comuns do Censo 2010).')
+    
     parser.add_argument('--output', type=str, metavar="ARQUIVO", default='dicionario.xlsx',
                         help=f'Nome do arquivo de saída.')
     
+    parser.add_argument('--format', type=str, nargs='+', metavar="FORMATO", choices=FORMATOS, default=['xlsx'],
+                        help=f'Formatos de saída: {list(FORMATOS)} (padrão: xlsx). Os formatos parquet, arrow e csv '
+                             f'geram um arquivo por planilha (<ARQUIVO>_<planilha>.<formato>), gravado à medida que as tabelas são concluídas.')
+    
+    parser.add_argument('--desempenho', action='store_true',
+                        help=f'Registra o tempo de cada etapa, tabela, função de análise e consulta SQL na planilha "Desempenho".')
+    
+    parser.add_argument('--trace', type=str, metavar="ARQUIVO", required=False,
+                        help=f'Grava o tempo de cada etapa em um arquivo JSON (opcional).')
+    
+    parser.add_argument('--otlp', type=str, metavar="ARQUIVO", required=False,
+                        help=f'Grava o tempo de cada etapa como spans do OpenTelemetry, no formato OTLP/JSON (opcional).')
+    
     args = parser.parse_args()
 
+    if args.validacao_local and (args.chunksize or args.full_scan or args.pushdown):
+        parser.error("--validacao-local requer que as amostras sejam lidas de uma só vez (sem --chunksize, --full-scan ou --pushdown).")
+
+    if args.chaves and (args.chunksize or args.full_scan or args.pushdown):
+        parser.error("--chaves requer que as amostras sejam lidas de uma só vez (sem --chunksize, --full-scan ou --pushdown).")
+
+    if args.chaves and not (args.chaves_max_colunas > 0 and 0 <= args.chaves_erro < 1):
+        parser.error("--chaves requer --chaves-max-colunas positivo e --chaves-erro entre 0 e 1.")
+
+    if args.relacionamentos and (args.chunksize or args.full_scan or args.pushdown):
+        parser.error("--relacionamentos requer que as amostras sejam lidas de uma só vez (sem --chunksize, --full-scan ou --pushdown).")
+
+    if args.confirmar_relacionamentos < 0 or (args.confirmar_relacionamentos and not args.relacionamentos):
+        parser.error("--confirmar-relacionamentos requer --relacionamentos e N não negativo.")
+
+    if args.sampling and (args.full_scan or args.pushdown):
+        parser.error("--sampling não pode ser combinado com --full-scan ou --pushdown, que leem todos os registros.")
+
+    if args.sampling == 'stratified' and not args.estrato:
+        parser.error("--sampling stratified requer --estrato.")
+
+    if args.stats_only and (args.where or args.validacao_local):
+        parser.error("--stats-only não pode ser combinado com --where ou --validacao-local: as estatísticas descrevem as tabelas inteiras e não há amostras.")
+
+    if args.adaptativa and (args.chunksize or args.full_scan or args.pushdown):
+        parser.error("--adaptativa não pode ser combinado com --chunksize, --full-scan ou --pushdown.")
+
+    if args.adaptativa and not (0 < args.confianca < 1 and args.precisao > 0 and 0 < args.amostra_inicial):
+        parser.error("--adaptativa requer --confianca entre 0 e 1, --precisao e --amostra-inicial positivas.")
+
+    if args.processos and (args.chunksize or args.full_scan or args.pushdown or args.adaptativa):
+        parser.error("--processos requer que as amostras sejam lidas de uma só vez (sem --chunksize, --full-scan, --pushdown ou --adaptativa).")
+
+    if (args.timeout_sql is not None and args.timeout_sql <= 0) or (args.tempo_tabela is not None and args.tempo_tabela <= 0):
+        parser.error("--timeout-sql e --tempo-tabela devem ser positivos.")
+
+    if args.resume and not args.checkpoint:
+        args.checkpoint = ARQUIVO_CHECKPOINT_PADRAO
+
+    if args.resume and not os.path.exists(args.checkpoint):
+        parser.error(f"--resume: checkpoint {args.checkpoint} não encontrado.")
+
     # Verifica se o ambiente passado existe
     if args.ambiente not in id_ambientes:
         print(f"O ambiente {args.ambiente} não foi encontrado.")
@@ -83,36 +248,152 @@ def main():
     parametros_ambientes = carregar_parametros_ambientes()
     args = tratar_argumentos(id_ambientes=parametros_ambientes.keys())
     
+    cache = Cache(args.cache, ttl=args.cache_ttl, refresh=args.refresh) if args.cache else None
+    saida = Saida(args.output, args.format)
+
+    if args.nomes:
+        nomes.carregar_nomes(args.nomes)
+
+    if args.desempenho or args.trace or args.otlp:
+        desempenho.rastreador.ativar()
+
     ambiente = Ambiente(ambiente=parametros_ambientes[args.ambiente], 
                         usuario=args.usuario, 
                         database=args.database, 
                         schema=args.schema,
                         tabelas=args.tables,
-                        filtro=args.where)
+                        filtro=args.where,
+                        conexoes=args.workers,
+                        nome=args.ambiente,
+                        cache=cache,
+                        amostragem=args.sampling,
+                        estrato=args.estrato,
+                        timeout_sql=args.timeout_sql)
     
     df_colunas = ambiente.obter_colunas()
-    df_tabelas = ambiente.obter_tabelas()
+    with desempenho.span('obter_tabelas'):
+        df_tabelas = ambiente.obter_tabelas()
 
     if len(df_colunas) == 0 or len(df_tabelas) == 0:
         print("FATAL: Nenhuma tabela/coluna encontrada. Execute o programa novamente com filtros diferentes.")
         exit(1)
 
-    df_colunas_sample = analise_colunas_sample(ambiente, sample_size=args.amostra, filtro=args.where)
-    df_colunas_validacao = analise_colunas_sql(ambiente, df_colunas_sample, filtro=args.where)
+    saida.escrever("Tabelas", df_tabelas)
+
+    # As validações podem ser executadas no banco de origem ou sobre as amostras, em um banco local
+    ambiente_validacao = AmbienteLocal(ambiente) if args.validacao_local else ambiente
+    consumidores_amostra = [ambiente_validacao] if args.validacao_local else []
+
+    descobridor_chaves = None
+    if args.chaves:
+        descobridor_chaves = DescobridorChaves(args.chaves_max_colunas, args.chaves_erro,
+                                               ao_concluir_tabela=partial(saida.escrever, "Chaves"))
+        consumidores_amostra.append(descobridor_chaves)
+
+    descobridor_relacionamentos = None
+    if args.relacionamentos:
+        descobridor_relacionamentos = DescobridorRelacionamentos(df_colunas, df_tabelas)
+        consumidores_amostra.append(descobridor_relacionamentos)
+
+    adaptativa = None
+    if args.adaptativa:
+        adaptativa = dict(amostra_inicial=args.amostra_inicial, precisao=args.precisao, confianca=args.confianca)
+
+    checkpoint = None
+    if args.checkpoint:
+        # Parâmetros que alteram os resultados: o checkpoint só é retomado por uma execução com os mesmos valores
+        parametros = {k: getattr(args, k) for k in ('ambiente', 'database', 'schema', 'tables', 'where', 'amostra', 
+                                                    'sampling', 'estrato', 'chunksize', 'full_scan', 'erro_unique',
+                                                    'erro_percentis', 'pushdown', 'stats_only', 'validacao_local', 'nomes',
+                                                    'timeout_sql', 'tempo_tabela', 'chaves', 'chaves_max_colunas',
+                                                    'chaves_erro', 'relacionamentos')}
+        parametros['adaptativa'] = adaptativa
+        parametros['validacoes'] = carregar_validacoes()[1]
+        try:
+            checkpoint = Checkpoint(args.checkpoint, parametros, resume=args.resume)
+        except ValueError as e:
+            print(f"FATAL: {e} Execute sem --resume para reiniciar o checkpoint.")
+            exit(1)
+        if args.resume:
+            print(f"Retomando o checkpoint {args.checkpoint}: {checkpoint.tabelas_concluidas()} tabelas concluídas")
+
+    try:
+        with desempenho.span('analise_colunas_sample'):
+            df_colunas_sample = analise_colunas_sample(ambiente, sample_size=args.amostra, filtro=args.where, workers=args.workers,
+                                                       chunksize=args.chunksize, full_scan=args.full_scan,
+                                                       erro_unique=args.erro_unique, erro_percentis=args.erro_percentis,
+                                                       pushdown=args.pushdown, cache=cache,
+                                                       consumidores_amostra=consumidores_amostra, analisadores=args.analisadores,
+                                                       processos=args.processos, estatisticas=args.stats_only, adaptativa=adaptativa,
+                                                       checkpoint=checkpoint, tempo_tabela=args.tempo_tabela,
+                                                       ao_concluir_tabela=partial(saida.escrever, "Colunas"))
+
+        df_relacionamentos = None
+        if descobridor_relacionamentos is not None:
+            df_relacionamentos = descobridor_relacionamentos.relacionamentos()
+            if args.confirmar_relacionamentos:
+                with desempenho.span('confirmar_relacionamentos'):
+                    df_relacionamentos = confirmar_relacionamentos(ambiente, df_relacionamentos,
+                                                                          args.confirmar_relacionamentos)
+            saida.escrever("Relacionamentos", df_relacionamentos)
+
+        if args.validacao_local:
+            _, scripts = carregar_validacoes()
+            ambiente_validacao.copiar_tabelas_auxiliares(scripts.values())
+
+        with desempenho.span('analise_colunas_sql'):
+            df_colunas_validacao = analise_colunas_sql(ambiente_validacao, df_colunas_sample, filtro=args.where, cache=cache,
+                                                       ao_concluir_tabela=partial(saida.escrever, "Validacao"),
+                                                       checkpoint=checkpoint, tempo_tabela=args.tempo_tabela)
+
+        if 'xlsx' in args.format:
+            with desempenho.span('gerar_xlsx'):
+                gerar_xlsx(args.output, df_tabelas, df_colunas_sample, df_colunas_validacao,
+                           desempenho.rastreador.dataframe() if args.desempenho else None,
+                           descobridor_chaves.dataframe() if descobridor_chaves is not None else None,
+                           df_relacionamentos)
+
+        if args.desempenho:
+            saida.escrever("Desempenho", desempenho.rastreador.dataframe())
+    except BaseException:
+        if checkpoint is not None:
+            print(f"Execução interrompida. As tabelas concluídas foram gravadas em {checkpoint.arquivo}; "
+                  f"execute novamente com --resume para continuar.")
+        raise
+    finally:
+        if args.validacao_local:
+            ambiente_validacao.fechar()
+        saida.fechar()
+
+        if args.trace:
+            desempenho.rastreador.salvar_json(args.trace)
+            print(f"Arquivo {args.trace} gravado")
+        if args.otlp:
+            desempenho.rastreador.salvar_otlp(args.otlp)
+            print(f"Arquivo {args.otlp} gravado")
+
 
+def gerar_xlsx(arquivo, df_tabelas, df_colunas_sample, df_colunas_validacao, df_desempenho=None, df_chaves=None,
+               df_relacionamentos=None):
     if len(df_colunas_validacao) > 0:
         df_colunas_validacao_1 = df_colunas_validacao[df_colunas_validacao['num_columns'] == 1]
         df_colunas_validacao_1 = df_colunas_validacao_1.pivot(index=('database_name', 'schema_name', 'table_name', 'columns'), columns='script', values='result').reset_index()
         df_colunas_sample = df_colunas_sample.merge(df_colunas_validacao_1.rename(columns={'columns': 'column_name'}), on=('database_name', 'schema_name', 'table_name', 'column_name'), how='outer')
 
-    print(f"Gerando arquivo {args.output}")
+    print(f"Gerando arquivo {arquivo}")
     
-    with pd.ExcelWriter(args.output, engine="xlsxwriter") as writer:
+    with pd.ExcelWriter(arquivo, engine="xlsxwriter") as writer:
         # Salvando Planilhas
         df_tabelas.to_excel(writer, sheet_name="Tabelas", index=False)
         #df_colunas.to_excel(writer, sheet_name="Colunas", index=False)
         df_colunas_sample.to_excel(writer, sheet_name="Colunas", index=False)
         df_colunas_validacao.to_excel(writer, sheet_name="Validacao", index=False)
+        if df_chaves is not None:
+            df_chaves.to_excel(writer, sheet_name="Chaves", index=False)
+        if df_relacionamentos is not None:
+            df_relacionamentos.to_excel(writer, sheet_name="Relacionamentos", index=False)
+        if df_desempenho is not None:
+            df_desempenho.to_excel(writer, sheet_name="Desempenho", index=False)
 
 
 if __name__ == '__main__':
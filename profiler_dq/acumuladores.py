@@ -0,0 +1,575 @@
+"""
+Acumuladores das métricas de análise de colunas.
+
+Um acumulador recebe a amostra de uma coluna em blocos (atualizar), pode ser combinado com outro
+acumulador da mesma coluna (combinar) e, ao final, produz o mesmo resultado da função de análise
+correspondente (resultado). A memória utilizada independe do número de registros processados, exceto
+pelos hashes de 64 bits mantidos para contar valores e registros distintos, que crescem com o número de distintos
+até LIMITE_HASHES por tabela (acima dele, a contagem passa a ser estimada por HyperLogLog, ver ConjuntoHashes).
+As versões baseadas em sketches (HyperLogLog e KLL) usam memória constante, com resultados aproximados.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from . import data_types
+from .sketches import HyperLogLog, KLL
+
+
+# Número máximo de valores mantidos no reservatório usado no cálculo dos percentis
+TAMANHO_RESERVATORIO = 10000
+
+# Número máximo de valores distintos mantidos na contagem de frequências usada no cálculo da moda
+LIMITE_MODA = 10000
+
+# Número máximo de hashes distintos mantidos na contagem exata de valores e registros distintos de uma tabela,
+# somadas todas as colunas (8 bytes cada)
+LIMITE_HASHES = 2_000_000
+
+
+def normalizar_valores(s, tipo=None):
+    """
+    Valores não nulos da Series, normalizados conforme o tipo da coluna para que não dependam do dtype do bloco
+    em que foram lidos (um bloco com nulos é float64, e 5 e 5.0 devem coincidir): números como float e demais
+    tipos como texto.
+    """
+    s = s.dropna()
+    if tipo in (data_types.NUMERIC, data_types.FLOAT):
+        numeros = pd.to_numeric(s, errors='coerce')
+        if numeros.notnull().all():
+            return numeros.to_numpy(dtype=float)
+    return s.astype(str).to_numpy(dtype=object)
+
+
+def hash_valores(s, tipo=None):
+    """
+    Calcula o hash de 64 bits de cada valor não nulo da Series, normalizado conforme o tipo (ver normalizar_valores).
+    """
+    valores = normalizar_valores(s, tipo)
+    if len(valores) == 0:
+        return np.empty(0, dtype=np.uint64)
+    return pd.util.hash_array(valores)
+
+
+def hash_registros(df, tipos=None):
+    """
+    Calcula o hash de 64 bits de cada registro (linha) do DataFrame, a partir dos hashes dos valores normalizados
+    de cada coluna (ver hash_valores). Os nulos têm o hash 0.
+
+    :param tipos: Dicionário coluna -> tipo (data_types).
+    """
+    tipos = tipos or {}
+    colunas = {}
+    for c in df.columns:
+        h = np.zeros(len(df), dtype=np.uint64)
+        h[df[c].notnull().to_numpy()] = hash_valores(df[c], tipos.get(c))
+        colunas[c] = h
+    return pd.util.hash_pandas_object(pd.DataFrame(colunas), index=False).to_numpy()
+
+
+class OrcamentoHashes:
+    """
+    Limite de hashes compartilhado pelos conjuntos de hashes (ConjuntoHashes) de uma tabela.
+
+    :param limite: Número máximo de hashes mantidos, somados todos os conjuntos.
+    """
+    def __init__(self, limite=LIMITE_HASHES):
+        self.limite = limite
+        self.usado = 0
+        self._lock = threading.Lock()
+
+    def reservar(self, n):
+        """
+        :return: True se os n hashes couberem no limite (e são reservados), False caso contrário.
+        """
+        with self._lock:
+            if self.usado + n > self.limite:
+                return False
+            self.usado += n
+            return True
+
+    def liberar(self, n):
+        with self._lock:
+            self.usado -= n
+
+
+class ConjuntoHashes:
+    """
+    Conjunto de hashes de 64 bits para a contagem exata de distintos. Os hashes distintos de cada bloco são
+    guardados e unidos (np.unique) apenas quando não cabem no orçamento, e no resultado, evitando reordenar o
+    conjunto inteiro a cada bloco. Se mesmo após a união os hashes não couberem no orçamento, a contagem passa a
+    ser estimada por um HyperLogLog (exato passa a ser False) e os hashes são liberados.
+
+    :param limite: Número máximo de hashes distintos mantidos, se o orçamento não for informado.
+    :param erro: Erro relativo padrão do HyperLogLog usado acima do limite.
+    :param orcamento: Orçamento (OrcamentoHashes) compartilhado com os demais conjuntos da tabela.
+    """
+    def __init__(self, limite=LIMITE_HASHES, erro=0.01, orcamento=None):
+        self.orcamento = orcamento or OrcamentoHashes(limite)
+        self.erro = erro
+        self.blocos = []
+        self.tamanho = 0
+        self.hll = None
+
+    @property
+    def exato(self):
+        return self.hll is None
+
+    def adicionar(self, hashes):
+        if self.hll is not None:
+            self.hll.adicionar_hashes(hashes)
+            return
+        if len(hashes) == 0:
+            return
+        bloco = np.unique(hashes)
+        if not self.orcamento.reservar(len(bloco)):
+            # Remove os hashes repetidos entre os blocos já guardados antes de desistir da contagem exata
+            bloco = self._unir(bloco)
+            if not self.orcamento.reservar(len(bloco)):
+                print(f'WARNING: Mais de {self.orcamento.limite} valores distintos na tabela; '
+                      f'a contagem de distintos passa a ser estimada.')
+                self._estimar()
+                self.hll.adicionar_hashes(bloco)
+                return
+        self.blocos.append(bloco)
+        self.tamanho += len(bloco)
+
+    def _unir(self, bloco=None):
+        """
+        Une os blocos guardados. Se informado, os hashes de bloco já guardados são removidos de bloco.
+        """
+        if len(self.blocos) > 1:
+            unidos = np.unique(np.concatenate(self.blocos))
+            self.orcamento.liberar(self.tamanho - len(unidos))
+            self.blocos = [unidos]
+            self.tamanho = len(unidos)
+        if bloco is not None and self.blocos:
+            return np.setdiff1d(bloco, self.blocos[0], assume_unique=True)
+        return bloco
+
+    def _estimar(self):
+        self.hll = HyperLogLog(self.erro)
+        for b in self.blocos:
+            self.hll.adicionar_hashes(b)
+        self.orcamento.liberar(self.tamanho)
+        self.blocos = []
+        self.tamanho = 0
+
+    def combinar(self, outro):
+        if outro.hll is None:
+            for b in outro.blocos:
+                self.adicionar(b)
+            return
+        if self.hll is None:
+            self._estimar()
+        self.hll.combinar(outro.hll)
+
+    def contagem(self):
+        """
+        Número de hashes distintos (estimado, se exato for False).
+        """
+        if self.hll is not None:
+            return int(round(self.hll.estimativa()))
+        self._unir()
+        return self.tamanho
+
+
+class Acumulador:
+    """
+    :param nome_coluna: Nome da coluna analisada.
+    :param tipo_coluna: Tipo da coluna (data_types).
+    :param funcao: Função de análise à qual o acumulador corresponde.
+    """
+    # Métrica indicada como estimada quando o resultado não é exato (ver exato)
+    ESTIMADA = None
+
+    def __init__(self, nome_coluna, tipo_coluna, funcao):
+        self.nome_coluna = nome_coluna
+        self.tipo_coluna = tipo_coluna
+        self.funcao = funcao
+
+    @property
+    def exato(self):
+        """
+        False se o resultado (a métrica ESTIMADA) é estimado.
+        """
+        return True
+
+    def atualizar(self, s):
+        raise NotImplementedError()
+
+    def combinar(self, outro):
+        raise NotImplementedError()
+
+    def resultado(self):
+        raise NotImplementedError()
+
+
+class AcumuladorUnicidade(Acumulador):
+    """
+    Acumula o número de registros, de valores nulos e os hashes dos valores distintos. Se os hashes não couberem
+    no orçamento, a contagem passa a ser estimada e a coluna não é indicada como chave candidata.
+
+    :param orcamento: Orçamento de hashes (OrcamentoHashes) compartilhado pelas colunas da tabela. Por padrão,
+                      LIMITE_HASHES hashes apenas para a coluna.
+    """
+    ESTIMADA = 'unique'
+
+    def __init__(self, nome_coluna, tipo_coluna, funcao, orcamento=None):
+        super().__init__(nome_coluna, tipo_coluna, funcao)
+        self.n = 0
+        self.n_missing = 0
+        self.hashes = ConjuntoHashes(orcamento=orcamento)
+
+    @property
+    def exato(self):
+        return self.hashes.exato
+
+    def atualizar(self, s):
+        self.n += len(s)
+        self.n_missing += int(s.isnull().sum())
+        self.hashes.adicionar(hash_valores(s, self.tipo_coluna))
+
+    def combinar(self, outro):
+        self.n += outro.n
+        self.n_missing += outro.n_missing
+        self.hashes.combinar(outro.hashes)
+
+    def n_unique(self):
+        return min(self.hashes.contagem(), self.n - self.n_missing)
+
+    def resultado(self):
+        l = self.n
+        if l == 0: return (None, None, None)
+        n_nunique = self.n_unique()
+        is_chave = (n_nunique == l - self.n_missing) and (n_nunique > 0) and self.hashes.exato
+
+        return (self.n_missing/l, n_nunique/l, ('-', 'SIM')[int(is_chave)])
+
+
+class AcumuladorExtremos(Acumulador):
+    """
+    Acumula o mínimo e o máximo exatos dos valores não nulos.
+    """
+    def __init__(self, nome_coluna, tipo_coluna, funcao):
+        super().__init__(nome_coluna, tipo_coluna, funcao)
+        self.min = None
+        self.max = None
+
+    def _atualizar_extremos(self, minimo, maximo):
+        try:
+            self.min = minimo if self.min is None else min(self.min, minimo)
+            self.max = maximo if self.max is None else max(self.max, maximo)
+        except TypeError:
+            # Tipos não comparáveis entre blocos
+            pass
+
+
+class AcumuladorPercentis(AcumuladorExtremos):
+    """
+    Acumula, além do mínimo e do máximo exatos, um reservatório de tamanho fixo com uma amostra uniforme dos valores
+    não nulos, a partir do qual são calculados os percentis. Se todos os valores couberem no reservatório,
+    os percentis são exatos.
+
+    A amostra uniforme é obtida atribuindo uma chave aleatória a cada valor e mantendo os valores de menores
+    chaves, o que permite combinar reservatórios de blocos diferentes.
+    """
+    QUANTIS = [0.01, 0.25, 0.5, 0.75, 0.99]
+    ESTIMADA = 'P01-P99'
+
+    def __init__(self, nome_coluna, tipo_coluna, funcao, tamanho=TAMANHO_RESERVATORIO, seed=None):
+        super().__init__(nome_coluna, tipo_coluna, funcao)
+        self.tamanho = tamanho
+        self.rng = np.random.default_rng(seed)
+        self.chaves = np.empty(0)
+        self.valores = None
+        self.descartou = False
+
+    @property
+    def exato(self):
+        return not self.descartou
+
+    def _reduzir(self, chaves, valores):
+        if len(chaves) > self.tamanho:
+            self.descartou = True
+            manter = np.argpartition(chaves, self.tamanho)[:self.tamanho]
+            chaves, valores = chaves[manter], valores.iloc[manter]
+        self.chaves = chaves
+        self.valores = valores.reset_index(drop=True)
+
+    def atualizar(self, s):
+        # Converte StringDtype (PyArrow-backed) para object, se necessário
+        if isinstance(s.dtype, pd.StringDtype):
+            s = s.astype('object')
+
+        s = s.dropna()
+        if len(s) == 0:
+            return
+
+        self._atualizar_extremos(s.min(), s.max())
+
+        chaves = self.rng.random(len(s))
+        if self.valores is not None:
+            chaves = np.concatenate([self.chaves, chaves])
+            s = pd.concat([self.valores, s], ignore_index=True)
+        self._reduzir(chaves, s)
+
+    def combinar(self, outro):
+        if outro.valores is None:
+            return
+        self.descartou = self.descartou or outro.descartou
+        self._atualizar_extremos(outro.min, outro.max)
+        if self.valores is None:
+            self._reduzir(outro.chaves, outro.valores)
+        else:
+            self._reduzir(np.concatenate([self.chaves, outro.chaves]),
+                          pd.concat([self.valores, outro.valores], ignore_index=True))
+
+    def resultado(self):
+        if self.valores is None:
+            return [None]*(len(self.QUANTIS) + 2)
+
+        p = self.valores.quantile(self.QUANTIS, interpolation='nearest')
+        return [self.min] + p.tolist() + [self.max]
+
+
+class AcumuladorModa(Acumulador):
+    """
+    Acumula a frequência dos valores não nulos em um resumo de Misra-Gries com até LIMITE_MODA valores: quando o
+    número de valores distintos ultrapassa o limite, a (limite+1)-ésima maior frequência é descontada de todos os
+    valores, e os que ficam com frequência negativa são descartados. A frequência mantida de cada valor é subestimada em no máximo
+    descontado, de modo que um valor frequente em todos os blocos não é descartado por não estar entre os mais
+    frequentes de cada bloco. A moda é exata se a sua frequência superar a dos demais valores em mais que
+    descontado (ver exato).
+    """
+    ESTIMADA = 'moda'
+
+    def __init__(self, nome_coluna, tipo_coluna, funcao, limite=LIMITE_MODA):
+        super().__init__(nome_coluna, tipo_coluna, funcao)
+        self.limite = limite
+        self.n = 0
+        self.descontado = 0
+        self.frequencias = pd.Series(dtype='int64')
+
+    def _somar(self, frequencias):
+        f = self.frequencias.add(frequencias, fill_value=0) if len(self.frequencias) else frequencias
+        if len(f) > self.limite:
+            limiar = f.nlargest(self.limite + 1).iloc[-1]
+            # Os valores empatados no limiar são mantidos com frequência 0 (até o limite), para que a moda de
+            # colunas com valores pouco repetidos não fique vazia
+            f = (f[f >= limiar] - limiar).nlargest(self.limite)
+            self.descontado += limiar
+        self.frequencias = f
+
+    def atualizar(self, s):
+        self.n += len(s)
+        self._somar(s.value_counts(dropna=True))
+
+    def combinar(self, outro):
+        # O erro dos resumos combinados é a soma dos erros de cada resumo
+        self.n += outro.n
+        self.descontado += outro.descontado
+        self._somar(outro.frequencias)
+
+    @property
+    def exato(self):
+        """
+        True se a moda é exata, apesar dos valores descartados.
+        """
+        if self.descontado == 0:
+            return True
+        maiores = self.frequencias.nlargest(2).tolist() + [0, 0]
+        return maiores[0] > maiores[1] + self.descontado
+
+    def resultado(self):
+        if self.n == 0: return None
+
+        f = self.frequencias
+        if len(f) == 0:
+            return (None,)
+
+        # Assim como Series.mode, em caso de empate retorna o menor valor
+        modas = f[f == f.max()].index
+        try:
+            return (sorted(modas)[0],)
+        except TypeError:
+            return (modas[0],)
+
+
+class AcumuladorProporcao(Acumulador):
+    """
+    Acumula métricas que são proporções (contagem/denominador), aplicando a função de análise a cada bloco
+    e ponderando o resultado pelo denominador do bloco.
+
+    A função de análise deve retornar uma tupla de proporções ou None.
+
+    :param ignora_nulos: Se True, o denominador é o número de valores não nulos. Caso contrário, o número de registros.
+    """
+    def __init__(self, nome_coluna, tipo_coluna, funcao, ignora_nulos=False):
+        super().__init__(nome_coluna, tipo_coluna, funcao)
+        self.ignora_nulos = ignora_nulos
+        self.contagens = None
+        self.denominador = 0
+
+    def _somar(self, contagens, denominador):
+        if contagens is None:
+            return
+        if self.contagens is None:
+            self.contagens = np.zeros(len(contagens))
+        self.contagens += contagens
+        self.denominador += denominador
+
+    def atualizar(self, s):
+        x = self.funcao(self.nome_coluna, self.tipo_coluna, s)
+        if x is None:
+            return
+
+        l = len(s) - int(s.isnull().sum()) if self.ignora_nulos else len(s)
+        self._somar(np.array(x, dtype=float) * l, l)
+
+    def combinar(self, outro):
+        self._somar(outro.contagens, outro.denominador)
+
+    def resultado(self):
+        if self.contagens is None or self.denominador == 0:
+            return None
+        return tuple(self.contagens / self.denominador)
+
+
+class AcumuladorRegistrosDistintos:
+    """
+    Acumula os hashes dos registros (linhas) distintos da amostra.
+
+    :param tipos: Dicionário coluna -> tipo (data_types), usado na normalização dos valores (ver hash_registros).
+    :param orcamento: Orçamento de hashes (OrcamentoHashes) compartilhado com as colunas da tabela.
+    """
+    def __init__(self, tipos=None, orcamento=None):
+        self.tipos = tipos
+        self.n = 0
+        self.hashes = ConjuntoHashes(orcamento=orcamento)
+
+    @property
+    def exato(self):
+        return self.hashes.exato
+
+    def atualizar(self, df):
+        self.n += len(df)
+        if len(df):
+            self.hashes.adicionar(hash_registros(df, self.tipos))
+
+    def combinar(self, outro):
+        self.n += outro.n
+        self.hashes.combinar(outro.hashes)
+
+    def resultado(self):
+        return min(self.hashes.contagem(), self.n)
+
+
+class AcumuladorUnicidadeHLL(AcumuladorUnicidade):
+    """
+    Acumula o número de valores distintos de forma aproximada, com um HyperLogLog de memória constante.
+    A coluna é considerada chave candidata se a estimativa de distintos for compatível, dentro de três
+    erros padrão, com o número de valores não nulos. A indicação é apenas uma estimativa, que deve ser
+    confirmada por uma contagem exata (ver info_colunas.confirmar_chaves_estimadas).
+
+    :param erro: Erro relativo padrão da estimativa de distintos.
+    """
+    def __init__(self, nome_coluna, tipo_coluna, funcao, erro=0.01):
+        super().__init__(nome_coluna, tipo_coluna, funcao)
+        self.hll = HyperLogLog(erro)
+        self.erro = self.hll.erro
+
+    @property
+    def exato(self):
+        return False
+
+    def atualizar(self, s):
+        self.n += len(s)
+        self.n_missing += int(s.isnull().sum())
+        self.hll.adicionar_hashes(hash_valores(s, self.tipo_coluna))
+
+    def combinar(self, outro):
+        self.n += outro.n
+        self.n_missing += outro.n_missing
+        self.hll.combinar(outro.hll)
+
+    def n_unique(self):
+        return min(int(round(self.hll.estimativa())), self.n - self.n_missing)
+
+    def resultado(self):
+        l = self.n
+        if l == 0: return (None, None, None)
+        n_validos = l - self.n_missing
+        n_nunique = self.n_unique()
+        is_chave = (n_nunique >= (1 - 3*self.erro) * n_validos) and (n_nunique > 0)
+
+        return (self.n_missing/l, n_nunique/l, ('-', 'SIM')[int(is_chave)])
+
+
+class AcumuladorPercentisKLL(AcumuladorExtremos):
+    """
+    Acumula, além do mínimo e do máximo exatos, um sketch KLL de memória constante para a estimativa dos percentis.
+
+    :param erro: Erro de rank (normalizado) das estimativas dos percentis.
+    """
+    QUANTIS = AcumuladorPercentis.QUANTIS
+    ESTIMADA = AcumuladorPercentis.ESTIMADA
+
+    def __init__(self, nome_coluna, tipo_coluna, funcao, erro=0.01):
+        super().__init__(nome_coluna, tipo_coluna, funcao)
+        self.kll = KLL(erro)
+        self.erro = self.kll.erro
+
+    @property
+    def exato(self):
+        return False
+
+    def atualizar(self, s):
+        if isinstance(s.dtype, pd.StringDtype):
+            s = s.astype('object')
+
+        s = s.dropna()
+        if len(s) == 0:
+            return
+
+        self._atualizar_extremos(s.min(), s.max())
+        self.kll.adicionar(s.to_numpy())
+
+    def combinar(self, outro):
+        if outro.kll.n == 0:
+            return
+        self._atualizar_extremos(outro.min, outro.max)
+        self.kll.combinar(outro.kll)
+
+    def resultado(self):
+        if self.kll.n == 0:
+            return [None]*(len(self.QUANTIS) + 2)
+
+        return [self.min] + self.kll.quantis(self.QUANTIS) + [self.max]
+
+
+class AcumuladorRegistrosDistintosHLL(AcumuladorRegistrosDistintos):
+    """
+    Estima o número de registros (linhas) distintos com um HyperLogLog de memória constante.
+    """
+    def __init__(self, erro=0.01, tipos=None):
+        self.tipos = tipos
+        self.n = 0
+        self.hll = HyperLogLog(erro)
+
+    @property
+    def exato(self):
+        return False
+
+    def atualizar(self, df):
+        self.n += len(df)
+        if len(df):
+            self.hll.adicionar_hashes(hash_registros(df, self.tipos))
+
+    def combinar(self, outro):
+        self.n += outro.n
+        self.hll.combinar(outro.hll)
+
+    def resultado(self):
+        return min(int(round(self.hll.estimativa())), self.n)
@@ -1,11 +1,32 @@
 import sqlalchemy
+import numpy as np
 import pandas as pd
 import getpass
+import os
+import re
+import tempfile
+import threading
+import time
 
+from contextlib import contextmanager
+from decimal import Decimal
+
+from . import compactacao
+from . import desempenho
 import profiler_dq.flavors.mssql
 import profiler_dq.flavors.oracle
 import profiler_dq.flavors.sqlite
 
+# Estratégias de amostragem (ver amostragem nos flavors):
+# - random: registros sorteados individualmente;
+# - block: blocos/páginas contíguos da tabela (mais rápida, mas registros de um mesmo bloco tendem a ser correlacionados);
+# - rowid: sorteio de identificadores físicos dos registros, buscados diretamente;
+# - stratified: amostra proporcional a cada valor da coluna de estrato, com ao menos um registro de cada valor;
+# - first-n: primeiros registros retornados pelo SGBD (não aleatória).
+# Estratégias não suportadas pelo flavor usam a amostragem reservoir sobre a leitura completa da tabela.
+ESTRATEGIAS_AMOSTRAGEM = ('random', 'block', 'rowid', 'stratified', 'first-n')
+
+
 def carregar_flavor(flavor_name):
     """
     Carrega o módulo de flavor correspondente ao nome passado como argumento.
@@ -22,7 +43,20 @@ def carregar_flavor(flavor_name):
 
 
 class Ambiente:
-    def __init__(self, ambiente, usuario=None, senha=None, database=None, schema=None, tabelas=None, filtro=None):
+    # Número máximo de tabelas contadas em uma mesma consulta
+    TAMANHO_LOTE_CONTAGEM = 100
+
+    # Número máximo de subconsultas escalares agrupadas em uma mesma consulta
+    TAMANHO_LOTE_ESCALARES = 100
+
+    # Número máximo de tabelas nos filtros das consultas ao catálogo (o Oracle limita as listas do IN a 1000 itens)
+    TAMANHO_LOTE_CATALOGO = 1000
+
+    # Número de registros lidos por vez na amostragem reservoir
+    CHUNKSIZE_RESERVATORIO = 100000
+
+    def __init__(self, ambiente, usuario=None, senha=None, database=None, schema=None, tabelas=None, filtro=None, conexoes=1,
+                 nome=None, cache=None, amostragem=None, estrato=None, timeout_sql=None):
 
         # Verifica se a url do ambiente contém os campos de usuário e senha. 
         # Se sim, solicita os valores caso já não tenham sido passados como argumento
@@ -41,8 +75,10 @@ class Ambiente:
         else:
             connect_args = {}
 
-        # Criando a engine de conexão com o banco
-        engine = sqlalchemy.create_engine(url, connect_args=connect_args)
+        # Criando a engine de conexão com o banco. O pool é limitado ao número de conexões
+        # simultâneas desejadas, para que o processamento paralelo não sobrecarregue o SGBD.
+        engine = sqlalchemy.create_engine(url, connect_args=connect_args,
+                                          pool_size=max(1, conexoes), max_overflow=0)
 
         # Identifica qual é o SGBD/flavor do ambiente a partir do engine
         flavor = carregar_flavor(engine.dialect.name)
@@ -60,16 +96,27 @@ class Ambiente:
         self._filtro = filtro
         self._df_colunas = None
         self._df_tabelas = None
+        self._estatisticas_colunas = None
         self._flavor = flavor
+        self._conexoes = max(1, conexoes)
+        self._nome = nome or ambiente['url']
+        self._cache = cache
+        self._amostragem = amostragem
+        self._estrato = estrato
+        self._timeout_sql = timeout_sql
+        # Prazo da tabela em processamento em cada thread (ver prazo)
+        self._local = threading.local()
 
     def obter_colunas(self):
         if self._df_colunas is None:
             map_types = self._flavor.MAP_TYPES
-            sql = self._flavor.lista_colunas(database=self._database, schema=self._schema)
 
             print("Obtendo lista de colunas")
-            print(sql)
-            df = pd.read_sql(sql, self._engine)
+            with desempenho.span('obter_colunas'):
+                if self._cache is not None and hasattr(self._flavor, 'versoes_tabelas'):
+                    df = self._obter_colunas_cache()
+                else:
+                    df = self._consultar_catalogo(self._flavor.lista_colunas, self._tabelas)
 
             if self._schema:
                 df = df[df.schema_name == self._schema]
@@ -83,6 +130,68 @@ class Ambiente:
 
         return self._df_colunas
         
+    def _consultar_catalogo(self, consulta, tabelas=None):
+        """
+        Executa uma consulta ao catálogo do SGBD (ex.: lista_colunas do flavor). O database, o schema e as tabelas
+        são passados como parâmetros da consulta, para que o filtro seja aplicado pelo SGBD. As tabelas são 
+        consultadas em lotes de até TAMANHO_LOTE_CATALOGO nomes.
+
+        :param tabelas: Nomes das tabelas de interesse. Se None, todas as tabelas do database/schema são consultadas.
+        """
+        if tabelas is None:
+            lotes = [None]
+        else:
+            tabelas = list(tabelas)
+            lotes = [tabelas[i:i + self.TAMANHO_LOTE_CATALOGO] for i in range(0, len(tabelas), self.TAMANHO_LOTE_CATALOGO)]
+
+        dfs = []
+        for lote in lotes:
+            sql = consulta(database=self._database, schema=self._schema, tabelas=lote)
+            parametros = {'database': self._database, 'schema': self._schema, 'tabelas': lote}
+            parametros = {k: v for k, v in parametros.items() if f':{k}' in sql}
+
+            texto = sqlalchemy.text(sql)
+            if lote is not None:
+                texto = texto.bindparams(sqlalchemy.bindparam('tabelas', expanding=True))
+
+            print(sql)
+            print(parametros)
+            dfs.append(self._read_sql(texto, parametros))
+
+        return pd.concat(dfs, ignore_index=True) if len(dfs) > 1 else dfs[0]
+
+    def _obter_colunas_cache(self):
+        """
+        Obtém as colunas das tabelas reaproveitando as gravadas no cache. Apenas as tabelas novas ou cuja versão 
+        (data do último DDL, ver versoes_tabelas nos flavors) mudou são lidas do catálogo.
+        """
+        df_versoes = self._consultar_catalogo(self._flavor.versoes_tabelas, self._tabelas)
+        chaves = [self._chave_tabela(d, s, t) for d, s, t in 
+                  zip(df_versoes.database_name, df_versoes.schema_name, df_versoes.table_name)]
+        versoes = dict(zip(chaves, df_versoes.versao.astype(str)))
+        if not chaves:
+            return self._consultar_catalogo(self._flavor.lista_colunas, self._tabelas)
+
+        gravadas = self._cache.obter_catalogo(self._nome, chaves)
+        colunas = {k: df for k, (versao, df) in gravadas.items() if versao == versoes[k]}
+        pendentes = [k for k in chaves if k not in colunas]
+        print(f"Colunas de {len(colunas)} tabelas obtidas do cache. Consultando {len(pendentes)} tabelas no catálogo.")
+
+        if pendentes:
+            df = self._consultar_catalogo(self._flavor.lista_colunas, list(dict.fromkeys(t for _, _, t in pendentes)))
+            df_chaves = [self._chave_tabela(d, s, t) for d, s, t in zip(df.database_name, df.schema_name, df.table_name)]
+            grupos = df.groupby(pd.Series(df_chaves, index=df.index), sort=False).indices
+            vazio = df.iloc[:0]
+
+            novas = []
+            for k in pendentes:
+                colunas[k] = df.iloc[grupos[k]] if k in grupos else vazio
+                novas.append((k, versoes[k], colunas[k]))
+            self._cache.salvar_catalogo(self._nome, novas)
+
+        # Mesma ordem da consulta de versões (database, schema e tabela)
+        return pd.concat([colunas[k] for k in chaves], ignore_index=True)
+
     def obter_tabelas(self, numero_de_registros=True):
         if self._df_tabelas is None:
             df_colunas = self.obter_colunas()
@@ -91,20 +200,259 @@ class Ambiente:
         
         CAMPO_NUM_REGISTROS = 'num_registros'
         if numero_de_registros and CAMPO_NUM_REGISTROS not in self._df_tabelas.columns:
-            num_registros = []
+            df = self._df_tabelas
+            num_registros = pd.Series([None]*len(df), index=df.index, dtype='object')
+            origem = pd.Series([None]*len(df), index=df.index, dtype='object')
+
+            # Sem filtro, o número de registros pode ser obtido das estatísticas do catálogo, sem varrer as tabelas
+            if not self._filtro:
+                estatisticas = self.obter_estatisticas_registros()
+                if estatisticas is not None:
+                    chaves = list(zip(df.database_name, df.schema_name, df.table_name))
+                    encontrados = [estatisticas.get(self._chave_tabela(*k)) for k in chaves]
+                    for x, num in zip(df.index, encontrados):
+                        if num is not None:
+                            num_registros[x] = num
+                            origem[x] = 'estatistica'
+
+            # Contagens exatas de execuções anteriores ainda válidas no cache
+            if self._cache is not None:
+                for x in df.index[num_registros.isnull()]:
+                    num = self._cache.obter_num_registros(self._nome, df.database_name[x], df.schema_name[x], df.table_name[x], self._filtro)
+                    if num is not None:
+                        num_registros[x] = num
+                        origem[x] = 'cache'
+
+            # As tabelas restantes são contadas de forma exata, em lotes
+            pendentes = df.index[num_registros.isnull()]
+            for i in range(0, len(pendentes), self.TAMANHO_LOTE_CONTAGEM):
+                lote = df.loc[pendentes[i:i + self.TAMANHO_LOTE_CONTAGEM]]
+                with desempenho.span('contar_registros', tabelas=len(lote)):
+                    contagens = self.obter_numero_registros_lote(lote)
+                for x, num in zip(lote.index, contagens):
+                    num_registros[x] = num
+                    origem[x] = 'contagem'
+                    if self._cache is not None and num != -1:
+                        self._cache.salvar_num_registros(self._nome, df.database_name[x], df.schema_name[x], df.table_name[x], self._filtro, num)
+
+            self._df_tabelas[CAMPO_NUM_REGISTROS] = num_registros.astype('int64')
+            self._df_tabelas['origem_num_registros'] = origem
+            self._df_tabelas['filtro'] = self._filtro
+        
+        return self._df_tabelas
+
+    @staticmethod
+    def _chave_tabela(database, schema, table):
+        # Normaliza valores nulos/vazios de database e schema para permitir a comparação entre consultas diferentes
+        return tuple(x if isinstance(x, str) and x else None for x in (database, schema)) + (table,)
+
+    def _possui_estatisticas(self):
+        """
+        Verifica se o SGBD possui as estatísticas do catálogo (ver possui_estatisticas nos flavors, ex.: o SQLite
+        só as possui após ANALYZE). Flavors sem essa verificação sempre possuem estatísticas.
+        """
+        if not hasattr(self._flavor, 'possui_estatisticas'):
+            return True
+
+        df = self._consultar_catalogo(self._flavor.possui_estatisticas)
+        if int(df.iloc[0, 0]) == 0:
+            print("Estatísticas do catálogo indisponíveis")
+            return False
+        return True
+
+    def obter_estatisticas_registros(self):
+        """
+        Obtém o número de registros das tabelas a partir das estatísticas do catálogo do SGBD.
+
+        :return: Dicionário (database, schema, tabela) -> número de registros, ou None se as estatísticas 
+                 não estiverem disponíveis.
+        """
+        if not hasattr(self._flavor, 'estatisticas_registros'):
+            return None
+
+        print("Obtendo número de registros das estatísticas do catálogo")
+        try:
+            if not self._possui_estatisticas():
+                return None
+            df = self._consultar_catalogo(self._flavor.estatisticas_registros, self._tabelas)
+        except Exception as e:
+            print(e)
+            return None
 
-            for x,v in self._df_tabelas.iterrows():
-                print(f'Contando registros {x}: {v.database_name}.{v.schema_name}.{v.table_name}')
+        return {self._chave_tabela(d, s, t): int(n) for d, s, t, n in 
+                zip(df.database_name, df.schema_name, df.table_name, df.num_registros)}
 
-                num = self.obter_numero_registros(v.database_name, v.schema_name, v.table_name)
-                num_registros.append(num)
+    def obter_estatisticas_colunas(self):
+        """
+        Obtém as estatísticas das colunas mantidas pelo otimizador do SGBD (ver estatisticas_colunas nos flavors):
+        número de registros, nulos e distintos, mínimo e máximo (decodificados pelo flavor) e se estão desatualizadas.
 
-                print(num)
+        :return: Dicionário (database, schema, tabela) -> DataFrame com uma linha por coluna com estatísticas, ou 
+                 None se as estatísticas não estiverem disponíveis.
+        """
+        if not hasattr(self._flavor, 'estatisticas_colunas'):
+            return None
 
-            self._df_tabelas[CAMPO_NUM_REGISTROS] = num_registros
-            self._df_tabelas['filtro'] = self._filtro
+        print("Obtendo estatísticas das colunas do catálogo")
+        try:
+            if not self._possui_estatisticas():
+                return None
+            df = self._consultar_catalogo(self._flavor.estatisticas_colunas, self._tabelas)
+        except Exception as e:
+            print(e)
+            return None
+
+        if hasattr(self._flavor, 'decodificar_valor'):
+            for c in ('low_value', 'high_value'):
+                df[c] = [self._flavor.decodificar_valor(t, x) for t, x in zip(df.data_type, df[c])]
+
+        chaves = pd.Series([self._chave_tabela(d, s, t) for d, s, t in zip(df.database_name, df.schema_name, df.table_name)],
+                           index=df.index, dtype=object)
+        self._estatisticas_colunas = {k: df.iloc[i] for k, i in df.groupby(chaves, sort=False).indices.items()}
+        return self._estatisticas_colunas
+
+    def estatisticas_colunas_tabela(self, database, schema, table):
+        """
+        :return: Estatísticas das colunas da tabela obtidas por obter_estatisticas_colunas, ou None.
+        """
+        return (self._estatisticas_colunas or {}).get(self._chave_tabela(database, schema, table))
+
+    def obter_numero_registros_lote(self, df_tabelas):
+        """
+        Conta os registros de várias tabelas em uma única consulta (UNION ALL), aplicando o filtro do ambiente.
+        Em caso de erro, as tabelas do lote são contadas individualmente.
+
+        :return: Lista com o número de registros de cada tabela, na ordem de df_tabelas (-1 em caso de erro).
+        """
+        where_clause = self.get_where_clause()
+        consultas = []
+        for i, (database, schema, table) in enumerate(zip(df_tabelas.database_name, df_tabelas.schema_name, df_tabelas.table_name)):
+            tabela = self.get_table_name(database, schema, table)
+            consultas.append(f'select {i} as i, count(1) as v FROM (SELECT * FROM {tabela} {where_clause}) x')
+
+        sql = '\nUNION ALL\n'.join(consultas)
+        print(f'Contando registros de {len(consultas)} tabelas')
+        print(sql)
+        try:
+            df = self._read_sql(sql)
+            contagens = dict(zip(df.iloc[:, 0].astype(int), df.iloc[:, 1]))
+            return [int(contagens[i]) for i in range(len(consultas))]
+        except Exception as e:
+            print(e)
+
+        num_registros = []
+        for database, schema, table in zip(df_tabelas.database_name, df_tabelas.schema_name, df_tabelas.table_name):
+            print(f'Contando registros: {database}.{schema}.{table}')
+            num = self.obter_numero_registros(database, schema, table)
+            num_registros.append(num)
+            print(num)
+
+        return num_registros
         
-        return self._df_tabelas
+    @property
+    def nome(self):
+        """
+        Identificador do ambiente (usado, por exemplo, nas chaves do cache).
+        """
+        return self._nome
+
+    @property
+    def amostragem(self):
+        """
+        Tupla (estratégia de amostragem, coluna de estrato). A estratégia None indica a amostragem padrão do flavor.
+        """
+        return (self._amostragem, self._estrato)
+
+    @property
+    def conexoes(self):
+        """
+        Número máximo de conexões simultâneas do pool do ambiente.
+        """
+        return self._conexoes
+
+    @property
+    def timeout_sql(self):
+        """
+        Tempo máximo, em segundos, de cada consulta (None: sem limite).
+        """
+        return self._timeout_sql
+
+    @contextmanager
+    def prazo(self, segundos):
+        """
+        Limita a segundos o tempo das consultas executadas pela thread atual dentro do bloco (ex.: todas as 
+        consultas de uma tabela). A consulta em andamento ao fim do prazo é cancelada pelo driver e as consultas
+        seguintes falham imediatamente, com TimeoutError. Se segundos for None, não há limite.
+        """
+        if segundos is None:
+            yield
+            return
+
+        anterior = getattr(self._local, 'limite', None)
+        self._local.limite = time.monotonic() + segundos
+        try:
+            yield
+        finally:
+            self._local.limite = anterior
+
+    @property
+    def consultas_canceladas(self):
+        """
+        Número de consultas da thread atual canceladas por exceder o tempo máximo ou o prazo.
+        """
+        return getattr(self._local, 'canceladas', 0)
+
+    def _cancelada(self, mensagem):
+        self._local.canceladas = self.consultas_canceladas + 1
+        return TimeoutError(mensagem)
+
+    def _tempo_consulta(self):
+        """
+        :return: Tempo máximo, em segundos, da próxima consulta: o menor entre timeout_sql e o que resta do prazo
+                 da thread, ou None se não houver limite.
+        """
+        limite = getattr(self._local, 'limite', None)
+        if limite is None:
+            return self._timeout_sql
+
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            raise self._cancelada("Prazo da tabela esgotado")
+        return restante if self._timeout_sql is None else min(restante, self._timeout_sql)
+
+    @contextmanager
+    def _conexao(self, **opcoes):
+        """
+        Conexão do pool com o tempo máximo das consultas (ver _tempo_consulta) aplicado pelo driver (limitar_tempo
+        no flavor). A falha de uma consulta interrompida pelo limite é convertida em TimeoutError.
+        """
+        segundos = self._tempo_consulta()
+        limitar_tempo = getattr(self._flavor, 'limitar_tempo', None)
+
+        with self._engine.connect() as conn:
+            if opcoes:
+                conn = conn.execution_options(**opcoes)
+
+            if segundos is None or limitar_tempo is None:
+                yield conn
+                return
+
+            conexao_dbapi = conn.connection.dbapi_connection
+            limitar_tempo(conexao_dbapi, segundos)
+            inicio = time.monotonic()
+            try:
+                yield conn
+            except Exception as e:
+                decorrido = time.monotonic() - inicio
+                if decorrido >= segundos:
+                    raise self._cancelada(f"Consulta cancelada após {decorrido:.2f}s: {e}") from e
+                raise
+            finally:
+                try:
+                    limitar_tempo(conexao_dbapi, None)
+                except Exception:
+                    # A conexão cancelada pode ter sido encerrada pelo servidor e não volta ao pool
+                    conn.invalidate()
         
 
     def obter_numero_registros(self, database, schema, table):
@@ -137,26 +485,250 @@ class Ambiente:
         if num_registros is None:
             num_registros = self.obter_numero_registros(database, schema, table)
 
-        sql = self._flavor.sample(database, schema, table, colunas, num_registros, sample_size, filtro)
-        print(sql)
-        df_sample = pd.read_sql(sql, self._engine)
+        sql, estrategia = self._sql_amostra(database, schema, table, colunas, num_registros, sample_size, filtro)
+        if sql is not None:
+            print(sql)
+        with desempenho.span('obter_amostra', database=database, schema=schema, table=table, amostragem=estrategia):
+            if sql is None:
+                df_sample = self.obter_amostra_reservatorio(database, schema, table, colunas, sample_size, filtro)
+            else:
+                try:
+                    df_sample = self._read_sql(sql)
+                except TimeoutError:
+                    # A amostragem reservoir lê a tabela inteira e levaria ainda mais tempo
+                    raise
+                except Exception as e:
+                    if self._amostragem is None:
+                        raise
+                    print(f'WARNING: Falha na amostragem {estrategia} de {database}.{schema}.{table}: {e}. Usando amostragem reservoir.')
+                    estrategia = 'reservoir'
+                    df_sample = self.obter_amostra_reservatorio(database, schema, table, colunas, sample_size, filtro)
         print(df_sample.shape)
+
+        # Colunas convertidas para tipos compactos (texto Arrow, categóricas e numéricas nativas)
+        with desempenho.span('compactar_amostra', database=database, schema=schema, table=table):
+            df_sample = compactacao.compactar_amostra(df_sample, colunas)
+
+        # Estratégia de amostragem usada, registrada no relatório
+        df_sample.attrs['amostragem'] = estrategia
         
         return df_sample
 
+    def _sql_amostra(self, database, schema, table, colunas, num_registros, sample_size, filtro):
+        """
+        :return: Tupla (sql da amostra, estratégia usada). Se a estratégia não for suportada pelo flavor, 
+                 retorna (None, 'reservoir').
+        """
+        resultado = self._flavor.amostragem(database, schema, table, colunas, num_registros, sample_size, filtro,
+                                            estrategia=self._amostragem, estrato=self._estrato)
+        if resultado is None:
+            print(f'Amostragem {self._amostragem} não suportada pelo SGBD. Usando amostragem reservoir.')
+            return None, 'reservoir'
+        return resultado
+
+    def obter_amostra_reservatorio(self, database, schema, table, colunas, sample_size, filtro, chunksize=None):
+        """
+        Obtém uma amostra aleatória simples de sample_size registros com uma única leitura da tabela, em blocos
+        (cursor do lado do servidor, quando suportado pelo driver). A cada bloco, são mantidos os registros com as 
+        sample_size menores chaves aleatórias, o que equivale ao algoritmo de amostragem reservoir.
+        """
+        sql = self._flavor.select_colunas(database, schema, table, colunas, filtro)
+        print(sql)
 
-    def read_sql(self, sql, database=None, schema=None, table=None, **kwargs):
+        rng = np.random.default_rng()
+        reservatorio = pd.DataFrame(columns=list(colunas.column_name))
+        chaves = np.empty(0)
+        for df_bloco in self._read_sql_blocos(sql, chunksize or self.CHUNKSIZE_RESERVATORIO):
+            reservatorio = pd.concat([reservatorio, df_bloco], ignore_index=True) if len(reservatorio) else df_bloco.reset_index(drop=True)
+            chaves = np.concatenate([chaves, rng.random(len(df_bloco))])
+            if len(reservatorio) > sample_size:
+                selecionados = np.sort(np.argpartition(chaves, sample_size)[:sample_size])
+                reservatorio = reservatorio.iloc[selecionados].reset_index(drop=True)
+                chaves = chaves[selecionados]
+
+        return reservatorio
+
+    def obter_amostra_reduzida(self, database, schema, table, colunas, num_registros, sample_size, filtro):
+        """
+        Amostra usada quando a amostragem normal da tabela excede o prazo: amostragem block ou, se não suportada
+        pelo flavor ou se falhar, first-n. Nunca recorre à amostragem reservoir, que lê a tabela inteira.
+        """
+        erro = None
+        for estrategia in ('block', 'first-n'):
+            if estrategia == 'block' and not (num_registros is not None and num_registros > 0):
+                # A fração de blocos depende do número de registros da tabela
+                continue
+
+            resultado = self._flavor.amostragem(database, schema, table, colunas, num_registros, sample_size, filtro,
+                                                estrategia=estrategia)
+            if resultado is None:
+                continue
+
+            sql, estrategia_usada = resultado
+            print(sql)
+            try:
+                with desempenho.span('obter_amostra', database=database, schema=schema, table=table,
+                                     amostragem=estrategia_usada):
+                    df_sample = self._read_sql(sql)
+                break
+            except Exception as e:
+                print(f'WARNING: Falha na amostragem {estrategia} de {database}.{schema}.{table}: {e}')
+                erro = e
+        else:
+            raise erro or ValueError(f"Amostragem reduzida não suportada pelo SGBD para {database}.{schema}.{table}")
+        print(df_sample.shape)
+
+        df_sample = compactacao.compactar_amostra(df_sample, colunas)
+        df_sample.attrs['amostragem'] = estrategia_usada
+
+        return df_sample
+
+    def obter_agregacao(self, database, schema, table, colunas, filtro):
+        """
+        Calcula no SGBD, em uma única consulta, o número de registros e, para cada coluna, o número de valores 
+        não nulos (n_i), de valores distintos (d_i), o mínimo (min_i) e o máximo (max_i), em que i é a posição 
+        da coluna em colunas.
+
+        :return: Series com o resultado da consulta.
+        """
+        sql = self._flavor.agregacao(database, schema, table, colunas, filtro)
+        print(sql)
+        df = self._read_sql(sql)
+        # Alguns SGBDs (ex.: Oracle) retornam os nomes das colunas em maiúsculas
+        df.columns = df.columns.str.lower()
+
+        return df.iloc[0]
+
+    def contar_orfaos(self, database, schema, table, coluna, database_ref, schema_ref, table_ref, coluna_ref):
+        """
+        Conta no SGBD os valores não nulos da coluna e os que não existem na coluna referenciada (órfãos).
+
+        :return: Tupla (número de valores não nulos, número de órfãos).
+        """
+        sql = self._flavor.orfaos(database, schema, table, coluna, database_ref, schema_ref, table_ref, coluna_ref)
+        print(sql)
+        df = self._read_sql(sql)
+
+        return int(df.iloc[0, 0]), int(df.iloc[0, 1])
+
+    def obter_amostra_blocos(self, database, schema, table, colunas, num_registros, sample_size, filtro, chunksize):
+        """
+        Obtém a amostra em blocos de até chunksize registros, usando cursor do lado do servidor quando 
+        suportado pelo driver. Se sample_size for None, todos os registros da tabela são lidos.
+
+        :return: Gerador de DataFrames.
+        """
+        if sample_size is None:
+            # Sem amostragem: todos os registros da tabela são lidos
+            sql = self._flavor.select_colunas(database, schema, table, colunas, filtro)
+            estrategia = 'completa'
+        else:
+            if num_registros is None:
+                num_registros = self.obter_numero_registros(database, schema, table)
+
+            sql, estrategia = self._sql_amostra(database, schema, table, colunas, num_registros, sample_size, filtro)
+
+        if sql is not None:
+            print(sql)
+            lidos = 0
+            try:
+                for df_bloco in self._read_sql_blocos(sql, chunksize):
+                    df_bloco.attrs['amostragem'] = estrategia
+                    lidos += 1
+                    yield df_bloco
+                return
+            except TimeoutError:
+                raise
+            except Exception as e:
+                if self._amostragem is None or lidos:
+                    raise
+                print(f'WARNING: Falha na amostragem {estrategia} de {database}.{schema}.{table}: {e}. Usando amostragem reservoir.')
+
+        # A amostra reservoir só é conhecida ao final da leitura da tabela e é repassada em blocos
+        df_sample = self.obter_amostra_reservatorio(database, schema, table, colunas, sample_size, filtro, chunksize)
+        for i in range(0, len(df_sample), chunksize):
+            df_bloco = df_sample.iloc[i:i + chunksize]
+            df_bloco.attrs['amostragem'] = 'reservoir'
+            yield df_bloco
+
+    def _read_sql_blocos(self, sql, chunksize):
+        """
+        Executa a consulta no banco e retorna o resultado em blocos de até chunksize registros, usando cursor 
+        do lado do servidor quando suportado pelo driver.
+
+        :return: Gerador de DataFrames.
+        """
+        with desempenho.span('sql', sql=sql[:desempenho.TAMANHO_MAXIMO_SQL]) as span, \
+                self._conexao(stream_results=True) as conn:
+            for df_bloco in pd.read_sql(sql, conn, chunksize=chunksize):
+                span.registrar_dataframe(df_bloco)
+                yield df_bloco
+
+    def _read_sql(self, sql, parametros=None):
+        """
+        Executa a consulta no banco, registrando o tempo, os registros e os bytes obtidos (ver profiler_dq.desempenho).
+
+        :param parametros: Valores dos parâmetros da consulta (sql do tipo sqlalchemy.text).
+        """
+        with desempenho.span('sql', sql=str(sql)[:desempenho.TAMANHO_MAXIMO_SQL]) as span:
+            with self._conexao() as conn:
+                df = pd.read_sql(sql, conn, params=parametros)
+            span.registrar_dataframe(df)
+        return df
+
+
+    def formatar_sql(self, sql, database=None, schema=None, table=None, **kwargs):
+        """
+        Substitui no sql a variável {tabela} pela tabela (com o filtro do ambiente) e as demais variáveis por kwargs.
+        """
         tabela = self.get_table_name(database, schema, table)
         where_clause = self.get_where_clause()
         tabela = f'(SELECT * FROM {tabela} {where_clause})'
         
-        #print(sql)
-        sql = sql.format(tabela=tabela, **kwargs)
+        return sql.format(tabela=tabela, **kwargs)
+
+    def read_sql(self, sql, database=None, schema=None, table=None, **kwargs):
+        sql = self.formatar_sql(sql, database=database, schema=schema, table=table, **kwargs)
         print(sql)
-        df = pd.read_sql(sql, self._engine)
+        df = self._read_sql(sql)
         
         return df
 
+    def read_sql_escalares(self, consultas):
+        """
+        Executa várias consultas que retornam um único valor, agrupando-as como subconsultas escalares de 
+        um único SELECT (em lotes de até TAMANHO_LOTE_ESCALARES consultas). Se o lote falhar, suas consultas
+        são executadas individualmente, exceto se o lote exceder o tempo máximo (as consultas do lote retornam None).
+
+        :param consultas: Lista de consultas SQL já formatadas.
+        :return: Lista com o valor (primeira linha e coluna) de cada consulta, ou None se a consulta falhar.
+        """
+        resultados = []
+        for i in range(0, len(consultas), self.TAMANHO_LOTE_ESCALARES):
+            lote = consultas[i:i + self.TAMANHO_LOTE_ESCALARES]
+            sql = self._flavor.select_escalares([f'({c})' for c in lote])
+            print(sql)
+            try:
+                df = self._read_sql(sql)
+                resultados.extend(df.iloc[0].tolist())
+                continue
+            except TimeoutError as e:
+                print(f'WARNING: {e}')
+                resultados.extend([None] * len(lote))
+                continue
+            except Exception as e:
+                print(e)
+
+            for c in lote:
+                print(c)
+                try:
+                    resultados.append(self._read_sql(c).iloc[0,0])
+                except Exception as e:
+                    print(e)
+                    resultados.append(None)
+
+        return resultados
+
     def get_table_name(self, database, schema, table):
         if table:
             tabela = self._flavor.nome_tabela(database=database, schema=schema, table=table)
@@ -164,5 +736,81 @@ class Ambiente:
             tabela = ''
         return tabela
 
-        
-    
\ No newline at end of file
+
+class AmbienteLocal(Ambiente):
+    """
+    Ambiente SQLite local (arquivo temporário) onde as validações SQL são executadas sobre as amostras das 
+    tabelas, em vez do banco de origem. As tabelas auxiliares referenciadas pelos scripts de validação 
+    (ex.: tabela cpf em validacao/cpfs.sql) são copiadas do banco de origem.
+
+    :param origem: Ambiente de origem das amostras e das tabelas auxiliares.
+    """
+    # Número de registros copiados por vez das tabelas auxiliares
+    CHUNKSIZE_COPIA = 100000
+
+    def __init__(self, origem):
+        descritor, self._arquivo = tempfile.mkstemp(prefix='profiler_dq_', suffix='.db')
+        os.close(descritor)
+
+        super().__init__({'url': f'sqlite:///{self._arquivo}'}, conexoes=origem.conexoes,
+                         nome=f'{origem.nome} (local)', timeout_sql=origem.timeout_sql)
+
+        self._origem = origem
+        self._amostras = {}
+        self._lock = threading.Lock()
+
+    def registrar_amostra(self, database, schema, table, df_sample):
+        """
+        Grava a amostra de uma tabela do ambiente de origem no banco local.
+        """
+        df_sample = df_sample.copy()
+        for c in df_sample.columns:
+            # O sqlite3 não suporta Decimal, retornado por alguns drivers para colunas numéricas
+            if df_sample[c].dtype == 'object' and df_sample[c].map(lambda x: isinstance(x, Decimal)).any():
+                df_sample[c] = pd.to_numeric(df_sample[c])
+
+        with self._lock:
+            nome = f'amostra_{len(self._amostras)}'
+            df_sample.to_sql(nome, self._engine, index=False)
+            self._amostras[self._chave_tabela(database, schema, table)] = nome
+
+    def copiar_tabelas_auxiliares(self, scripts):
+        """
+        Copia do banco de origem as tabelas referenciadas (FROM/JOIN) nos scripts de validação. Apenas nomes 
+        de tabelas não qualificados (sem database/schema) são suportados.
+
+        :param scripts: Conteúdo dos scripts de validação.
+        """
+        nomes = set()
+        for sql in scripts:
+            nomes.update(re.findall(r'\b(?:from|join)\s+([A-Za-z_][\w$#.]*)', sql, re.IGNORECASE))
+
+        for nome in sorted(nomes):
+            if '.' in nome:
+                print(f"WARNING: Tabela {nome} não copiada para o ambiente local. Use nomes de tabelas não qualificados.")
+                continue
+
+            tabela = self._origem.get_table_name(self._origem._database, self._origem._schema, nome)
+            print(f'Copiando tabela auxiliar {tabela} para o ambiente local')
+            try:
+                with desempenho.span('copiar_tabela_auxiliar', table=nome) as span:
+                    for i, df in enumerate(pd.read_sql(f'select * from {tabela}', self._origem._engine, chunksize=self.CHUNKSIZE_COPIA)):
+                        span.registrar_dataframe(df)
+                        df.to_sql(nome, self._engine, index=False, if_exists='replace' if i == 0 else 'append')
+            except Exception as e:
+                print(e)
+
+    def get_table_name(self, database, schema, table):
+        if not table:
+            return ''
+        nome = self._amostras.get(self._chave_tabela(database, schema, table))
+        if nome is None:
+            raise ValueError(f"Amostra da tabela {database}.{schema}.{table} não encontrada no ambiente local")
+        return f'main.{nome}'
+
+    def fechar(self):
+        """
+        Libera as conexões e remove o banco local.
+        """
+        self._engine.dispose()
+        os.remove(self._arquivo)
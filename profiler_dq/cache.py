@@ -0,0 +1,203 @@
+"""
+Cache persistente dos resultados do profiling.
+
+Os resultados são gravados em um banco SQLite no diretório de cache, permitindo que execuções seguintes
+reaproveitem o número de registros, as amostras e as métricas das tabelas que não foram alteradas.
+
+Uma entrada de cache é invalidada quando:
+- expira o tempo de validade (ttl);
+- o número de registros da tabela muda;
+- a lista de colunas/tipos da tabela muda (a chave da entrada deixa de ser a mesma);
+- a execução é feita com refresh=True.
+
+As colunas de cada tabela obtidas do catálogo do SGBD também são gravadas, com a versão da tabela (data do último
+DDL, ver versoes_tabelas nos flavors). Apenas as tabelas cuja versão mudou são lidas novamente do catálogo.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from contextlib import contextmanager
+
+DIR_CACHE_PADRAO = '.profiler_dq_cache'
+ARQUIVO_CACHE = 'cache.db'
+
+
+def digest(*partes):
+    """
+    Chave (SHA-256) das partes, serializadas em JSON. Usada também pelo checkpoint (profiler_dq.checkpoint).
+    """
+    return hashlib.sha256(json.dumps(partes, default=str, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def conectar(arquivo):
+    """
+    Conexão ao banco SQLite em uma transação, confirmada ao final do bloco (ou desfeita, se houver exceção).
+    """
+    conn = sqlite3.connect(arquivo, timeout=60)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def serializar(objeto):
+    """
+    Serializa o objeto (ex.: DataFrame) para gravação em uma coluna BLOB. None é mantido.
+    """
+    return pickle.dumps(objeto, protocol=pickle.HIGHEST_PROTOCOL) if objeto is not None else None
+
+
+def desserializar(dados):
+    return pickle.loads(dados) if dados is not None else None
+
+
+class Cache:
+    """
+    :param diretorio: Diretório onde o banco do cache é gravado.
+    :param ttl: Tempo de validade das entradas, em horas. Se None, as entradas não expiram.
+    :param refresh: Se True, as entradas existentes são ignoradas e regravadas.
+    """
+    def __init__(self, diretorio=DIR_CACHE_PADRAO, ttl=None, refresh=False):
+        os.makedirs(diretorio, exist_ok=True)
+        self._arquivo = os.path.join(diretorio, ARQUIVO_CACHE)
+        self._ttl = ttl
+        self._refresh = refresh
+        self._lock = threading.Lock()
+
+        with conectar(self._arquivo) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tabelas (
+                    chave TEXT PRIMARY KEY,
+                    ambiente TEXT, database_name TEXT, schema_name TEXT, table_name TEXT,
+                    num_registros INTEGER,
+                    criado_em REAL,
+                    metricas BLOB,
+                    amostra BLOB
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS num_registros (
+                    chave TEXT PRIMARY KEY,
+                    num_registros INTEGER,
+                    criado_em REAL
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS validacoes (
+                    chave TEXT PRIMARY KEY,
+                    criado_em REAL,
+                    resultado BLOB
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS catalogo (
+                    chave TEXT PRIMARY KEY,
+                    ambiente TEXT,
+                    versao TEXT,
+                    criado_em REAL,
+                    colunas BLOB
+                )""")
+
+    def _valido(self, criado_em):
+        return not self._refresh and (self._ttl is None or time.time() - criado_em <= self._ttl * 3600)
+
+    @staticmethod
+    def chave_tabela(ambiente, database, schema, table, colunas, parametros):
+        """
+        Chave de uma tabela analisada: ambiente, tabela, colunas e tipos e parâmetros da análise
+        (filtro, tamanho da amostra, modo de análise, etc).
+        """
+        lista_colunas = list(zip(colunas.column_name, colunas.data_type, colunas.tipo))
+        return digest(ambiente, database, schema, table, lista_colunas, parametros)
+
+    def obter_tabela(self, chave, num_registros):
+        """
+        :return: Tupla (métricas, amostra) da tabela, ou None se não houver entrada válida.
+                 A amostra é None se não tiver sido gravada.
+        """
+        with self._lock, conectar(self._arquivo) as conn:
+            r = conn.execute("SELECT num_registros, criado_em, metricas, amostra FROM tabelas WHERE chave = ?", (chave,)).fetchone()
+
+        if r is None or not self._valido(r[1]) or r[0] != int(num_registros):
+            return None
+
+        return desserializar(r[2]), desserializar(r[3])
+
+    def salvar_tabela(self, chave, ambiente, database, schema, table, num_registros, metricas, amostra=None):
+        """
+        Grava as métricas (e opcionalmente a amostra) da tabela, removendo entradas anteriores da mesma tabela.
+        """
+        amostra = serializar(amostra)
+        with self._lock, conectar(self._arquivo) as conn:
+            conn.execute("DELETE FROM tabelas WHERE ambiente IS ? AND database_name IS ? AND schema_name IS ? AND table_name IS ?",
+                         (ambiente, database, schema, table))
+            conn.execute("INSERT OR REPLACE INTO tabelas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (chave, ambiente, database, schema, table, int(num_registros), time.time(),
+                          serializar(metricas), amostra))
+
+    def obter_num_registros(self, ambiente, database, schema, table, filtro):
+        chave = digest(ambiente, database, schema, table, filtro)
+        with self._lock, conectar(self._arquivo) as conn:
+            r = conn.execute("SELECT num_registros, criado_em FROM num_registros WHERE chave = ?", (chave,)).fetchone()
+
+        if r is None or not self._valido(r[1]):
+            return None
+        return r[0]
+
+    def salvar_num_registros(self, ambiente, database, schema, table, filtro, num_registros):
+        chave = digest(ambiente, database, schema, table, filtro)
+        with self._lock, conectar(self._arquivo) as conn:
+            conn.execute("INSERT OR REPLACE INTO num_registros VALUES (?, ?, ?)", (chave, int(num_registros), time.time()))
+
+    @staticmethod
+    def chave_validacao(ambiente, database, schema, table, script, conteudo_script, df_colunas, filtro):
+        """
+        Chave da execução de um script de validação em uma tabela: inclui o conteúdo do script e as métricas
+        das colunas, que determinam as colunas selecionadas pelos filtros do script.
+        """
+        return digest(ambiente, database, schema, table, script, conteudo_script,
+                       df_colunas.to_json(orient='records', default_handler=str), filtro)
+
+    def obter_validacao(self, chave):
+        """
+        :return: Tupla (resultado,) com o resultado gravado, ou None se não houver entrada válida.
+        """
+        with self._lock, conectar(self._arquivo) as conn:
+            r = conn.execute("SELECT criado_em, resultado FROM validacoes WHERE chave = ?", (chave,)).fetchone()
+
+        if r is None or not self._valido(r[0]):
+            return None
+        return (desserializar(r[1]),)
+
+    def salvar_validacao(self, chave, resultado):
+        with self._lock, conectar(self._arquivo) as conn:
+            conn.execute("INSERT OR REPLACE INTO validacoes VALUES (?, ?, ?)",
+                         (chave, time.time(), serializar(resultado)))
+
+    def obter_catalogo(self, ambiente, tabelas):
+        """
+        :param tabelas: Lista de (database, schema, tabela).
+        :return: Dicionário (database, schema, tabela) -> (versão, DataFrame com as colunas da tabela), apenas 
+                 para as tabelas com entrada válida.
+        """
+        chaves = {digest(ambiente, *t): t for t in tabelas}
+        with self._lock, conectar(self._arquivo) as conn:
+            registros = conn.execute("SELECT chave, versao, criado_em, colunas FROM catalogo WHERE ambiente = ?", 
+                                     (ambiente,)).fetchall()
+
+        return {chaves[chave]: (versao, desserializar(colunas)) for chave, versao, criado_em, colunas in registros
+                if chave in chaves and self._valido(criado_em)}
+
+    def salvar_catalogo(self, ambiente, tabelas):
+        """
+        :param tabelas: Lista de ((database, schema, tabela), versão, DataFrame com as colunas da tabela).
+        """
+        agora = time.time()
+        with self._lock, conectar(self._arquivo) as conn:
+            conn.executemany("INSERT OR REPLACE INTO catalogo VALUES (?, ?, ?, ?, ?)",
+                             [(digest(ambiente, *t), ambiente, versao, agora, 
+                               serializar(df)) for t, versao, df in tabelas])
@@ -0,0 +1,260 @@
+"""
+Descoberta de chaves compostas e de dependências funcionais nas amostras das tabelas.
+
+A métrica unique (analise_conteudo_unicidade) indica apenas as colunas que, isoladamente, são chaves candidatas.
+As combinações de colunas são exploradas em um reticulado, nível a nível (combinações de 1, 2, ... colunas), como
+nos algoritmos DUCC e HyFD:
+
+- Cada coluna é codificada como inteiros (o código de cada valor, com o nulo como mais um valor) e cada combinação
+  é representada pela partição dos registros: o identificador do grupo de cada registro, obtido a partir dos
+  identificadores da combinação do nível anterior e dos códigos da nova coluna, sem comparar os valores.
+- Uma combinação com um grupo por registro é única. As combinações únicas são chaves mínimas e os seus
+  superconjuntos não são avaliados. Se a amostra tem registros duplicados (a partição de todas as colunas não é
+  única), nenhuma combinação é única e apenas as dependências são procuradas.
+- Se X -> A é exata, os superconjuntos de X + A não são chaves mínimas (X + A tem a mesma partição que X), por isso
+  X + A não é estendida. Colunas constantes não participam das combinações.
+- O número de combinações avaliadas em cada nível é limitado (ver MAX_COMBINACOES_NIVEL e MAX_IDENTIFICADORES_NIVEL),
+  priorizando as combinações com mais grupos, que estão mais próximas de serem únicas.
+
+As dependências X -> A são aproximadas: o erro (g3) é a fração mínima de registros que precisam ser removidos para
+que a dependência seja exata, e são reportadas as dependências mínimas (nenhum subconjunto de X determina A) com
+erro até erro_dependencias. Como o erro de X -> A é no máximo (n - grupos de X) / n, combinações X quase únicas
+determinam qualquer coluna: só são reportadas as dependências com erro até a metade desse limite. Antes de calcular o erro, os pares são descartados por dois limites inferiores do erro:
+o número de valores de A além do número de grupos de X (cada um acrescenta ao menos um registro removido) e, com os
+registros ordenados pelos grupos de X, metade do número de registros vizinhos no mesmo grupo com valores diferentes
+de A (cada registro removido participa de no máximo duas dessas mudanças), calculado para todas as colunas A de uma
+só vez.
+
+Os resultados descrevem a amostra: uma combinação única na amostra pode ter duplicados na tabela.
+"""
+import threading
+
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from . import desempenho
+
+# Número máximo de combinações de colunas avaliadas em cada nível do reticulado
+MAX_COMBINACOES_NIVEL = 1000
+
+# Número máximo de identificadores de grupo (registros da amostra x combinações) mantidos em memória por nível
+MAX_IDENTIFICADORES_NIVEL = 20_000_000
+
+COLUNAS_CHAVES = ['database_name', 'schema_name', 'table_name', 'tipo', 'colunas', 'num_colunas', 'dependente',
+                  'erro', 'tamanho_amostra']
+
+
+def _codificar(s):
+    codigos, valores = pd.factorize(s, use_na_sentinel=False)
+    return codigos.astype(np.int64), len(valores)
+
+
+def _refinar(ids, codigos, cardinalidade):
+    """
+    Partição da combinação acrescida de uma coluna: um grupo para cada par (grupo, código da coluna).
+
+    :return: Tupla (identificadores dos grupos, número de grupos).
+    """
+    novos, grupos = pd.factorize(ids.astype(np.int64) * cardinalidade + codigos)
+    return novos.astype(np.int32), len(grupos)
+
+
+def _grupos_registros(codigos, cardinalidades, n):
+    """
+    Número de grupos da partição de todas as colunas, isto é, de registros distintos. A partição é refinada coluna
+    a coluna e interrompida quando cada registro forma um grupo.
+    """
+    ids, n_grupos = codigos[0], cardinalidades[0]
+    for c, k in zip(codigos[1:], cardinalidades[1:]):
+        if n_grupos == n:
+            break
+        ids, n_grupos = _refinar(ids, c, k)
+    return n_grupos
+
+
+def registros_distintos(df):
+    """
+    Número de registros distintos da amostra (como em df.drop_duplicates(), com os nulos iguais entre si), contado
+    pela partição das colunas codificadas, sem comparar os registros.
+    """
+    if len(df) == 0 or len(df.columns) == 0:
+        return len(df)
+    codigos, cardinalidades = zip(*(_codificar(df[c]) for c in df.columns))
+    return _grupos_registros(codigos, cardinalidades, len(df))
+
+
+def _erro_dependencia(ids, codigos, cardinalidade):
+    """
+    Erro g3 da dependência X -> A: 1 - (soma, em cada grupo de X, da frequência do valor mais comum de A) / n.
+    """
+    pares, contagens = np.unique(ids.astype(np.int64) * cardinalidade + codigos, return_counts=True)
+    # Os pares estão ordenados pelo grupo de X: cada grupo é um trecho contíguo
+    grupos = pares // cardinalidade
+    inicios = np.flatnonzero(np.r_[True, grupos[1:] != grupos[:-1]])
+    return float(1 - np.maximum.reduceat(contagens, inicios).sum() / len(ids))
+
+
+def _mudancas(ids, matriz):
+    """
+    Com os registros ordenados pelos grupos de X, número de pares de registros vizinhos do mesmo grupo com valores
+    diferentes em cada coluna da matriz de códigos.
+    """
+    ordem = np.argsort(ids, kind='stable')
+    ordenados = ids[ordem]
+    vizinhos = ordem[:-1][ordenados[1:] == ordenados[:-1]]
+    seguintes = ordem[1:][ordenados[1:] == ordenados[:-1]]
+    return (matriz[vizinhos] != matriz[seguintes]).sum(axis=0)
+
+
+def descobrir(df_sample, max_colunas=3, erro_dependencias=0.01):
+    """
+    Procura as chaves mínimas e as dependências funcionais mínimas com até max_colunas colunas (determinante e
+    dependente) na amostra.
+
+    :return: Tupla (lista de chaves, lista de dependências), em que cada chave é uma tupla de colunas e cada
+             dependência é uma tupla (tupla de colunas do determinante, coluna dependente, erro).
+    """
+    n = len(df_sample)
+    colunas = list(df_sample.columns)
+    if n < 2 or not colunas:
+        return [], []
+
+    codigos, cardinalidades = zip(*(_codificar(df_sample[c]) for c in colunas))
+    ativas = [i for i, k in enumerate(cardinalidades) if k > 1]
+    limite_erro = erro_dependencias * n
+
+    # Se há registros duplicados, nenhuma combinação de colunas é única
+    procurar_chaves = _grupos_registros(codigos, cardinalidades, n) == n
+
+    # Códigos de todas as colunas, para os limites do erro das dependências de cada X
+    matriz = np.column_stack([codigos[i] for i in ativas]).astype(np.int32) if ativas and max_colunas > 1 else None
+
+    chaves = []
+    dependencias = []
+    determinantes = defaultdict(list)
+    nivel = {(i,): (codigos[i].astype(np.int32), cardinalidades[i]) for i in ativas}
+    tamanho = 1
+    while nivel:
+        nao_unicas = {}
+        podadas = set()
+        for X, (ids, n_grupos) in nivel.items():
+            if n_grupos == n:
+                chaves.append(X)
+                continue
+            nao_unicas[X] = (ids, n_grupos)
+
+            # Qualquer dependência X -> A tem erro no máximo (n - grupos de X) / n. Se X é quase única, as dependências
+            # são triviais
+            if tamanho >= max_colunas or n - n_grupos <= limite_erro:
+                continue
+
+            mudancas = _mudancas(ids, matriz)
+            for j, a in enumerate(ativas):
+                if a in X or any(set(D) <= set(X) for D in determinantes[a]):
+                    continue
+                if cardinalidades[a] - n_grupos > limite_erro or mudancas[j] > 2 * limite_erro:
+                    continue
+                erro = 0.0 if mudancas[j] == 0 else _erro_dependencia(ids, codigos[a], cardinalidades[a])
+                # A dependência deve ser confirmada por ao menos metade dos registros dos grupos repetidos de X
+                if erro <= erro_dependencias and erro * n <= (n - n_grupos) / 2:
+                    dependencias.append((X, a, erro))
+                    determinantes[a].append(X)
+                    if erro == 0:
+                        podadas.add(tuple(sorted(X + (a,))))
+
+        if tamanho >= max_colunas or not (procurar_chaves or tamanho + 1 < max_colunas):
+            break
+
+        nivel = _proximo_nivel(nao_unicas, podadas, codigos, cardinalidades, n)
+        tamanho += 1
+
+    def nomes(X):
+        return tuple(colunas[i] for i in X)
+
+    return [nomes(X) for X in chaves], [(nomes(X), colunas[a], erro) for X, a, erro in dependencias]
+
+
+def _proximo_nivel(nivel, podadas, codigos, cardinalidades, n):
+    """
+    Combinações do próximo nível do reticulado: junção das combinações do nível com o mesmo prefixo, desde que
+    todos os seus subconjuntos estejam no nível (não são únicos nem foram podados).
+    """
+    por_prefixo = defaultdict(list)
+    for X in nivel:
+        por_prefixo[X[:-1]].append(X[-1])
+
+    candidatos = []
+    for prefixo, ultimas in por_prefixo.items():
+        ultimas.sort()
+        for j, a in enumerate(ultimas):
+            for b in ultimas[j + 1:]:
+                Y = prefixo + (a, b)
+                if Y in podadas or any(Y[:k] + Y[k + 1:] not in nivel for k in range(len(Y) - 2)):
+                    continue
+                # Prioridade: combinações geradas por subconjuntos com mais grupos
+                candidatos.append((nivel[prefixo + (a,)][1] + nivel[prefixo + (b,)][1], Y))
+
+    limite = min(MAX_COMBINACOES_NIVEL, max(1, MAX_IDENTIFICADORES_NIVEL // n))
+    if len(candidatos) > limite:
+        print(f'WARNING: {len(candidatos)} combinações de {len(candidatos[0][1])} colunas; apenas {limite} avaliadas.')
+        candidatos.sort(key=lambda x: -x[0])
+        candidatos = candidatos[:limite]
+
+    proximo = {}
+    for _, Y in candidatos:
+        ids, _ = nivel[Y[:-1]]
+        proximo[Y] = _refinar(ids, codigos[Y[-1]], cardinalidades[Y[-1]])
+    return proximo
+
+
+class DescobridorChaves:
+    """
+    Recebe a amostra de cada tabela (como consumidor de amostras, ver info_colunas.analise_colunas_sample) e procura
+    as suas chaves compostas e dependências funcionais.
+
+    :param max_colunas: Número máximo de colunas das chaves e das dependências (determinante e dependente).
+    :param erro_dependencias: Erro g3 máximo das dependências aproximadas.
+    :param ao_concluir_tabela: Função chamada com o DataFrame de resultados de cada tabela.
+    """
+    def __init__(self, max_colunas=3, erro_dependencias=0.01, ao_concluir_tabela=None):
+        self._max_colunas = max_colunas
+        self._erro_dependencias = erro_dependencias
+        self._ao_concluir_tabela = ao_concluir_tabela
+        self._resultados = []
+        self._lock = threading.Lock()
+
+    def registrar_amostra(self, database, schema, table, df_sample):
+        with desempenho.span('descobrir_chaves', database=database, schema=schema, table=table,
+                             colunas=len(df_sample.columns)):
+            chaves, dependencias = descobrir(df_sample, self._max_colunas, self._erro_dependencias)
+
+        registros = [('chave', X, None, 0.0) for X in chaves] + [('dependencia', X, a, erro) for X, a, erro in dependencias]
+        df = pd.DataFrame([{
+            'database_name': database,
+            'schema_name': schema,
+            'table_name': table,
+            'tipo': tipo,
+            'colunas': ','.join(X),
+            'num_colunas': len(X),
+            'dependente': a,
+            'erro': erro,
+            'tamanho_amostra': len(df_sample),
+        } for tipo, X, a, erro in registros], columns=COLUNAS_CHAVES)
+
+        with self._lock:
+            self._resultados.append(df)
+        if self._ao_concluir_tabela is not None and len(df):
+            self._ao_concluir_tabela(df)
+
+    def dataframe(self):
+        """
+        :return: DataFrame com as chaves e as dependências de todas as tabelas.
+        """
+        with self._lock:
+            resultados = [df for df in self._resultados if len(df)]
+        if not resultados:
+            return pd.DataFrame(columns=COLUNAS_CHAVES)
+        return pd.concat(resultados, ignore_index=True).sort_values(
+            ['database_name', 'schema_name', 'table_name', 'tipo', 'num_colunas'], kind='stable', ignore_index=True)
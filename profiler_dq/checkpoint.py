@@ -0,0 +1,115 @@
+"""
+Checkpoint das execuções longas.
+
+As métricas e os resultados das validações de cada tabela são gravados em um diário (banco SQLite local) à medida
+que as tabelas são concluídas. Se a execução for interrompida (exceção, perda de conexão ou Ctrl-C), a execução
+seguinte com resume=True reaproveita as tabelas já concluídas e processa apenas as demais.
+
+Diferente do cache (profiler_dq.cache), o diário pertence a uma única execução: as entradas não expiram e não
+dependem do número de registros das tabelas, mas o diário só é retomado com os mesmos parâmetros da execução
+que o gravou.
+"""
+import json
+import threading
+import time
+
+from .cache import conectar, desserializar, digest, serializar
+
+ARQUIVO_CHECKPOINT_PADRAO = 'profiler_dq_checkpoint.db'
+
+
+class Checkpoint:
+    """
+    :param arquivo: Arquivo SQLite do diário.
+    :param parametros: Parâmetros que determinam os resultados da execução (ambiente, tabelas, filtro, amostra,
+                       modo de análise, scripts de validação, etc).
+    :param resume: Se True, retoma o diário existente, que deve ter sido gravado com os mesmos parâmetros
+                   (senão, gera ValueError). Se False, o diário é reiniciado.
+    """
+    def __init__(self, arquivo=ARQUIVO_CHECKPOINT_PADRAO, parametros=None, resume=False):
+        self._arquivo = arquivo
+        self._lock = threading.Lock()
+        assinatura = digest(parametros)
+
+        with conectar(self._arquivo) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS execucao (assinatura TEXT, parametros TEXT, iniciado_em REAL)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tabelas (
+                    chave TEXT PRIMARY KEY,
+                    database_name TEXT, schema_name TEXT, table_name TEXT,
+                    concluido_em REAL,
+                    metricas BLOB,
+                    amostra BLOB
+                )""")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS validacoes (
+                    chave TEXT PRIMARY KEY,
+                    concluido_em REAL,
+                    resultado BLOB
+                )""")
+
+            r = conn.execute("SELECT assinatura FROM execucao").fetchone()
+            if resume and r is not None and r[0] != assinatura:
+                raise ValueError(f"O checkpoint {arquivo} foi gravado por uma execução com parâmetros diferentes.")
+
+            if not resume or r is None:
+                for tabela in ('execucao', 'tabelas', 'validacoes'):
+                    conn.execute(f"DELETE FROM {tabela}")
+                conn.execute("INSERT INTO execucao VALUES (?, ?, ?)",
+                             (assinatura, json.dumps(parametros, default=str, sort_keys=True), time.time()))
+
+    @property
+    def arquivo(self):
+        return self._arquivo
+
+    def tabelas_concluidas(self):
+        """
+        Número de tabelas com métricas gravadas.
+        """
+        with self._lock, conectar(self._arquivo) as conn:
+            return conn.execute("SELECT COUNT(*) FROM tabelas").fetchone()[0]
+
+    def obter_tabela(self, database, schema, table):
+        """
+        :return: Tupla (métricas, amostra) da tabela, ou None se a tabela não foi concluída.
+                 A amostra é None se não tiver sido gravada.
+        """
+        with self._lock, conectar(self._arquivo) as conn:
+            r = conn.execute("SELECT metricas, amostra FROM tabelas WHERE chave = ?",
+                             (digest(database, schema, table),)).fetchone()
+
+        if r is None:
+            return None
+        return desserializar(r[0]), desserializar(r[1])
+
+    def salvar_tabela(self, database, schema, table, metricas, amostra=None):
+        """
+        Grava as métricas (e opcionalmente a amostra) de uma tabela concluída.
+        """
+        amostra = serializar(amostra)
+        with self._lock, conectar(self._arquivo) as conn:
+            conn.execute("INSERT OR REPLACE INTO tabelas VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (digest(database, schema, table), database, schema, table, time.time(),
+                          serializar(metricas), amostra))
+
+    def obter_validacao(self, database, schema, table):
+        """
+        :return: Tupla (resultados,) com a lista de resultados das validações da tabela, ou None se as validações
+                 da tabela não foram concluídas.
+        """
+        with self._lock, conectar(self._arquivo) as conn:
+            r = conn.execute("SELECT resultado FROM validacoes WHERE chave = ?",
+                             (digest(database, schema, table),)).fetchone()
+
+        if r is None:
+            return None
+        return (desserializar(r[0]),)
+
+    def salvar_validacao(self, database, schema, table, resultados):
+        """
+        Grava os resultados de todas as validações de uma tabela concluída.
+        """
+        with self._lock, conectar(self._arquivo) as conn:
+            conn.execute("INSERT OR REPLACE INTO validacoes VALUES (?, ?, ?)",
+                         (digest(database, schema, table), time.time(),
+                          serializar(resultados)))
@@ -0,0 +1,105 @@
+"""
+Representação compacta das amostras em memória.
+
+Os drivers retornam as colunas como objetos Python (textos, Decimal, datetime), que ocupam dezenas de bytes por
+valor e são copiados novamente pelas funções de análise. As colunas da amostra são convertidas conforme o tipo
+da coluna (ver MAP_TYPES nos flavors):
+
+- STRING: categórica, quando a coluna tem poucos valores distintos (os textos são armazenados uma única vez e cada
+  registro guarda apenas o código da categoria); senão, texto em formato Arrow (string[pyarrow]), quando o pacote
+  pyarrow estiver instalado.
+- NUMERIC/FLOAT: numérica nativa. Valores Decimal inteiros são mantidos como inteiros (Int64), preservando a sua
+  representação textual na validação de CPF/CNPJ, e os inteiros são reduzidos ao menor tipo que os comporta.
+- DATE: datetime64, quando a coluna contém objetos datetime. Datas lidas como texto são mantidas.
+"""
+import pandas as pd
+
+from . import data_types
+
+# Colunas de texto com até esta fração de valores distintos são armazenadas como categóricas
+FRACAO_CATEGORICA = 0.5
+
+try:
+    import pyarrow
+    DTYPE_TEXTO = pd.StringDtype('pyarrow')
+except ImportError:
+    DTYPE_TEXTO = None
+
+
+def e_texto(s):
+    """
+    Indica se a Series contém textos: object, StringDtype ou categórica de textos.
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        return e_texto(pd.Series(s.cat.categories))
+    return pd.api.types.is_object_dtype(s.dtype) or isinstance(s.dtype, pd.StringDtype)
+
+
+def _compactar_texto(s):
+    if not pd.api.types.is_object_dtype(s.dtype) and not isinstance(s.dtype, pd.StringDtype):
+        return s
+    if pd.api.types.infer_dtype(s, skipna=True) not in ('string', 'empty'):
+        # Textos misturados com outros tipos (ex.: bytes) são mantidos como objetos
+        return s
+
+    if DTYPE_TEXTO is not None:
+        s = s.astype(DTYPE_TEXTO)
+
+    categorica = s.astype('category')
+    if len(categorica.cat.categories) <= FRACAO_CATEGORICA * len(s):
+        return categorica
+    return s
+
+
+def _compactar_numero(s):
+    if pd.api.types.is_object_dtype(s.dtype):
+        tipo = pd.api.types.infer_dtype(s, skipna=True)
+        if tipo == 'decimal':
+            valores = pd.to_numeric(s)
+            inteiros = s.dropna().map(lambda x: x == x.to_integral_value()).all()
+            if inteiros and valores.abs().max(skipna=True) < 2**53:
+                return valores.astype('Int64')
+            return valores
+        if tipo in ('integer', 'floating', 'mixed-integer-float'):
+            return pd.to_numeric(s)
+        return s
+
+    if pd.api.types.is_integer_dtype(s.dtype):
+        return pd.to_numeric(s, downcast='integer')
+    return s
+
+
+def _compactar_data(s):
+    if pd.api.types.is_object_dtype(s.dtype) and pd.api.types.infer_dtype(s, skipna=True) in ('datetime', 'datetime64'):
+        try:
+            return pd.to_datetime(s)
+        except (ValueError, TypeError, OverflowError):
+            # Datas fora do intervalo do datetime64 (ex.: ano 9999) são mantidas como objetos
+            return s
+    return s
+
+
+COMPACTADORES = {
+    data_types.STRING: _compactar_texto,
+    data_types.NUMERIC: _compactar_numero,
+    data_types.FLOAT: _compactar_numero,
+    data_types.DATE: _compactar_data,
+}
+
+
+def compactar_amostra(df_sample, colunas):
+    """
+    Converte as colunas da amostra para a representação compacta do seu tipo.
+
+    :param colunas: DataFrame de colunas da tabela (column_name e tipo).
+    :return: DataFrame com as colunas convertidas. Os atributos (attrs) da amostra são mantidos.
+    """
+    tipos = dict(zip(colunas.column_name, colunas.tipo))
+    df = df_sample.copy(deep=False)
+    for c in df.columns:
+        compactar = COMPACTADORES.get(tipos.get(c))
+        if compactar is not None:
+            df[c] = compactar(df[c])
+    df.attrs = dict(df_sample.attrs)
+    return df
+
@@ -0,0 +1,156 @@
+"""
+Validação vetorizada de CPF/CNPJ.
+
+Reproduz os resultados de pycpfcnpj.cpfcnpj.validate(str(x)), mas opera sobre uma matriz de caracteres
+(uma linha por valor) e calcula os dígitos verificadores com operações de arrays do NumPy.
+"""
+import numpy as np
+import pandas as pd
+
+from pycpfcnpj import cpfcnpj
+
+# Pesos do cálculo dos dígitos verificadores (módulo 11)
+PESOS_CPF = (np.array([10, 9, 8, 7, 6, 5, 4, 3, 2]),
+             np.array([11, 10, 9, 8, 7, 6, 5, 4, 3, 2]))
+PESOS_CNPJ = (np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]),
+              np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]))
+
+# Caracteres de pontuação removidos antes da validação ('.', '-' e '/')
+PONTUACAO = np.array([ord('.'), ord('-'), ord('/')])
+
+# Número de valores processados por vez, limitando o tamanho da matriz de caracteres
+TAMANHO_BLOCO = 65536
+
+# Textos mais longos são reduzidos antes de compor a matriz (ver _reduzir_longos), que tem a largura do maior texto
+LARGURA_MAXIMA = 32
+
+REMOVER_PONTUACAO = str.maketrans('', '', '.-/')
+
+
+def _digito_verificador(valores, pesos):
+    resto = (valores[:, :len(pesos)] @ pesos) % 11
+    return np.where(resto < 2, 0, 11 - resto)
+
+
+def _reduzir_longos(textos):
+    """
+    Substitui os textos com mais de LARGURA_MAXIMA caracteres pelo texto sem pontuação, se ele tiver 11 ou 14
+    caracteres (o que é validado a seguir), ou por um texto vazio, que não pode ser CPF/CNPJ. Assim, colunas de
+    texto livre não alargam a matriz de caracteres.
+
+    :return: Tupla (textos reduzidos, posições dos textos longos, número de dígitos dos textos longos)
+    """
+    comprimentos = np.fromiter(map(len, textos), dtype=np.int64, count=len(textos))
+    longos = np.flatnonzero(comprimentos > LARGURA_MAXIMA)
+    n_digitos = np.zeros(len(longos), dtype=np.int64)
+    if len(longos) == 0:
+        return textos, longos, n_digitos
+
+    textos = np.array(textos, dtype=object)
+    for j, i in enumerate(longos):
+        texto = textos[i]
+        n_digitos[j] = sum(texto.count(d) for d in '0123456789')
+        limpo = texto.translate(REMOVER_PONTUACAO)
+        textos[i] = limpo if len(limpo) in (11, 14) else ''
+    return textos, longos, n_digitos
+
+
+def _validar_bloco(textos):
+    """
+    Valida um bloco de textos.
+
+    :return: Tupla (número de dígitos de cada texto, indicador de CPF/CNPJ válido)
+    """
+    textos, longos, n_digitos_longos = _reduzir_longos(textos)
+
+    # Largura mínima de 14 caracteres, para comportar um CNPJ
+    m = np.asarray(textos, dtype=str)
+    if m.dtype.itemsize < 14 * 4:
+        m = m.astype('U14')
+    m = m.reshape(-1, 1).view(np.uint32)
+    preenchido = m != 0
+
+    is_digito = (m >= ord('0')) & (m <= ord('9'))
+    n_digitos = is_digito.sum(axis=1)
+
+    validos = np.zeros(len(m), dtype=bool)
+
+    # Remove a pontuação e compacta os caracteres restantes à esquerda, preservando a ordem
+    mantido = preenchido & ~np.isin(m, PONTUACAO)
+    n_limpo = mantido.sum(axis=1)
+    n_digitos[longos] = n_digitos_longos
+    candidatos = np.flatnonzero((n_limpo == 11) | (n_limpo == 14))
+    if len(candidatos) == 0:
+        return n_digitos, validos
+
+    ordem = np.argsort(~mantido[candidatos], axis=1, kind='stable')[:, :14]
+    limpo = np.take_along_axis(m[candidatos], ordem, axis=1)
+    n_limpo = n_limpo[candidatos]
+
+    # Caracteres fora do ASCII são delegados à implementação original.
+    # Alguns dígitos unicode (ex.: '²') geram exceção na pycpfcnpj e são considerados inválidos.
+    fora_ascii = ((limpo > 127) & (np.arange(14) < n_limpo[:, None])).any(axis=1)
+    for i in candidatos[fora_ascii]:
+        try:
+            validos[i] = cpfcnpj.validate(textos[i])
+        except ValueError:
+            validos[i] = False
+
+    maiusculo = np.where((limpo >= ord('a')) & (limpo <= ord('z')), limpo - 32, limpo)
+    is_digito = (limpo >= ord('0')) & (limpo <= ord('9'))
+    is_alfanumerico = is_digito | ((maiusculo >= ord('A')) & (maiusculo <= ord('Z')))
+    valores = maiusculo.astype(np.int64) - ord('0')
+
+    for tamanho, pesos in ((11, PESOS_CPF), (14, PESOS_CNPJ)):
+        sel = (n_limpo == tamanho) & ~fora_ascii
+        if not sel.any():
+            continue
+
+        c = limpo[sel, :tamanho]
+        v = valores[sel, :tamanho]
+        d = is_digito[sel, :tamanho]
+
+        ok = is_alfanumerico[sel, :tamanho].all(axis=1)
+        ok &= (c != c[:, :1]).any(axis=1)
+        # Os dígitos verificadores precisam ser numéricos
+        ok &= d[:, -2] & d[:, -1]
+        ok &= _digito_verificador(v, pesos[0]) == v[:, -2]
+        ok &= _digito_verificador(v, pesos[1]) == v[:, -1]
+
+        validos[candidatos[sel]] = ok
+
+    return n_digitos, validos
+
+
+def validar_cpf_cnpj(s):
+    """
+    Valida os valores de uma Series como CPF ou CNPJ.
+
+    Cada valor é convertido com str(x), como em pycpfcnpj.cpfcnpj.validate(str(x)). Valores nulos são inválidos.
+
+    :param s: Series com os valores a serem validados.
+    :return: Tupla de arrays (número de dígitos de cada valor, indicador de CPF/CNPJ válido)
+    """
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Apenas os valores distintos (categorias) são validados
+        n_digitos, validos = validar_cpf_cnpj(pd.Series(s.cat.categories))
+        codigos = s.cat.codes.to_numpy()
+        nulos = codigos < 0
+        return np.where(nulos, 0, n_digitos[codigos]), np.where(nulos, False, validos[codigos])
+
+    nulos = s.isnull().to_numpy()
+    if isinstance(s.dtype, pd.StringDtype):
+        # Os valores já são textos; os nulos resultam em textos sem dígitos
+        textos = s.to_numpy(dtype=object, na_value='')
+    else:
+        textos = np.array([str(x) for x in s], dtype=object)
+
+    n_digitos = np.zeros(len(textos), dtype=np.int64)
+    validos = np.zeros(len(textos), dtype=bool)
+
+    for i in range(0, len(textos), TAMANHO_BLOCO):
+        bloco = textos[i:i + TAMANHO_BLOCO]
+        n_digitos[i:i + TAMANHO_BLOCO], validos[i:i + TAMANHO_BLOCO] = _validar_bloco(bloco)
+
+    validos &= ~nulos
+    return n_digitos, validos
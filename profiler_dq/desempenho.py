@@ -0,0 +1,229 @@
+"""
+Instrumentação do tempo de execução do profiling.
+
+As etapas da execução (obtenção das colunas, contagem de registros, amostragem, funções de análise, consultas SQL,
+validações, etc.) são registradas como spans: intervalos de tempo com nome, atributos, número de registros e bytes
+obtidos e o span pai (a etapa que os contém). O span pai é, por padrão, o último span aberto na mesma thread.
+
+A instrumentação fica desativada até que rastreador.ativar() seja chamado. Desativada, span() não registra nada.
+
+Os spans podem ser exportados como DataFrame (planilha "Desempenho"), como JSON ou no formato OTLP/JSON do
+OpenTelemetry, que pode ser importado por coletores e visualizadores de traces.
+"""
+import itertools
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+import pandas as pd
+
+# Tamanho máximo do texto das consultas SQL registradas nos spans
+TAMANHO_MAXIMO_SQL = 2000
+
+
+class Span:
+    def __init__(self, id, pai, nome, atributos):
+        self.id = id
+        self.pai = pai
+        self.nome = nome
+        self.atributos = atributos
+        self.inicio = time.time()
+        self.duracao = None
+        self.registros = None
+        self.bytes = None
+        self.erro = None
+        self.thread = threading.current_thread().name
+
+    def registrar(self, registros=0, bytes=0):
+        """
+        Acumula o número de registros e de bytes obtidos na etapa.
+        """
+        self.registros = (self.registros or 0) + int(registros)
+        self.bytes = (self.bytes or 0) + int(bytes)
+
+    def registrar_dataframe(self, df):
+        """
+        Acumula os registros do DataFrame e a memória ocupada por ele (aproximação dos bytes transferidos).
+        """
+        self.registrar(len(df), df.memory_usage(index=False, deep=True).sum())
+
+
+class _SpanInativo:
+    """
+    Span retornado quando a instrumentação está desativada.
+    """
+    id = None
+
+    def registrar(self, registros=0, bytes=0):
+        pass
+
+    def registrar_dataframe(self, df):
+        pass
+
+
+SPAN_INATIVO = _SpanInativo()
+
+
+class Rastreador:
+    def __init__(self):
+        self.ativo = False
+        self._spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._trace_id = os.urandom(16).hex()
+
+    def ativar(self):
+        self.ativo = True
+
+    def _pilha(self):
+        if not hasattr(self._local, 'pilha'):
+            self._local.pilha = []
+        return self._local.pilha
+
+    def span_atual(self):
+        """
+        Último span aberto na thread atual. Pode ser passado como pai de spans abertos em outras threads.
+        """
+        pilha = self._pilha() if self.ativo else None
+        return pilha[-1] if pilha else SPAN_INATIVO
+
+    @contextmanager
+    def span(self, nome, pai=None, **atributos):
+        """
+        Registra o tempo de execução do bloco. Exceções são registradas no span e propagadas.
+
+        :param pai: Span pai. Por padrão, o último span aberto na thread atual.
+        :param atributos: Atributos do span (ex.: database, schema, table, funcao, sql).
+        """
+        if not self.ativo:
+            yield SPAN_INATIVO
+            return
+
+        if pai is None:
+            pai = self.span_atual()
+
+        s = Span(next(self._ids), pai.id, nome, atributos)
+        pilha = self._pilha()
+        pilha.append(s)
+        t0 = time.perf_counter()
+        try:
+            yield s
+        except BaseException as e:
+            s.erro = str(e) or type(e).__name__
+            raise
+        finally:
+            s.duracao = time.perf_counter() - t0
+            pilha.pop()
+            with self._lock:
+                self._spans.append(s)
+
+    def registrar_span(self, nome, duracao, pai=None, **atributos):
+        """
+        Registra um span já medido (ex.: tempo acumulado de uma função de análise em vários blocos).
+        """
+        if not self.ativo:
+            return
+
+        if pai is None:
+            pai = self.span_atual()
+
+        s = Span(next(self._ids), pai.id, nome, atributos)
+        s.inicio -= duracao
+        s.duracao = duracao
+        with self._lock:
+            self._spans.append(s)
+
+    def dataframe(self):
+        """
+        :return: DataFrame com um registro por span, na ordem de início.
+        """
+        with self._lock:
+            spans = sorted(self._spans, key=lambda s: (s.inicio, s.id))
+
+        colunas = ['id', 'pai', 'etapa', 'database_name', 'schema_name', 'table_name', 'detalhe',
+                   'inicio', 'duracao', 'registros', 'bytes', 'thread', 'erro']
+        registros = []
+        for s in spans:
+            atributos = dict(s.atributos)
+            registros.append({
+                'id': s.id,
+                'pai': s.pai,
+                'etapa': s.nome,
+                'database_name': atributos.pop('database', None),
+                'schema_name': atributos.pop('schema', None),
+                'table_name': atributos.pop('table', None),
+                'detalhe': '; '.join(f'{k}={v}' for k, v in atributos.items()) or None,
+                'inicio': pd.Timestamp(s.inicio, unit='s'),
+                'duracao': s.duracao,
+                'registros': s.registros,
+                'bytes': s.bytes,
+                'thread': s.thread,
+                'erro': s.erro,
+            })
+
+        return pd.DataFrame(registros, columns=colunas)
+
+    def salvar_json(self, arquivo):
+        """
+        Grava os spans em um arquivo JSON (lista de spans).
+        """
+        df = self.dataframe()
+        df['inicio'] = df['inicio'].astype(str)
+        with open(arquivo, 'w') as f:
+            json.dump(df.astype(object).where(df.notnull(), None).to_dict(orient='records'), f, indent=2, default=str)
+
+    def salvar_otlp(self, arquivo):
+        """
+        Grava os spans no formato OTLP/JSON do OpenTelemetry (uma requisição ExportTraceServiceRequest por linha).
+        """
+        def valor(v):
+            if isinstance(v, bool):
+                return {'boolValue': v}
+            if isinstance(v, int):
+                return {'intValue': str(v)}
+            if isinstance(v, float):
+                return {'doubleValue': v}
+            return {'stringValue': str(v)}
+
+        with self._lock:
+            spans = list(self._spans)
+
+        spans_otlp = []
+        for s in spans:
+            atributos = {f'profiler_dq.{k}': v for k, v in s.atributos.items() if v is not None}
+            atributos['thread.name'] = s.thread
+            if s.registros is not None:
+                atributos['profiler_dq.registros'] = s.registros
+                atributos['profiler_dq.bytes'] = s.bytes
+
+            inicio = int(s.inicio * 1e9)
+            span = {
+                'traceId': self._trace_id,
+                'spanId': f'{s.id:016x}',
+                'name': s.nome,
+                'kind': 1,
+                'startTimeUnixNano': str(inicio),
+                'endTimeUnixNano': str(inicio + int(s.duracao * 1e9)),
+                'attributes': [{'key': k, 'value': valor(v)} for k, v in atributos.items()],
+                'status': {'code': 2, 'message': s.erro} if s.erro else {'code': 1},
+            }
+            if s.pai is not None:
+                span['parentSpanId'] = f'{s.pai:016x}'
+            spans_otlp.append(span)
+
+        requisicao = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'profiler_dq'}}]},
+            'scopeSpans': [{'scope': {'name': 'profiler_dq'}, 'spans': spans_otlp}],
+        }]}
+        with open(arquivo, 'w') as f:
+            f.write(json.dumps(requisicao) + '\n')
+
+
+rastreador = Rastreador()
+span = rastreador.span
+span_atual = rastreador.span_atual
+registrar_span = rastreador.registrar_span
@@ -1,3 +1,5 @@
+import math
+
 from profiler_dq import data_types
 
 
@@ -34,8 +36,18 @@ def nome_tabela(database, schema, table):
         schema = 'dbo'
     return f"[{database}].{schema}.[{table}]"
 
-def lista_colunas(database, schema):
-    return """
+def _filtro_catalogo(schema, tabelas, coluna_schema, coluna_tabela):
+    filtros = []
+    if schema:
+        filtros.append(f"{coluna_schema} = :schema")
+    if tabelas is not None:
+        filtros.append(f"{coluna_tabela} in :tabelas")
+    return "where " + " and ".join(filtros) if filtros else ""
+
+def lista_colunas(database, schema, tabelas=None):
+    filtro = _filtro_catalogo(schema, tabelas, "schema_name(tab.schema_id)", "tab.name")
+
+    return f"""
         select 
             DB_NAME() as database_name,
             schema_name(tab.schema_id) as schema_name,
@@ -55,11 +67,153 @@ def lista_colunas(database, schema):
             on tab.object_id = col.object_id
         left join sys.types as t
             on col.user_type_id = t.user_type_id
+        {filtro}
         order by schema_name,
             table_name, 
             column_id;
     """
 
+def versoes_tabelas(database, schema, tabelas=None):
+    # Data da última alteração (DDL) de cada tabela e view
+    filtro = _filtro_catalogo(schema, tabelas, "schema_name(o.schema_id)", "o.name")
+
+    return f"""
+        select 
+            DB_NAME() as database_name,
+            schema_name(o.schema_id) as schema_name,
+            o.name as table_name,
+            convert(varchar(30), o.modify_date, 126) as versao
+        from (
+            select object_id, schema_id, name, modify_date from sys.tables
+            union all
+            select object_id, schema_id, name, modify_date from sys.views
+        ) as o
+        {filtro}
+        order by schema_name,
+            table_name;
+    """
+
+def estatisticas_registros(database, schema, tabelas=None):
+    # Número de registros mantido pelo catálogo (heap ou índice clusterizado) para todas as tabelas do banco.
+    # Views não possuem partições e por isso não são retornadas.
+    filtro = _filtro_catalogo(schema, tabelas, "schema_name(t.schema_id)", "t.name")
+
+    return f"""
+        select 
+            DB_NAME() as database_name,
+            schema_name(t.schema_id) as schema_name,
+            t.name as table_name,
+            sum(p.rows) as num_registros
+        from sys.tables as t
+        inner join sys.partitions as p
+            on p.object_id = t.object_id
+            and p.index_id in (0, 1)
+        {filtro}
+        group by t.schema_id, t.name
+    """
+
+def estatisticas_colunas(database, schema, tabelas=None):
+    # Estatísticas do otimizador cuja primeira coluna é a coluna analisada (a mais recente, se houver mais de uma).
+    # Os nulos, os distintos, o mínimo e o máximo são obtidos do histograma (sys.dm_db_stats_histogram, disponível 
+    # a partir do SQL Server 2016 SP1 CU2): o primeiro e o último degraus contêm o mínimo e o máximo.
+    # As estatísticas são consideradas desatualizadas se mais de 20% dos registros foram modificados desde a coleta.
+    filtro = _filtro_catalogo(schema, tabelas, "schema_name(t.schema_id)", "t.name")
+
+    return f"""
+        with estatisticas as (
+            select 
+                t.object_id, t.schema_id, t.name as table_name, c.name as column_name, ty.name as data_type,
+                s.stats_id, sp.rows, sp.rows_sampled, sp.last_updated, sp.modification_counter,
+                row_number() over (partition by t.object_id, c.column_id order by sp.last_updated desc) as ordem
+            from sys.tables as t
+            inner join sys.stats as s
+                on s.object_id = t.object_id
+            inner join sys.stats_columns as sc
+                on sc.object_id = s.object_id and sc.stats_id = s.stats_id and sc.stats_column_id = 1
+            inner join sys.columns as c
+                on c.object_id = sc.object_id and c.column_id = sc.column_id
+            left join sys.types as ty
+                on c.user_type_id = ty.user_type_id
+            cross apply sys.dm_db_stats_properties(s.object_id, s.stats_id) as sp
+            {filtro}
+        )
+        select 
+            DB_NAME() as database_name,
+            schema_name(e.schema_id) as schema_name,
+            e.table_name,
+            e.column_name,
+            e.data_type,
+            e.rows as num_registros,
+            e.rows_sampled as tamanho_amostra,
+            h.num_nulls,
+            h.num_distinct,
+            (select top 1 cast(range_high_key as nvarchar(4000)) from sys.dm_db_stats_histogram(e.object_id, e.stats_id)
+                where range_high_key is not null order by step_number) as low_value,
+            (select top 1 cast(range_high_key as nvarchar(4000)) from sys.dm_db_stats_histogram(e.object_id, e.stats_id)
+                where range_high_key is not null order by step_number desc) as high_value,
+            e.last_updated as atualizado_em,
+            case when e.modification_counter > 0.2 * e.rows then 1 else 0 end as desatualizada
+        from estatisticas as e
+        cross apply (
+            select 
+                sum(case when range_high_key is null then equal_rows else 0 end) as num_nulls,
+                sum(case when range_high_key is null then 0 else distinct_range_rows + 1 end) as num_distinct
+            from sys.dm_db_stats_histogram(e.object_id, e.stats_id)
+        ) as h
+        where e.ordem = 1
+    """
+
+def decodificar_valor(data_type, valor):
+    """
+    Converte o mínimo/máximo do histograma (texto) para número, nas colunas numéricas.
+    """
+    if valor is None or MAP_TYPES.get((data_type or '').lower()) not in (data_types.NUMERIC, data_types.FLOAT):
+        return valor
+    try:
+        return int(valor)
+    except ValueError:
+        return float(valor)
+
+def select_colunas(database, schema, table, colunas, filtro):
+    nome_colunas = ", ".join([f'[{x}]' for x in colunas.column_name])
+    where_clause = f"WHERE {filtro}" if filtro else ""
+
+    return f'select {nome_colunas} FROM {nome_tabela(database, schema, table)} {where_clause}'
+
+def agregacao(database, schema, table, colunas, filtro):
+    # Estatísticas básicas de todas as colunas calculadas pelo próprio SGBD, em um único registro.
+    # text/ntext não podem ser comparados e bit não aceita MIN/MAX, por isso são convertidos.
+    expressoes = ['count_big(*) as n']
+    for i, (coluna, data_type) in enumerate(zip(colunas.column_name, colunas.data_type.str.lower())):
+        c = f'[{coluna}]'
+        if data_type in ('text', 'ntext'):
+            c = f'cast({c} as nvarchar(4000))'
+        elif data_type == 'bit':
+            c = f'cast({c} as int)'
+        expressoes.append(f'count_big({c}) as n_{i}, count_big(distinct {c}) as d_{i}, min({c}) as min_{i}, max({c}) as max_{i}')
+
+    where_clause = f"WHERE {filtro}" if filtro else ""
+
+    return f'select {", ".join(expressoes)} FROM {nome_tabela(database, schema, table)} {where_clause}'
+
+def orfaos(database, schema, table, coluna, database_ref, schema_ref, table_ref, coluna_ref):
+    # Número de valores não nulos da coluna (r_0) e dos que não existem na coluna referenciada (órfãos, r_1), usado na
+    # confirmação dos relacionamentos (ver profiler_dq.relacionamentos)
+    tabela = nome_tabela(database, schema, table)
+    return select_escalares([
+        f'(select count_big([{coluna}]) FROM {tabela})',
+        f"""(select count_big(*) FROM {tabela} f WHERE f.[{coluna}] is not null and not exists (
+                select 1 FROM {nome_tabela(database_ref, schema_ref, table_ref)} r WHERE r.[{coluna_ref}] = f.[{coluna}]))""",
+    ])
+
+def select_escalares(expressoes):
+    return 'select ' + ', '.join(f'{e} as r_{i}' for i, e in enumerate(expressoes))
+
+def limitar_tempo(conexao, segundos):
+    # Timeout do pyodbc (SQL_ATTR_QUERY_TIMEOUT), em segundos inteiros: o driver cancela a consulta no servidor.
+    # 0 remove o limite.
+    conexao.timeout = 0 if segundos is None else max(1, math.ceil(segundos))
+
 def sample(database, schema, table, colunas, num_registros, sample_size, filtro):
     table_type = colunas.table_type.iloc[0]
 
@@ -68,10 +222,64 @@ def sample(database, schema, table, colunas, num_registros, sample_size, filtro)
     where_clause = f"WHERE {filtro}" if filtro else ""
 
     if num_registros <= sample_size:
-        return f'select {nome_colunas} FROM {nome_tabela(database, schema, table)} {where_clause}'
+        return select_colunas(database, schema, table, colunas, filtro)
     else:
         if table_type == 'TABLE':
             return f'select {nome_colunas} FROM {nome_tabela(database, schema, table)} TABLESAMPLE({sample_size} rows) {where_clause}'
         elif table_type == 'VIEW':
             # Se for VIEW, não é possível usar TABLESAMPLE. Embora seja bem mais lento, o NEWID() pode ser usado para embaralhar os registros.
             return f'select top {sample_size} {nome_colunas} FROM {nome_tabela(database, schema, table)} {where_clause} order by NEWID()'
+
+def amostragem(database, schema, table, colunas, num_registros, sample_size, filtro, estrategia=None, estrato=None):
+    """
+    Consulta da amostra segundo a estratégia de amostragem (ver profiler_dq.ambientes.ESTRATEGIAS_AMOSTRAGEM).
+
+    :return: Tupla (sql, estratégia usada), ou None se a estratégia não for suportada.
+    """
+    table_type = colunas.table_type.iloc[0]
+    nome_colunas = ", ".join([f'[{x}]' for x in colunas.column_name])
+    where_clause = f"WHERE {filtro}" if filtro else ""
+    tabela = nome_tabela(database, schema, table)
+
+    if estrategia is None:
+        # TABLESAMPLE seleciona páginas inteiras da tabela (amostragem por blocos)
+        if num_registros <= sample_size:
+            estrategia_usada = 'completa'
+        else:
+            estrategia_usada = 'block' if table_type == 'TABLE' else 'random'
+        return sample(database, schema, table, colunas, num_registros, sample_size, filtro), estrategia_usada
+
+    if estrategia == 'first-n':
+        return f'select top {sample_size} {nome_colunas} FROM {tabela} {where_clause}', 'first-n'
+
+    if num_registros <= sample_size and estrategia != 'stratified':
+        return select_colunas(database, schema, table, colunas, filtro), 'completa'
+
+    if estrategia == 'stratified' and estrato in set(colunas.column_name):
+        # COUNT_BIG (bigint) evita o overflow de n_estrato * sample_size, que com COUNT (int) excede 2^31 em
+        # tabelas com alguns milhões de registros
+        return (f"""select {nome_colunas} FROM (
+                    select {nome_colunas}, 
+                        ROW_NUMBER() OVER (PARTITION BY [{estrato}] ORDER BY NEWID()) as rn,
+                        COUNT_BIG(*) OVER (PARTITION BY [{estrato}]) as n_estrato,
+                        COUNT_BIG(*) OVER () as n_total
+                    FROM {tabela} {where_clause}) x
+                 WHERE rn <= (case when n_estrato * {sample_size} / n_total < 1 then 1 else n_estrato * {sample_size} / n_total end)""", 
+                'stratified')
+
+    # Fração da tabela a ser lida, com uma margem para que a amostra alcance sample_size registros
+    p = min(100.0, sample_size * 110 / num_registros)
+
+    if estrategia in ('random', 'stratified'):
+        # Sorteio independente de cada registro (Bernoulli), sem ordenar a tabela. Apenas os registros sorteados
+        # (cerca de 1.1 * sample_size) são embaralhados antes do TOP, que, sem ORDER BY, manteria os primeiros
+        # registros na ordem de leitura (ex.: da chave do índice clusterizado). O CHECKSUM é convertido para bigint
+        # antes do ABS, que geraria overflow para o menor valor int
+        condicao = f"ABS(CAST(CHECKSUM(NEWID()) AS bigint)) % 1000000 < {int(p * 10000)}"
+        condicao = f"{condicao} AND ({filtro})" if filtro else condicao
+        return f'select top {sample_size} {nome_colunas} FROM {tabela} WHERE {condicao} order by NEWID()', 'random'
+
+    if estrategia == 'block' and table_type == 'TABLE':
+        return f'select top {sample_size} {nome_colunas} FROM {tabela} TABLESAMPLE SYSTEM ({p:.4f} PERCENT) {where_clause}', 'block'
+
+    return None
@@ -1,3 +1,8 @@
+import math
+
+from datetime import datetime
+from decimal import Decimal
+
 from profiler_dq import data_types
 
 MAP_TYPES = {
@@ -11,8 +16,16 @@ MAP_TYPES = {
 def nome_tabela(database, schema, table):
     return f"{database}.{table}"
 
-def lista_colunas(database, schema):
-    filtro = f"where col.owner = '{database}'" if database else ""
+def _filtro_catalogo(database, tabelas, coluna_owner, coluna_tabela):
+    filtros = []
+    if database:
+        filtros.append(f"{coluna_owner} = :database")
+    if tabelas is not None:
+        filtros.append(f"{coluna_tabela} in :tabelas")
+    return "where " + " and ".join(filtros) if filtros else ""
+
+def lista_colunas(database, schema, tabelas=None):
+    filtro = _filtro_catalogo(database, tabelas, "col.owner", "col.table_name")
     
     return f"""
         select 
@@ -57,9 +70,155 @@ def lista_colunas(database, schema):
         ) x
         order by database_name, schema_name, table_name, column_id, column_name
 """
+
+def versoes_tabelas(database, schema, tabelas=None):
+    # Data do último DDL da tabela e da última coleta de estatísticas, que atualiza as estatísticas
+    # das colunas (num_distinct, num_nulls, etc.) retornadas por lista_colunas
+    filtro = _filtro_catalogo(database, tabelas, "t.owner", "t.table_name")
+
+    return f"""
+        select 
+            t.owner as database_name,
+            NULL as schema_name,
+            t.table_name,
+            to_char(o.last_ddl_time, 'YYYY-MM-DD HH24:MI:SS') || '/' || 
+                to_char(t.last_analyzed, 'YYYY-MM-DD HH24:MI:SS') as versao
+        from sys.all_tables t
+        inner join sys.all_objects o on o.owner = t.owner 
+                                     and o.object_name = t.table_name
+                                     and o.object_type = 'TABLE'
+        {filtro}
+        order by database_name, table_name
+"""
     
     
 
+def estatisticas_registros(database, schema, tabelas=None):
+    # Número de registros coletado pelo otimizador (DBMS_STATS). Tabelas sem estatísticas são ignoradas.
+    filtro = _filtro_catalogo(database, tabelas, "owner", "table_name")
+    filtro = f"{filtro} and num_rows is not null" if filtro else "where num_rows is not null"
+
+    return f"""
+        select 
+            owner as database_name,
+            NULL as schema_name,
+            table_name,
+            num_rows as num_registros
+        from sys.all_tables
+        {filtro}
+"""
+
+def estatisticas_colunas(database, schema, tabelas=None):
+    # Estatísticas das colunas coletadas pelo otimizador (DBMS_STATS). low_value e high_value estão no formato
+    # interno do Oracle (RAW) e são convertidos por decodificar_valor.
+    filtro = _filtro_catalogo(database, tabelas, "col.owner", "col.table_name")
+
+    return f"""
+        select 
+            col.owner as database_name,
+            NULL as schema_name,
+            col.table_name,
+            col.column_name,
+            col.data_type,
+            t.num_rows as num_registros,
+            col.sample_size as tamanho_amostra,
+            col.num_nulls,
+            col.num_distinct,
+            col.low_value,
+            col.high_value,
+            col.last_analyzed as atualizado_em,
+            case when s.stale_stats = 'YES' then 1 else 0 end as desatualizada
+        from sys.all_tab_columns col
+        inner join sys.all_tables t on col.owner = t.owner 
+                                      and col.table_name = t.table_name
+        left join sys.all_tab_statistics s on s.owner = t.owner
+                                           and s.table_name = t.table_name
+                                           and s.object_type = 'TABLE'
+        {filtro}
+"""
+
+def _decodificar_number(b):
+    # Formato interno do NUMBER: expoente (base 100) no primeiro byte e dígitos (base 100) nos demais.
+    # Números negativos têm o expoente e os dígitos complementados e terminam com o byte 102.
+    if b == b'\x80':
+        return Decimal(0)
+    if b[0] & 0x80:
+        expoente = b[0] - 193
+        digitos = [x - 1 for x in b[1:]]
+        sinal = 1
+    else:
+        expoente = 62 - b[0]
+        digitos = [101 - x for x in b[1:] if x != 102]
+        sinal = -1
+    valor = sum(Decimal(d) * Decimal(100) ** (expoente - i) for i, d in enumerate(digitos))
+    return sinal * valor
+
+def decodificar_valor(data_type, valor):
+    """
+    Converte low_value/high_value (RAW) das estatísticas para o valor da coluna. Tipos não suportados retornam None.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        valor = bytes.fromhex(valor)
+
+    data_type = (data_type or '').upper()
+    try:
+        if data_type in ('NUMBER', 'FLOAT', 'INTEGER'):
+            return _decodificar_number(valor)
+        if data_type == 'DATE' or data_type.startswith('TIMESTAMP'):
+            # Século e ano (em excesso de 100), mês, dia, hora, minuto e segundo (em excesso de 1)
+            s, a, m, d, h, mi, se = valor[:7]
+            return datetime((s - 100) * 100 + a - 100, m, d, h - 1, mi - 1, se - 1)
+        if data_type in ('VARCHAR2', 'CHAR', 'NVARCHAR2', 'NCHAR'):
+            codificacao = 'utf-16-be' if data_type.startswith('N') else 'utf-8'
+            return valor.decode(codificacao, errors='replace')
+    except Exception:
+        pass
+    return None
+
+def select_colunas(database, schema, table, colunas, filtro):
+    nome_colunas = ", ".join(colunas.column_name)
+    where_clause = f"WHERE {filtro}" if filtro else ""
+
+    return f'select {nome_colunas} FROM {nome_tabela(database, schema, table)} {where_clause}'
+
+def agregacao(database, schema, table, colunas, filtro):
+    # Estatísticas básicas de todas as colunas calculadas pelo próprio SGBD, em um único registro.
+    # Colunas LOB/LONG não podem ser comparadas, por isso apenas os valores não nulos são contados.
+    expressoes = ['count(*) as n']
+    for i, (coluna, data_type) in enumerate(zip(colunas.column_name, colunas.data_type.str.upper())):
+        if data_type in ('CLOB', 'NCLOB', 'BLOB', 'LONG', 'LONG RAW'):
+            expressoes.append(f'count({coluna}) as n_{i}, NULL as d_{i}, NULL as min_{i}, NULL as max_{i}')
+        else:
+            expressoes.append(f'count({coluna}) as n_{i}, count(distinct {coluna}) as d_{i}, min({coluna}) as min_{i}, max({coluna}) as max_{i}')
+
+    where_clause = f"WHERE {filtro}" if filtro else ""
+
+    return f'select {", ".join(expressoes)} FROM {nome_tabela(database, schema, table)} {where_clause}'
+
+def orfaos(database, schema, table, coluna, database_ref, schema_ref, table_ref, coluna_ref):
+    # Número de valores não nulos da coluna (r_0) e dos que não existem na coluna referenciada (órfãos, r_1), usado na
+    # confirmação dos relacionamentos (ver profiler_dq.relacionamentos)
+    tabela = nome_tabela(database, schema, table)
+    return select_escalares([
+        f'(select count({coluna}) FROM {tabela})',
+        f"""(select count(*) FROM {tabela} f WHERE f.{coluna} is not null and not exists (
+                select 1 FROM {nome_tabela(database_ref, schema_ref, table_ref)} r WHERE r.{coluna_ref} = f.{coluna}))""",
+    ])
+
+def select_escalares(expressoes):
+    return 'select ' + ', '.join(f'{e} as r_{i}' for i, e in enumerate(expressoes)) + ' from dual'
+
+def limitar_tempo(conexao, segundos):
+    # Timeout de cada ida e volta ao servidor, em milissegundos (call_timeout no oracledb, callTimeout no 
+    # cx_Oracle): o driver interrompe a chamada em andamento. 0 remove o limite.
+    milissegundos = 0 if segundos is None else max(1, math.ceil(segundos * 1000))
+    if hasattr(conexao, 'call_timeout'):
+        conexao.call_timeout = milissegundos
+    elif hasattr(conexao, 'callTimeout'):
+        conexao.callTimeout = milissegundos
+
 def sample(database, schema, table, colunas, num_registros, sample_size, filtro):
     sample_p = sample_size*100/num_registros
     sample_p = max(0.1, sample_p)
@@ -72,4 +231,40 @@ def sample(database, schema, table, colunas, num_registros, sample_size, filtro)
     nome_colunas = ", ".join(colunas.column_name)
     where_clause = f"WHERE {filtro}" if filtro else ""
     
-    return f'select {nome_colunas} FROM {database}.{table} {where_clause} {sample}'    
\ No newline at end of file
+    # A cláusula SAMPLE deve seguir o nome da tabela, antes do WHERE
+    return f'select {nome_colunas} FROM {database}.{table} {sample} {where_clause}'
+
+def amostragem(database, schema, table, colunas, num_registros, sample_size, filtro, estrategia=None, estrato=None):
+    """
+    Consulta da amostra segundo a estratégia de amostragem (ver profiler_dq.ambientes.ESTRATEGIAS_AMOSTRAGEM).
+
+    :return: Tupla (sql, estratégia usada), ou None se a estratégia não for suportada.
+    """
+    nome_colunas = ", ".join(colunas.column_name)
+    where_clause = f"WHERE {filtro}" if filtro else ""
+    tabela = nome_tabela(database, schema, table)
+
+    if estrategia == 'first-n':
+        condicao = f"({filtro}) AND ROWNUM <= {sample_size}" if filtro else f"ROWNUM <= {sample_size}"
+        return f'select {nome_colunas} FROM {tabela} WHERE {condicao}', 'first-n'
+
+    if estrategia == 'stratified' and estrato in set(colunas.column_name):
+        return (f"""select {nome_colunas} FROM (
+                    select {nome_colunas}, 
+                        ROW_NUMBER() OVER (PARTITION BY {estrato} ORDER BY dbms_random.value) as rn,
+                        COUNT(*) OVER (PARTITION BY {estrato}) as n_estrato,
+                        COUNT(*) OVER () as n_total
+                    FROM {tabela} {where_clause}) x
+                 WHERE rn <= greatest(1, n_estrato * {sample_size} / n_total)""", 'stratified')
+
+    if estrategia in (None, 'random', 'stratified'):
+        estrategia_usada = 'random' if num_registros > sample_size else 'completa'
+        return sample(database, schema, table, colunas, num_registros, sample_size, filtro), estrategia_usada
+
+    if estrategia == 'block':
+        if num_registros <= sample_size:
+            return select_colunas(database, schema, table, colunas, filtro), 'completa'
+        p = max(0.1, sample_size*100/num_registros)
+        return f'select {nome_colunas} FROM {tabela} SAMPLE BLOCK({p:.2f}) {where_clause}', 'block'
+
+    return None
@@ -1,3 +1,5 @@
+import time
+
 from profiler_dq import data_types
 
 
@@ -13,12 +15,16 @@ MAP_TYPES = {
 def nome_tabela(database, schema, table):
     return f"main.{table}"
 
-def lista_colunas(database, schema):
-    return """
+def lista_colunas(database, schema, tabelas=None):
+    filtro = "AND name IN :tabelas" if tabelas is not None else ""
+
+    return f"""
     WITH all_tables AS (
         SELECT name AS table_name 
         FROM sqlite_master 
         WHERE type = 'table'
+        AND name NOT LIKE 'sqlite/_%' ESCAPE '/'
+        {filtro}
     )
     SELECT 
     '' as database_name,
@@ -33,6 +39,115 @@ def lista_colunas(database, schema):
     ORDER BY table_name, column_name
     """    
 
+def versoes_tabelas(database, schema, tabelas=None):
+    # O SQLite não registra a data de alteração das tabelas. O DDL da tabela (coluna sql da sqlite_master), 
+    # atualizado por ALTER TABLE, é usado como versão.
+    filtro = "AND name IN :tabelas" if tabelas is not None else ""
+
+    return f"""
+    SELECT 
+    '' as database_name,
+    '' as schema_name,
+    name as table_name,
+    sql as versao
+    FROM sqlite_master
+    WHERE type = 'table'
+    AND name NOT LIKE 'sqlite/_%' ESCAPE '/'
+    {filtro}
+    ORDER BY table_name
+    """
+
+def possui_estatisticas(database, schema, tabelas=None):
+    # A tabela sqlite_stat1, consultada pelas estatísticas abaixo, só existe após a execução de ANALYZE.
+    return """
+    SELECT count(*) as possui
+    FROM sqlite_master
+    WHERE type = 'table'
+    AND name = 'sqlite_stat1'
+    """
+
+def estatisticas_registros(database, schema, tabelas=None):
+    # O primeiro inteiro da coluna stat da sqlite_stat1 é o número de registros da tabela.
+    filtro = "WHERE tbl IN :tabelas" if tabelas is not None else ""
+
+    return f"""
+    SELECT 
+    '' as database_name,
+    '' as schema_name,
+    tbl as table_name,
+    max(cast(stat as integer)) as num_registros
+    FROM sqlite_stat1
+    {filtro}
+    GROUP BY tbl
+    """
+
+def estatisticas_colunas(database, schema, tabelas=None):
+    # A sqlite_stat1 (criada pelo ANALYZE) registra, para cada índice, o número de registros da tabela seguido 
+    # da média de registros por valor da primeira coluna do índice, da qual é estimado o número de distintos.
+    # Apenas as colunas indexadas têm estatísticas. Nulos, mínimo e máximo não são registrados.
+    filtro = "AND m.name IN :tabelas" if tabelas is not None else ""
+
+    return f"""
+    SELECT 
+    '' as database_name,
+    '' as schema_name,
+    m.name as table_name,
+    ii.name as column_name,
+    NULL as data_type,
+    max(cast(s.stat as integer)) as num_registros,
+    NULL as tamanho_amostra,
+    NULL as num_nulls,
+    max(round(cast(s.stat as integer) / cast(substr(s.stat, instr(s.stat, ' ') + 1) as real))) as num_distinct,
+    NULL as low_value,
+    NULL as high_value,
+    0 as desatualizada
+    FROM sqlite_master m, pragma_index_list(m.name) il, pragma_index_info(il.name) ii, sqlite_stat1 s
+    WHERE m.type = 'table'
+    AND ii.seqno = 0
+    AND s.tbl = m.name
+    AND s.idx = il.name
+    {filtro}
+    GROUP BY m.name, ii.name
+    """
+
+def select_colunas(database, schema, table, colunas, filtro):
+    nome_colunas = ", ".join(colunas.column_name)
+    where_clause = f"WHERE {filtro}" if filtro else ""
+
+    return f"select {nome_colunas} FROM {table} {where_clause}"
+
+def agregacao(database, schema, table, colunas, filtro):
+    # Estatísticas básicas de todas as colunas calculadas pelo próprio SGBD, em um único registro.
+    expressoes = ['count(*) as n']
+    for i, coluna in enumerate(colunas.column_name):
+        expressoes.append(f'count({coluna}) as n_{i}, count(distinct {coluna}) as d_{i}, min({coluna}) as min_{i}, max({coluna}) as max_{i}')
+
+    where_clause = f"WHERE {filtro}" if filtro else ""
+
+    return f"select {', '.join(expressoes)} FROM {table} {where_clause}"
+
+def orfaos(database, schema, table, coluna, database_ref, schema_ref, table_ref, coluna_ref):
+    # Número de valores não nulos da coluna (r_0) e dos que não existem na coluna referenciada (órfãos, r_1), usado na
+    # confirmação dos relacionamentos (ver profiler_dq.relacionamentos)
+    tabela = nome_tabela(database, schema, table)
+    return select_escalares([
+        f'(select count({coluna}) FROM {tabela})',
+        f"""(select count(*) FROM {tabela} f WHERE f.{coluna} is not null and not exists (
+                select 1 FROM {nome_tabela(database_ref, schema_ref, table_ref)} r WHERE r.{coluna_ref} = f.{coluna}))""",
+    ])
+
+def select_escalares(expressoes):
+    return 'select ' + ', '.join(f'{e} as r_{i}' for i, e in enumerate(expressoes))
+
+def limitar_tempo(conexao, segundos):
+    # O sqlite3 não tem timeout de consulta: o progress handler é chamado a cada N instruções da máquina virtual
+    # do SQLite e interrompe a consulta (OperationalError: interrupted) quando o prazo é ultrapassado.
+    if segundos is None:
+        conexao.set_progress_handler(None, 0)
+    else:
+        limite = time.monotonic() + segundos
+        conexao.set_progress_handler(lambda: time.monotonic() > limite, 10000)
+
 def sample(database, schema, table, colunas, num_registros, sample_size, filtro):
     print(colunas.table_type.iloc[0])
 
@@ -40,4 +155,47 @@ def sample(database, schema, table, colunas, num_registros, sample_size, filtro)
 
     where_clause = f"WHERE {filtro}" if filtro else ""
 
-    return f"select {nome_colunas} FROM {table} {where_clause} ORDER BY RANDOM() LIMIT {sample_size}"
\ No newline at end of file
+    return f"select {nome_colunas} FROM {table} {where_clause} ORDER BY RANDOM() LIMIT {sample_size}"
+
+def amostragem(database, schema, table, colunas, num_registros, sample_size, filtro, estrategia=None, estrato=None):
+    """
+    Consulta da amostra segundo a estratégia de amostragem (ver profiler_dq.ambientes.ESTRATEGIAS_AMOSTRAGEM).
+
+    :return: Tupla (sql, estratégia usada), ou None se a estratégia não for suportada.
+    """
+    nome_colunas = ", ".join(colunas.column_name)
+    where_clause = f"WHERE {filtro}" if filtro else ""
+    and_filtro = f"AND ({filtro})" if filtro else ""
+
+    if estrategia == 'stratified' and estrato in set(colunas.column_name):
+        return (f"""select {nome_colunas} FROM (
+                    select {nome_colunas}, 
+                        ROW_NUMBER() OVER (PARTITION BY {estrato} ORDER BY RANDOM()) as rn,
+                        COUNT(*) OVER (PARTITION BY {estrato}) as n_estrato,
+                        COUNT(*) OVER () as n_total
+                    FROM {table} {where_clause}) x
+                 WHERE rn <= max(1, n_estrato * {sample_size} / n_total)""", 'stratified')
+
+    if estrategia == 'first-n':
+        return f"select {nome_colunas} FROM {table} {where_clause} LIMIT {sample_size}", 'first-n'
+
+    if estrategia == 'block':
+        # Registros contíguos (na ordem do rowid) a partir de uma posição aleatória
+        inicio = f"(SELECT min(rowid) + abs(random()) % max(1, max(rowid) - min(rowid) - {sample_size} + 1) FROM {table})"
+        return f"select {nome_colunas} FROM {table} WHERE rowid >= {inicio} {and_filtro} ORDER BY rowid LIMIT {sample_size}", 'block'
+
+    if estrategia == 'rowid':
+        # Sorteio de rowids entre o menor e o maior, buscados pelo índice da tabela. São sorteados o dobro de rowids, 
+        # para compensar os rowids inexistentes ou que não atendem ao filtro.
+        return (f"""WITH RECURSIVE sorteio(i, id) AS (
+                    SELECT 0, NULL
+                    UNION ALL
+                    SELECT i + 1, (SELECT min(rowid) FROM {table}) + abs(random()) % (SELECT max(rowid) - min(rowid) + 1 FROM {table})
+                    FROM sorteio WHERE i < {2 * sample_size}
+                 )
+                 select {nome_colunas} FROM {table} WHERE rowid IN (SELECT id FROM sorteio) {and_filtro} LIMIT {sample_size}""", 'rowid')
+
+    if estrategia in (None, 'random', 'stratified'):
+        return sample(database, schema, table, colunas, num_registros, sample_size, filtro), 'random'
+
+    return None
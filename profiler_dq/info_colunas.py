@@ -1,196 +1,851 @@
 import os
+import queue
 import re
+import threading
+import time
+import numpy as np
 import pandas as pd
 
-from pycpfcnpj import cpfcnpj
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from functools import partial
 
+from . import chaves
+from . import compactacao
 from . import data_types
+from .acumuladores import (AcumuladorUnicidade, AcumuladorPercentis, AcumuladorModa, AcumuladorProporcao,
+                           AcumuladorRegistrosDistintos, AcumuladorUnicidadeHLL, AcumuladorPercentisKLL,
+                           AcumuladorRegistrosDistintosHLL, OrcamentoHashes)
+from .sketches import HyperLogLog, KLL
+from . import desempenho
+from . import nomes
+from . import intervalos
+from .primitivas import Primitivas
+from .processos import AnalisadorProcessos
 
 funcoes_analises = []
+acumuladores_analises = {}
+metricas_numericas = set()
 DIR_VALIDACAO = 'validacao'
 
-# Decorator que indica o nome das colunas retornadas por cada função
-def analise_colunas(*args):
+# Tamanho padrão dos blocos lidos na varredura completa das tabelas
+CHUNKSIZE_FULL_SCAN = 100000
+
+# Número máximo de amostras obtidas aguardando a análise
+TAMANHO_FILA_AMOSTRAS = 4
+
+# Intervalo (s) de espera pela fila de amostras, após o qual a interrupção do processamento é verificada
+INTERVALO_FILA = 0.1
+
+# Redução do tamanho da amostra das tabelas que excedem o prazo (ver analise_colunas_sample)
+FATOR_AMOSTRA_REDUZIDA = 10
+
+# Decorator que indica o nome das colunas retornadas por cada função.
+# O acumulador (opcional) permite calcular as mesmas métricas sobre a amostra lida em blocos.
+# As colunas indicadas em numericas (ou todas, se True) são sempre numéricas; as demais podem conter valores de 
+# tipos variados (ex.: o mínimo de cada coluna) e são mantidas como object.
+# As primitivas (ver profiler_dq.primitivas) são calculadas uma única vez por coluna e repassadas à função em p.
+def analise_colunas(*args, acumulador=None, numericas=(), primitivas=()):
     def inner(func):
+        desconhecidas = set(primitivas) - set(Primitivas.NOMES)
+        if desconhecidas:
+            raise ValueError(f"Primitivas desconhecidas em {func.__name__}: {sorted(desconhecidas)}")
         funcoes_analises.append((args, func))
+        if acumulador is not None:
+            acumuladores_analises[func] = acumulador
+        metricas_numericas.update(args if numericas is True else numericas)
         return func
     return inner 
 
-@analise_colunas('missing','unique','chave_candidata')
-def analise_conteudo_unicidade(nome_coluna, tipo_coluna, s):
-    l = len(s)
+@analise_colunas('missing','unique','chave_candidata', acumulador=AcumuladorUnicidade,
+                 numericas=('missing', 'unique'), primitivas=('nulos', 'contagens'))
+def analise_conteudo_unicidade(nome_coluna, tipo_coluna, s, p=None):
+    p = p or Primitivas(s)
+    l = p.l
     if l == 0: return (None, None, None)
-    n_nunique = s.nunique()
-    n_missing = s.isnull().sum() 
+    n_nunique = p.n_distintos
+    n_missing = p.n_nulos
     is_chave = (n_nunique == l - n_missing) and (n_nunique > 0)
     
     return (n_missing/l, n_nunique/l, ('-', 'SIM')[int(is_chave)])
 
-@analise_colunas('min', 'P01', 'P25', 'P50', 'P75', 'P99', 'max')
-def analise_conteudo_percentiles(nome_coluna, tipo_coluna, s):
-    # Convert StringDtype (PyArrow-backed) to object dtype if needed
-    if isinstance(s.dtype, pd.StringDtype):
-        s = s.astype('object')
+@analise_colunas('min', 'P01', 'P25', 'P50', 'P75', 'P99', 'max', acumulador=AcumuladorPercentis,
+                 primitivas=('contagens',))
+def analise_conteudo_percentiles(nome_coluna, tipo_coluna, s, p=None):
+    qs = [0, 0.01, 0.25, 0.5, 0.75, 0.99, 1]
+    # Textos (StringDtype ou categóricos) são ordenados pelos valores distintos, sem conversão para objetos Python
+    if isinstance(s.dtype, (pd.StringDtype, pd.CategoricalDtype)):
+        return (p or Primitivas(s)).percentis(qs)
     
-    p = s.quantile([0, 0.01, 0.25, 0.5, 0.75, 0.99, 1], interpolation='nearest')
+    p = s.quantile(qs, interpolation='nearest')
     return p.tolist()
     
-@analise_colunas('moda')
-def analise_conteudo_moda(nome_coluna, tipo_coluna, s):
-    l = len(s)
-    if l == 0: return None
+@analise_colunas('moda', acumulador=AcumuladorModa, primitivas=('contagens',))
+def analise_conteudo_moda(nome_coluna, tipo_coluna, s, p=None):
+    p = p or Primitivas(s)
+    if p.l == 0: return None
 
-    p = s.mode(dropna=True)
-    
-    if len(p):
-        return (p[0],)  
-    else:
-        return (None,)
+    return (p.moda(),)
 
 
-@analise_colunas('CPF/CNPJ', 'CPF', 'CNPJ')
-def analise_conteudo_cpf_cnpj(nome_coluna, tipo_coluna, s):
+@analise_colunas('CPF/CNPJ', 'CPF', 'CNPJ', acumulador=partial(AcumuladorProporcao, ignora_nulos=True),
+                 numericas=True, primitivas=('nulos', 'contagens', 'cpf_cnpj'))
+def analise_conteudo_cpf_cnpj(nome_coluna, tipo_coluna, s, p=None):
     if tipo_coluna not in (data_types.STRING, data_types.NUMERIC): return None
 
-    info = []
-    
-    l = len(s)-s.isnull().sum()
+    p = p or Primitivas(s)
+    l = p.n_validos
     if l == 0: return None
     
-    r = re.compile(r'[^0-9]')
-    cpf_cnpj_digitos = s.apply(lambda x : len(r.sub('', str(x))))
+    # Validação dos valores distintos, ponderada pelas suas frequências
+    cpf_cnpj_digitos, cpf_cnpj_validos = p.cpf_cnpj
     is_11 = cpf_cnpj_digitos==11
     is_14 = cpf_cnpj_digitos==14
-    c_cpf = sum(is_11)
-    c_cnpj = sum(is_14)
 
-    cpf_cnpj_validos = s.apply(lambda x : cpfcnpj.validate(str(x)) if x else False)
-    c_cpf_cnpj_validos = sum(cpf_cnpj_validos)
-    c_cpf_validos = sum(cpf_cnpj_validos & is_11)
-    c_cnpj_validos = sum(cpf_cnpj_validos & is_14)
+    c_cpf_cnpj_validos = p.contar(cpf_cnpj_validos)
+    c_cpf_validos = p.contar(cpf_cnpj_validos & is_11)
+    c_cnpj_validos = p.contar(cpf_cnpj_validos & is_14)
 
     return c_cpf_cnpj_validos/l, c_cpf_validos/l, c_cnpj_validos/l    
     
-@analise_colunas('hash')
-def analise_conteudo_hash(nome_coluna, tipo_coluna, s):
-    if (tipo_coluna != data_types.STRING) or s.dtype != 'object':
+@analise_colunas('hash', acumulador=AcumuladorProporcao, numericas=True, primitivas=('contagens',))
+def analise_conteudo_hash(nome_coluna, tipo_coluna, s, p=None):
+    if (tipo_coluna != data_types.STRING) or not compactacao.e_texto(s):
         return None
     
-    m = s.str.match(r'\s*[0-9a-fA-F]{32,}\s*$').astype(bool).sum()
-
-    l = len(s)
+    p = p or Primitivas(s)
+    l = p.l
     if l == 0: return None
 
+    m = p.contar(p.distintos.str.match(r'\s*[0-9a-fA-F]{32,}\s*$', na=False))
+
     return (m/l,)
     
-@analise_colunas('prenome')
-def analise_conteudo_prenome(nome_coluna, tipo_coluna, s):
-    if tipo_coluna != data_types.STRING or s.dtype != 'object':
+@analise_colunas('prenome', acumulador=AcumuladorProporcao, numericas=True, primitivas=('contagens',))
+def analise_conteudo_prenome(nome_coluna, tipo_coluna, s, p=None):
+    if tipo_coluna != data_types.STRING or not compactacao.e_texto(s):
         return None
 
-    l = len(s)
+    p = p or Primitivas(s)
+    l = p.l
     if l == 0: return None
 
-    # https://censo2010.ibge.gov.br/nomes/#/ranking
-    prenomes_masculinos_comuns = ['jose', 'joao', 'antonio', 'francisco', 'carlos', 'paulo', 'pedro', 
-                                  'lucas', 'luiz', 'marcos', 'luis', 'gabriel', 'rafael', 'daniel', 'marcelo', 
-                                  'bruno', 'eduardo', 'felipe', 'raimundo', 'rodrigo']
+    # Textos com ao menos um prenome ou sobrenome comum (ver profiler_dq.nomes)
+    m = p.contar(nomes.casador_nomes().contem_nome(p.distintos))
 
-    prenomes_femininos_comuns = ['maria', 'ana', 'francisca', 'antonia', 'adriana', 'juliana', 'marcia',
-                                  'fernanda', 'patricia', 'aline', 'sandra', 'camila', 'amanda', 'bruna', 'jessica',
-                                  'leticia', 'julia', 'luciana', 'vanessa', 'mariana']
+    return (m/l,)
     
-    sobrenomes_comuns = ['silva', 'santos', 'oliveira', 'souza', 'sousa', 'lima', 'costa', 'pereira', 'rodrigues',
-                            'almeida', 'ferreira', 'araujo', 'carvalho', 'gomes', 'martins', 'barbosa',
-                            'alves', 'melo', 'ribeiro', 'moura', 'cavalcante', 'castro', 'cardoso', 'fernandes',
-                            'torres', 'ribeiro', 'mendes', 'barros', 'freitas', 'barros', 'nunes', 'peixoto', 'junior']
 
-    nomes_columns = set(prenomes_masculinos_comuns + prenomes_femininos_comuns + sobrenomes_comuns)
+def analisar_coluna(nome_coluna, tipo_coluna, s):
+    """
+    Executa todas as funções de análise sobre uma coluna. As primitivas declaradas pelas funções são calculadas
+    uma única vez e compartilhadas entre elas (ver profiler_dq.primitivas).
+
+    :return: Tupla (dicionário nome da função -> resultado, dicionário nome da função -> tempo em segundos).
+             O tempo de cada primitiva é contado na primeira função que a utiliza.
+    """
+    tempos = {}
+    p = Primitivas(s)
+
+    resultados = {}
+    for _, analise_f in funcoes_analises:
+        t0 = time.perf_counter()
+        x = analise_f(nome_coluna, tipo_coluna, s, p)
+        assert x is None or isinstance(x, (tuple, list)), f"Erro na função {analise_f.__name__} para a coluna {nome_coluna}. O retorno deve ser uma tupla."
+        resultados[analise_f.__name__] = x
+        tempos[analise_f.__name__] = time.perf_counter() - t0
+
+    return resultados, tempos
+
 
-    # Remove acentos
-    s = s.str.lower().str.normalize('NFKD').str.encode('ascii', errors='ignore').str.decode('utf-8')
+def _atribuir_metricas(v, calcular):
+    """
+    Preenche as métricas de todas as funções de análise, uma coluna do DataFrame para cada métrica.
+    O tipo de cada coluna (float ou object) não depende dos valores, para que seja o mesmo em todas as tabelas.
 
-    tokens = s.str.split()#.explode()
-    # Identifica tokens que possui ao menos um nome comum
-    tokens = tokens.apply(lambda x: any(t in nomes_columns for t in x) if isinstance(x, (list, tuple)) else False)
+    :param calcular: Função (analise_f, nome_coluna) que retorna a tupla de métricas da coluna ou None.
+    """
+    metricas = [c for analise_colunas, _ in funcoes_analises for c in analise_colunas]
+    valores = np.full((len(v), len(metricas)), None, dtype=object)
+
+    for i, c in enumerate(v.column_name):
+        inicio = 0
+        for analise_colunas, analise_f in funcoes_analises:
+            x = calcular(analise_f, c)
+            if x is not None:
+                valores[i, inicio:inicio + len(analise_colunas)] = list(x)
+            inicio += len(analise_colunas)
+
+    for j, c in enumerate(metricas):
+        v[c] = pd.Series(valores[:, j], index=v.index, dtype=float if c in metricas_numericas else object)
+
+
+def analise_tabela_sample(ambiente, database, schema, table, v, num_registros, sample_size, filtro=None, chunksize=None,
+                          full_scan=False, erro_unique=0.01, erro_percentis=0.01, pushdown=False, ao_amostrar=None,
+                          adaptativa=None):
+    """
+    Obtém a amostra de uma tabela e executa todas as funções de análise sobre as suas colunas.
+
+    :param chunksize: Se informado, a amostra é lida em blocos de chunksize registros, cujas métricas
+                      são acumuladas, sem manter a amostra inteira em memória.
+    :param full_scan: Se True, todos os registros da tabela são lidos em blocos. Os distintos e os percentis
+                      são estimados por sketches (HyperLogLog e KLL) com os erros erro_unique e erro_percentis, e as
+                      métricas estimadas de cada coluna são indicadas em metricas_estimadas.
+    :param pushdown: Se True, as métricas básicas são calculadas pelo SGBD (ver analise_tabela_agregacao).
+    :param ao_amostrar: Função chamada com a amostra obtida (DataFrame), quando a amostra é lida de uma só vez.
+    :param adaptativa: Se informado, dicionário com os parâmetros da amostragem adaptativa (amostra_inicial, precisao
+                       e confianca, ver analise_tabela_adaptativa). sample_size é o tamanho máximo da amostra.
+    :return: DataFrame com uma linha por coluna da tabela, contendo as métricas calculadas.
+    """
+    if pushdown:
+        return analise_tabela_agregacao(ambiente, database, schema, table, v, num_registros, filtro)
+
+    if full_scan:
+        acumuladores = acumuladores_full_scan(erro_unique, erro_percentis)
+        v = analise_tabela_blocos(ambiente, database, schema, table, v, num_registros, None, filtro,
+                                  chunksize or CHUNKSIZE_FULL_SCAN, acumuladores=acumuladores,
+                                  registros_distintos=AcumuladorRegistrosDistintosHLL(erro_unique, _tipos_colunas(v)))
+        v = confirmar_chaves_estimadas(ambiente, database, schema, table, v, filtro)
+        v['erro_unique'] = HyperLogLog(erro_unique).erro
+        v['erro_percentis'] = KLL(erro_percentis).erro
+        return v
+
+    if chunksize:
+        return analise_tabela_blocos(ambiente, database, schema, table, v, num_registros, sample_size, filtro, chunksize)
+
+    if adaptativa:
+        return analise_tabela_adaptativa(ambiente, database, schema, table, v, num_registros, sample_size, filtro,
+                                         ao_amostrar=ao_amostrar, **adaptativa)
+
+    df_sample = obter_amostra_tabela(ambiente, database, schema, table, v, num_registros, sample_size, filtro)
+
+    if ao_amostrar is not None:
+        ao_amostrar(df_sample)
+
+    return analise_amostra(database, schema, table, v, num_registros, df_sample, filtro)
+
+
+def obter_amostra_tabela(ambiente, database, schema, table, v, num_registros, sample_size, filtro=None):
+    """
+    Obtém, de uma só vez, a amostra das colunas analisáveis (exceto BLOB) de uma tabela.
+    """
+    print(f'Obtendo Sample {database}.{schema}.{table}')
+    colunas_selecionadas = v[v.tipo != data_types.BLOB]
+    df_sample = ambiente.obter_amostra(database, schema, table, colunas_selecionadas, num_registros, sample_size, filtro)
     
+    print(df_sample.shape)
+    return df_sample
+
+
+def analise_amostra(database, schema, table, v, num_registros, df_sample, filtro=None, analisador_processos=None):
+    """
+    Executa todas as funções de análise sobre as colunas da amostra de uma tabela.
+
+    :param analisador_processos: Se informado (profiler_dq.processos.AnalisadorProcessos), as funções de análise 
+                                 são executadas no pool de processos.
 
-    return (tokens.sum()/l,)
+    :return: DataFrame com uma linha por coluna da tabela, contendo as métricas calculadas.
+    """
+    print(f'Analisando Sample {database}.{schema}.{table}')
+    v = v.copy()
+
+    colunas_tipos = v.set_index('column_name').tipo
     
+    v['num_registros'] = num_registros
+    v['tamanho_amostra'] = df_sample.shape[0]
+    v['registros_unique'] = chaves.registros_distintos(df_sample)
+    v['filtro'] = filtro
+    v['amostragem'] = df_sample.attrs.get('amostragem')
+
+    if analisador_processos is not None:
+        with desempenho.span('analise_processos', colunas=len(df_sample.columns)):
+            resultados, tempos = analisador_processos.analisar(df_sample, colunas_tipos)
+            for nome_funcao, duracao in tempos.items():
+                desempenho.registrar_span('funcao_analise_processos', duracao, funcao=nome_funcao)
+
+    else:
+        # Colunas analisadas uma a uma: as primitivas de cada coluna são liberadas antes da próxima
+        resultados, tempos = {}, {}
+        with desempenho.span('analise_colunas', colunas=len(df_sample.columns)):
+            for c in df_sample.columns:
+                if c not in colunas_tipos.index:
+                    continue
+                r, t = analisar_coluna(c, colunas_tipos.loc[c], df_sample[c])
+                resultados.update(((nome_funcao, c), x) for nome_funcao, x in r.items())
+                for nome_funcao, duracao in t.items():
+                    tempos[nome_funcao] = tempos.get(nome_funcao, 0) + duracao
+            for nome_funcao, duracao in tempos.items():
+                desempenho.registrar_span('funcao_analise', duracao, funcao=nome_funcao)
+
+    def calcular(analise_f, c):
+        if c not in df_sample.columns:
+            return None
+        return resultados.get((analise_f.__name__, c))
+
+    _atribuir_metricas(v, calcular)
+
+    return v
+
+
+def analise_tabela_adaptativa(ambiente, database, schema, table, v, num_registros, sample_size, filtro=None,
+                              amostra_inicial=1000, precisao=0.01, confianca=0.95, ao_amostrar=None):
+    """
+    Amostragem adaptativa: obtém amostras de tamanho crescente (amostra_inicial, dobrando a cada rodada, até 
+    sample_size) e para quando os intervalos de confiança das proporções (missing, unique, CPF/CNPJ) e dos percentis
+    têm semiamplitude de no máximo precisao (ver profiler_dq.intervalos), ou quando a amostra alcança a tabela inteira.
+    Cada rodada usa uma nova amostra, de modo que o custo total é no máximo o dobro do da última amostra.
+
+    :return: DataFrame de métricas da última amostra, com as semiamplitudes dos intervalos (colunas ic_*) e as colunas
+             rodadas_amostra e amostra_convergiu.
+    """
+    tamanho = min(amostra_inicial, sample_size)
+    rodadas = 0
+    while True:
+        rodadas += 1
+        df_sample = obter_amostra_tabela(ambiente, database, schema, table, v, num_registros, tamanho, filtro)
+        resultado = analise_amostra(database, schema, table, v, num_registros, df_sample, filtro)
+        with desempenho.span('intervalos_confianca', database=database, schema=schema, table=table, tamanho=len(df_sample)):
+            ic, convergiu = intervalos.intervalos_confianca(resultado, df_sample, num_registros, confianca, precisao)
+
+        # A amostra contém todos os registros da tabela: não há o que ampliar
+        completa = len(df_sample) < tamanho or (num_registros is not None and 0 <= num_registros <= len(df_sample))
+        print(f'Amostra adaptativa {database}.{schema}.{table}: {len(df_sample)} registros, '
+              f'{"tabela completa" if completa else "convergiu" if convergiu else "não convergiu"}')
+        if convergiu or completa or tamanho >= sample_size:
+            break
+        tamanho = min(2 * tamanho, sample_size)
+
+    if ao_amostrar is not None:
+        ao_amostrar(df_sample)
+
+    for c in ic.columns:
+        resultado[c] = ic[c]
+    resultado['rodadas_amostra'] = rodadas
+    resultado['amostra_convergiu'] = ('-', 'SIM')[int(convergiu or completa)]
+
+    return resultado
+
+
+def analise_tabela_agregacao(ambiente, database, schema, table, v, num_registros, filtro=None):
+    """
+    Calcula as métricas básicas (missing, unique, chave_candidata, min e max) de todos os registros da tabela
+    com uma única consulta de agregação no SGBD, sem transferir registros. As demais métricas não são calculadas.
+    """
+    print(f'Analisando por agregação no SGBD {database}.{schema}.{table}')
+    v = v.copy()
+
+    colunas_selecionadas = v[v.tipo != data_types.BLOB]
+    agregacao = ambiente.obter_agregacao(database, schema, table, colunas_selecionadas, filtro)
+    indices = {c: i for i, c in enumerate(colunas_selecionadas.column_name)}
+    l = int(agregacao['n'])
+
+    v['num_registros'] = num_registros
+    v['tamanho_amostra'] = l
+    v['registros_unique'] = None
+    v['filtro'] = filtro
+    v['amostragem'] = 'completa'
+
+    def calcular(analise_f, c):
+        if c not in indices:
+            return None
+        i = indices[c]
+
+        if analise_f is analise_conteudo_unicidade:
+            if l == 0: return (None, None, None)
+            n_validos = int(agregacao[f'n_{i}'])
+            n_nunique = agregacao[f'd_{i}']
+            if pd.isnull(n_nunique): return ((l - n_validos)/l, None, None)
+            is_chave = (n_nunique == n_validos) and (n_nunique > 0)
+            return ((l - n_validos)/l, n_nunique/l, ('-', 'SIM')[int(is_chave)])
+
+        if analise_f is analise_conteudo_percentiles:
+            return [agregacao[f'min_{i}'], None, None, None, None, None, agregacao[f'max_{i}']]
+
+        return None
 
-def analise_colunas_sample(ambiente, sample_size, filtro=None):
+    _atribuir_metricas(v, calcular)
+
+    return v
+
+
+def confirmar_chaves_estimadas(ambiente, database, schema, table, v, filtro=None):
+    """
+    Confirma no SGBD, com uma consulta de agregação exata (ver Ambiente.obter_agregacao) sobre as colunas indicadas
+    como chave candidata a partir da estimativa de distintos (--full-scan), que elas são de fato chaves. O unique
+    dessas colunas passa a ser exato (e deixa de constar em metricas_estimadas). Se a consulta falhar, as colunas não são indicadas como chave candidata.
+    """
+    candidatas = v[v.chave_candidata == 'SIM']
+    if len(candidatas) == 0:
+        return v
+
+    v = v.copy()
+    try:
+        agregacao = ambiente.obter_agregacao(database, schema, table, candidatas, filtro)
+    except Exception as e:
+        print(f'ERRO: Falha ao confirmar as chaves candidatas de {database}.{schema}.{table}: {e}')
+        v.loc[candidatas.index, 'chave_candidata'] = '-'
+        return v
+
+    l = int(agregacao['n'])
+    for i, indice in enumerate(candidatas.index):
+        n_validos = int(agregacao[f'n_{i}'])
+        n_nunique = agregacao[f'd_{i}']
+        is_chave = not pd.isnull(n_nunique) and n_nunique == n_validos and n_nunique > 0
+        if l and not pd.isnull(n_nunique):
+            v.at[indice, 'unique'] = n_nunique / l
+            if 'metricas_estimadas' in v.columns:
+                estimadas = [m for m in v.at[indice, 'metricas_estimadas'].split(', ') if m != 'unique']
+                v.at[indice, 'metricas_estimadas'] = ', '.join(estimadas) or '-'
+        v.at[indice, 'chave_candidata'] = ('-', 'SIM')[int(is_chave)]
+
+    return v
+
+
+def estatisticas_completas(v, df_estatisticas):
+    """
+    Indica se as estatísticas do SGBD cobrem todas as colunas analisáveis (exceto BLOB) da tabela e estão atualizadas.
+    """
+    if df_estatisticas is None or len(df_estatisticas) == 0:
+        return False
+    if df_estatisticas.desatualizada.fillna(0).astype(int).any() or df_estatisticas.num_registros.isnull().any():
+        return False
+    com_distintos = set(df_estatisticas.column_name[df_estatisticas.num_distinct.notnull()])
+    return set(v.column_name[v.tipo != data_types.BLOB]) <= com_distintos
+
+
+def analise_tabela_estatisticas(database, schema, table, v, num_registros, df_estatisticas, filtro=None):
+    """
+    Preenche as métricas básicas (missing, unique, chave_candidata, min e max) a partir das estatísticas mantidas
+    pelo otimizador do SGBD, sem consultar a tabela. As demais métricas não são calculadas.
+
+    :param df_estatisticas: Estatísticas das colunas da tabela (ver Ambiente.obter_estatisticas_colunas).
+    """
+    print(f'Analisando pelas estatísticas do SGBD {database}.{schema}.{table}')
+    v = v.copy()
+
+    estatisticas = df_estatisticas.drop_duplicates('column_name').set_index('column_name')
+    l = int(estatisticas.num_registros.max())
+
+    v['num_registros'] = num_registros
+    v['tamanho_amostra'] = estatisticas.tamanho_amostra.max() if estatisticas.tamanho_amostra.notnull().any() else None
+    v['registros_unique'] = None
+    v['filtro'] = filtro
+    v['amostragem'] = None
+
+    def calcular(analise_f, c):
+        if c not in estatisticas.index:
+            return None
+        e = estatisticas.loc[c]
+
+        if analise_f is analise_conteudo_unicidade:
+            if l == 0: return (None, None, None)
+            n_missing = None if pd.isnull(e.num_nulls) else int(e.num_nulls)
+            n_nunique = int(e.num_distinct)
+            is_chave = (n_nunique == l - (n_missing or 0)) and (n_nunique > 0)
+            return (None if n_missing is None else n_missing/l, n_nunique/l, ('-', 'SIM')[int(is_chave)])
+
+        if analise_f is analise_conteudo_percentiles:
+            return [e.low_value, None, None, None, None, None, e.high_value]
+
+        return None
+
+    _atribuir_metricas(v, calcular)
+
+    return v
+
+
+def acumuladores_full_scan(erro_unique, erro_percentis):
+    """
+    Acumuladores usados na varredura completa: os distintos e os percentis são estimados por sketches de memória constante.
+    """
+    acumuladores = dict(acumuladores_analises)
+    acumuladores[analise_conteudo_unicidade] = partial(AcumuladorUnicidadeHLL, erro=erro_unique)
+    acumuladores[analise_conteudo_percentiles] = partial(AcumuladorPercentisKLL, erro=erro_percentis)
+    return acumuladores
+
+
+def acumuladores_blocos(orcamento):
+    """
+    Acumuladores usados na leitura da amostra em blocos: os hashes dos distintos de todas as colunas compartilham
+    o orçamento da tabela (OrcamentoHashes).
+    """
+    acumuladores = dict(acumuladores_analises)
+    acumuladores[analise_conteudo_unicidade] = partial(AcumuladorUnicidade, orcamento=orcamento)
+    return acumuladores
+
+
+def _tipos_colunas(v):
+    return dict(zip(v.column_name, v.tipo))
+
+
+def analise_tabela_blocos(ambiente, database, schema, table, v, num_registros, sample_size, filtro, chunksize,
+                          acumuladores=None, registros_distintos=None):
+    """
+    Obtém a amostra de uma tabela em blocos e acumula as métricas de cada bloco, com memória limitada.
+    Funções de análise sem acumulador não são calculadas neste modo. A coluna metricas_estimadas indica as métricas
+    de cada coluna que são estimadas (ex.: unique, P01-P99, moda), ou "-" se todas são exatas.
+
+    :param sample_size: Tamanho da amostra. Se None, todos os registros da tabela são lidos.
+    :param acumuladores: Dicionário função de análise -> acumulador. Por padrão, os acumuladores registrados em 
+                         analise_colunas, com um único orçamento de hashes para a tabela (ver acumuladores_blocos).
+    :param registros_distintos: Acumulador do número de registros distintos. Por padrão, contagem exata por hashes,
+                                no mesmo orçamento das colunas.
+    """
+    orcamento = OrcamentoHashes()
+    if acumuladores is None:
+        acumuladores = acumuladores_blocos(orcamento)
+    if registros_distintos is None:
+        registros_distintos = AcumuladorRegistrosDistintos(_tipos_colunas(v), orcamento)
+
+    print(f'Analisando {"Sample" if sample_size else "todos os registros"} em blocos de {chunksize} registros {database}.{schema}.{table}')
+    v = v.copy()
+
+    colunas_selecionadas = v[v.tipo != data_types.BLOB]
+    colunas_tipos = v.set_index('column_name').tipo
+
+    acumuladores_colunas = {}
+    for c in colunas_selecionadas.column_name:
+        for _, analise_f in funcoes_analises:
+            if analise_f in acumuladores:
+                acumuladores_colunas[analise_f, c] = acumuladores[analise_f](c, colunas_tipos.loc[c], analise_f)
+
+    tamanho_amostra = 0
+    colunas_amostra = set()
+    estrategia = None
+    # Tempo acumulado de cada função de análise em todos os blocos
+    tempos = {}
+
+    for df_bloco in ambiente.obter_amostra_blocos(database, schema, table, colunas_selecionadas, num_registros, sample_size, filtro, chunksize):
+        tamanho_amostra += df_bloco.shape[0]
+        estrategia = df_bloco.attrs.get('amostragem', estrategia)
+        registros_distintos.atualizar(df_bloco)
+        colunas_amostra.update(df_bloco.columns)
+
+        for (analise_f, c), acumulador in acumuladores_colunas.items():
+            if c in df_bloco.columns:
+                inicio = time.perf_counter()
+                acumulador.atualizar(df_bloco[c])
+                tempos[analise_f] = tempos.get(analise_f, 0) + time.perf_counter() - inicio
+
+    for analise_f, duracao in tempos.items():
+        desempenho.registrar_span('acumular_blocos', duracao, funcao=analise_f.__name__)
+
+    print((tamanho_amostra, len(colunas_amostra)))
+
+    v['num_registros'] = num_registros
+    v['tamanho_amostra'] = tamanho_amostra
+    v['registros_unique'] = registros_distintos.resultado()
+    v['filtro'] = filtro
+    v['amostragem'] = estrategia
+
+    def calcular(analise_f, c):
+        if c not in colunas_amostra or (analise_f, c) not in acumuladores_colunas:
+            return None
+        return acumuladores_colunas[analise_f, c].resultado()
+
+    _atribuir_metricas(v, calcular)
+
+    # Métricas estimadas (sketches, reservatório ou resumo truncado) em vez de calculadas sobre todos os registros lidos
+    estimadas = {c: [] for c in v.column_name}
+    for (analise_f, c), acumulador in acumuladores_colunas.items():
+        if c in colunas_amostra and acumulador.ESTIMADA and not acumulador.exato:
+            estimadas[c].append(acumulador.ESTIMADA)
+    if not registros_distintos.exato:
+        for c in estimadas:
+            estimadas[c].append('registros_unique')
+    v['metricas_estimadas'] = [', '.join(estimadas[c]) or '-' for c in v.column_name]
+
+    return v
+
+
+def _pipeline(tarefas, produzir, consumir, produtores, consumidores, tamanho_fila):
+    """
+    Executa as tarefas em duas etapas sobrepostas: produzir(t) é executada em produtores threads e o seu 
+    resultado é colocado em uma fila limitada a tamanho_fila itens, consumida por consumidores threads que 
+    executam consumir(t, x). Quando a fila está cheia, os produtores aguardam (backpressure), limitando o 
+    número de resultados intermediários (ex.: amostras) em memória.
+
+    As funções produzir e consumir não devem gerar exceções.
+
+    :return: Gerador dos resultados de consumir, na ordem das tarefas, à medida que são concluídos.
+    """
+    fila = queue.Queue(maxsize=max(1, tamanho_fila))
+    resultados = {}
+    condicao = threading.Condition()
+    parar = threading.Event()
+
+    def produzir_tarefa(i, t):
+        if parar.is_set():
+            return
+        item = (i, t, produzir(t))
+        # A espera pela fila é feita em intervalos, para que os produtores sejam liberados em caso de interrupção
+        while not parar.is_set():
+            try:
+                fila.put(item, timeout=INTERVALO_FILA)
+                return
+            except queue.Full:
+                pass
+
+    def consumir_fila():
+        while True:
+            try:
+                i, t, x = fila.get(timeout=INTERVALO_FILA)
+            except queue.Empty:
+                if parar.is_set():
+                    return
+                continue
+            if parar.is_set():
+                continue
+            r = consumir(t, x)
+            with condicao:
+                resultados[i] = r
+                condicao.notify_all()
+
+    with ThreadPoolExecutor(max_workers=produtores) as executor_produtores, \
+            ThreadPoolExecutor(max_workers=consumidores) as executor_consumidores:
+        for _ in range(consumidores):
+            executor_consumidores.submit(consumir_fila)
+        futuros = [executor_produtores.submit(produzir_tarefa, i, t) for i, t in enumerate(tarefas)]
+
+        try:
+            for i in range(len(tarefas)):
+                with condicao:
+                    while i not in resultados:
+                        condicao.wait()
+                    r = resultados.pop(i)
+                yield r
+        finally:
+            # Em caso de interrupção, as tarefas ainda não iniciadas são descartadas, os produtores em espera
+            # são liberados e os resultados intermediários já produzidos são removidos da fila
+            parar.set()
+            for f in futuros:
+                f.cancel()
+            while True:
+                try:
+                    fila.get_nowait()
+                except queue.Empty:
+                    break
+
+
+def analise_colunas_sample(ambiente, sample_size, filtro=None, workers=1, chunksize=None,
+                           full_scan=False, erro_unique=0.01, erro_percentis=0.01, pushdown=False, cache=None,
+                           consumidores_amostra=(), ao_concluir_tabela=None, analisadores=1, processos=None,
+                           estatisticas=False, adaptativa=None, checkpoint=None, tempo_tabela=None):
+    """
+    Analisa a amostra de todas as tabelas do ambiente.
+
+    As amostras são obtidas por workers threads e colocadas em uma fila limitada, consumida por analisadores 
+    threads que executam as funções de análise. Assim, as consultas ao SGBD são executadas enquanto as amostras
+    anteriores são analisadas. Nos modos em que a amostra é lida em blocos (chunksize, full_scan) ou agregada 
+    no SGBD (pushdown), a análise de cada tabela é feita inteiramente pelos workers.
+
+    :param workers: Número de tabelas amostradas simultaneamente. Cada tabela ocupa uma conexão do pool do ambiente.
+    :param chunksize: Se informado, lê as amostras em blocos de chunksize registros (ver analise_tabela_sample).
+    :param full_scan: Se True, analisa todos os registros das tabelas (ver analise_tabela_sample).
+    :param pushdown: Se True, calcula as métricas básicas no SGBD, sem transferir registros (ver analise_tabela_agregacao).
+    :param cache: Cache persistente (profiler_dq.cache.Cache) para reaproveitar resultados de execuções anteriores.
+    :param consumidores_amostra: Objetos com o método registrar_amostra(database, schema, table, df_sample), que 
+                                 recebem a amostra de cada tabela (ex.: profiler_dq.ambientes.AmbienteLocal).
+    :param ao_concluir_tabela: Função chamada com o DataFrame de métricas de cada tabela, à medida que as tabelas
+                               são concluídas (na ordem das tabelas).
+    :param analisadores: Número de amostras analisadas simultaneamente.
+    :param processos: Se informado, as funções de análise das amostras lidas de uma só vez são executadas em um 
+                      pool com esse número de processos (ver profiler_dq.processos).
+    :param estatisticas: Se True, as métricas básicas das tabelas com estatísticas completas e atualizadas no SGBD
+                         são obtidas das estatísticas (ver analise_tabela_estatisticas). As demais tabelas são 
+                         analisadas normalmente. A coluna origem_metricas indica a origem das métricas de cada tabela.
+    :param adaptativa: Se informado, dicionário com os parâmetros da amostragem adaptativa (ver analise_tabela_adaptativa).
+    :param checkpoint: Diário da execução (profiler_dq.checkpoint.Checkpoint). As tabelas já concluídas no diário não
+                       são analisadas novamente e as demais são gravadas à medida que são concluídas.
+    :param tempo_tabela: Se informado, prazo em segundos das consultas de cada tabela (ver Ambiente.prazo). Se o
+                         prazo ou o tempo máximo das consultas do ambiente (timeout_sql) for excedido, a tabela é
+                         analisada sobre uma amostra FATOR_AMOSTRA_REDUZIDA vezes menor, obtida com a amostragem
+                         block ou first-n (ver Ambiente.obter_amostra_reduzida), e a coluna tempo_excedido é marcada.
+    :return: DataFrame com as métricas de todas as colunas, na mesma ordem das tabelas do ambiente.
+    """
     
     df_tabelas = ambiente.obter_tabelas()
     df_colunas = ambiente.obter_colunas()
     
-    info = []
     df_tabelas_num_registros = df_tabelas.set_index(['database_name', 'schema_name', 'table_name'])['num_registros']
     df_tabelas_groupby = df_colunas.groupby(['database_name', 'schema_name', 'table_name'])
     print(df_tabelas.shape)
     
-    info_analise_colunas = []
+    tarefas = []
     
     for (database, schema, table),v in df_tabelas_groupby:
-        print(f'Analisando Sample {database}.{schema}.{table}')
-        #print(v)
         num_registros = df_tabelas_num_registros.loc[database, schema, table]
         if num_registros == -1:
-            print('Unknown')
+            print(f'Unknown {database}.{schema}.{table}')
             continue
-        
-        colunas_selecionadas = v[v.tipo != data_types.BLOB]
-        colunas_tipos = v.set_index('column_name').tipo
-        df_sample = ambiente.obter_amostra(database, schema, table, colunas_selecionadas, num_registros, sample_size, filtro)
-        
-        print(df_sample.shape)
-        
-        v['num_registros'] = num_registros
-        v['tamanho_amostra'] = df_sample.shape[0]
-        v['registros_unique'] = df_sample.drop_duplicates().shape[0]
-        v['filtro'] = filtro
-
-        
-        for analise_colunas, analise_f in funcoes_analises:
-            #print(analise_colunas, analise_f)
-            info = [[] for _ in analise_colunas]
-            for c in v.column_name:
-                x = None
-                if c in df_sample.columns:
-                    x = analise_f(c, colunas_tipos.loc[c], df_sample[c])
-                    assert(isinstance(x, tuple), f"Erro na função {analise_f.__name__} para a coluna {c}. O retorno deve ser uma tupla.")
-                        
-                    
-                if x is None:
-                    x = [None]*len(analise_colunas)
-
-                for i,j in enumerate(x):
-                    info[i].append(j)
-            
-            for c,i in zip(analise_colunas, info):
-                v[c] = i
-        
-        info_analise_colunas.append(v)
-        
-        #df = pd.read_sql(SQL, engine)
-        
 
-    
-    #df = df_tabelas.copy()
-    #df['count'] = info
-    #return df
-    
+        tarefas.append((ambiente, database, schema, table, v, num_registros))
+
+    analisar = partial(analise_tabela_sample, sample_size=sample_size, filtro=filtro, chunksize=chunksize,
+                       full_scan=full_scan, erro_unique=erro_unique, erro_percentis=erro_percentis,
+                       pushdown=pushdown, adaptativa=adaptativa)
+    # Parâmetros que alteram o resultado da análise compõem a chave do cache
+    parametros = dict(sample_size=sample_size, filtro=filtro, full_scan=full_scan, erro_unique=erro_unique,
+                      erro_percentis=erro_percentis, pushdown=pushdown,
+                      nomes=nomes.casador_nomes().assinatura, amostragem=ambiente.amostragem, adaptativa=adaptativa)
+
+    if estatisticas and ambiente.obter_estatisticas_colunas() is None:
+        print("WARNING: Estatísticas das colunas indisponíveis no SGBD. Todas as tabelas serão analisadas.")
+
+    # Apenas a amostra lida de uma só vez pode ser analisada separadamente da consulta
+    amostra_separada = not (chunksize or full_scan or pushdown or adaptativa)
+
+    # O número de workers é limitado pelo tamanho do pool de conexões do ambiente
+    workers = max(1, min(workers, ambiente.conexoes))
+
+    # As tabelas amostradas e analisadas em outras threads são registradas como etapas da análise atual
+    span_analise = desempenho.span_atual()
+
+    limitado = tempo_tabela is not None or ambiente.timeout_sql is not None
+
+    def obter_resultado(t):
+        """
+        Etapa de produzir sujeita ao prazo da tabela: resultado do checkpoint, das estatísticas ou do cache, a amostra
+        ou, se a amostra não puder ser separada, o resultado da análise.
+        """
+        ambiente, database, schema, table, v, num_registros = t
+        if checkpoint is not None:
+            registrado = checkpoint.obter_tabela(database, schema, table)
+            if registrado is not None:
+                print(f'Usando resultado do checkpoint para {database}.{schema}.{table}')
+                return ('checkpoint', registrado[0], registrado[1], None)
+
+        if estatisticas:
+            df_estatisticas = ambiente.estatisticas_colunas_tabela(database, schema, table)
+            if estatisticas_completas(v, df_estatisticas):
+                resultado = analise_tabela_estatisticas(database, schema, table, v, num_registros, df_estatisticas, filtro)
+                return ('estatistica', resultado, None, None)
+
+        chave = None
+        if cache is not None:
+            chave = cache.chave_tabela(ambiente.nome, database, schema, table, v, parametros)
+            cached = cache.obter_tabela(chave, num_registros)
+            if cached is not None:
+                print(f'Usando resultado do cache para {database}.{schema}.{table}')
+                return ('cache', cached[0], cached[1], chave)
+
+        if amostra_separada:
+            df_sample = obter_amostra_tabela(ambiente, database, schema, table, v, num_registros, sample_size, filtro)
+            return ('amostra', df_sample, df_sample, chave)
+
+        amostras = []
+        resultado = analisar(ambiente, database, schema, table, v, num_registros, ao_amostrar=amostras.append)
+        return ('analise', resultado, amostras[0] if amostras else None, chave)
+
+    def produzir(t):
+        """
+        Obtém o resultado do cache, a amostra da tabela ou, se a amostra não puder ser separada, o resultado da análise.
+        Se a tabela exceder o prazo, obtém a amostra reduzida, que é analisada pelos consumidores.
+
+        :return: Tupla (origem, resultado ou amostra, amostra, chave do cache), em que origem é 'checkpoint',
+                 'estatistica', 'cache', 'amostra', 'analise', 'reduzida' (amostra reduzida após exceder o prazo)
+                 ou 'erro'.
+        """
+        ambiente, database, schema, table, v, num_registros = t
+        with desempenho.span('amostrar_tabela', pai=span_analise, database=database, schema=schema, table=table):
+            try:
+                with ambiente.prazo(tempo_tabela):
+                    return obter_resultado(t)
+            except TimeoutError as e:
+                print(f'WARNING: Tempo excedido na tabela {database}.{schema}.{table}: {e}. Usando amostra reduzida.')
+                try:
+                    with ambiente.prazo(tempo_tabela):
+                        colunas_selecionadas = v[v.tipo != data_types.BLOB]
+                        tamanho = max(1, (sample_size or CHUNKSIZE_FULL_SCAN) // FATOR_AMOSTRA_REDUZIDA)
+                        df_sample = ambiente.obter_amostra_reduzida(database, schema, table, colunas_selecionadas,
+                                                                    num_registros, tamanho, filtro)
+                    return ('reduzida', df_sample, df_sample, None)
+                except Exception as e:
+                    print(f'ERRO: Falha ao analisar a tabela {database}.{schema}.{table}: {e}')
+                    return ('erro', None, None, None)
+            except Exception as e:
+                print(f'ERRO: Falha ao analisar a tabela {database}.{schema}.{table}: {e}')
+                return ('erro', None, None, None)
+
+    def consumir(t, x):
+        """
+        Analisa a amostra (se ainda não analisada), grava o resultado no cache e repassa a amostra aos consumidores_amostra.
+        """
+        ambiente, database, schema, table, v, num_registros = t
+        origem, resultado, df_sample, chave = x
+        if origem == 'erro':
+            return None
+
+        with desempenho.span('analise_tabela', pai=span_analise, database=database, schema=schema, table=table):
+            try:
+                if origem in ('amostra', 'reduzida'):
+                    resultado = analise_amostra(database, schema, table, v, num_registros, df_sample, filtro,
+                                                analisador_processos)
+
+                if df_sample is not None:
+                    for consumidor in consumidores_amostra:
+                        consumidor.registrar_amostra(database, schema, table, df_sample)
+
+                # O resultado da amostra reduzida não é gravado no cache, para que a tabela seja analisada novamente
+                if cache is not None and origem not in ('checkpoint', 'cache', 'estatistica', 'reduzida'):
+                    cache.salvar_tabela(chave, ambiente.nome, database, schema, table, num_registros, resultado, df_sample)
+
+                if estatisticas and origem != 'checkpoint':
+                    resultado['origem_metricas'] = 'estatistica' if origem == 'estatistica' else 'amostra'
+
+                if limitado and origem != 'checkpoint':
+                    resultado['tempo_excedido'] = 'SIM' if origem == 'reduzida' else '-'
+
+                if checkpoint is not None and origem != 'checkpoint':
+                    # A amostra só é necessária para retomar as validações sobre as amostras (consumidores_amostra)
+                    checkpoint.salvar_tabela(database, schema, table, resultado,
+                                             df_sample if consumidores_amostra else None)
+
+                return resultado
+            except Exception as e:
+                print(f'ERRO: Falha ao analisar a tabela {database}.{schema}.{table}: {e}')
+                return None
+
+    analisador_processos = AnalisadorProcessos(processos) if processos and amostra_separada else None
+
+    info_analise_colunas = []
+    try:
+        # O pipeline é encerrado antes dos processos de análise, mesmo se a execução for interrompida aqui
+        # (ex.: falha em ao_concluir_tabela), para que as análises em andamento não usem os processos já encerrados
+        with closing(_pipeline(tarefas, produzir, consumir, workers, max(1, analisadores),
+                               TAMANHO_FILA_AMOSTRAS)) as pipeline:
+            for v in pipeline:
+                if v is None:
+                    continue
+                info_analise_colunas.append(v)
+                if ao_concluir_tabela is not None:
+                    ao_concluir_tabela(v)
+    finally:
+        if analisador_processos is not None:
+            analisador_processos.fechar()
+
+    if not info_analise_colunas:
+        return pd.DataFrame(columns=df_colunas.columns)
+
     df = pd.concat(info_analise_colunas)
 
     return df
 
 
-def analise_colunas_sql(ambiente, df_colunas_sample, filtro=None):
-
-    # Carregar todos os arquivos sql da pasta "validacao" (se existir)
+def carregar_validacoes():
+    """
+    Carrega todos os scripts da pasta "validacao" (se existir).
 
+    :return: Tupla (lista de (nome do script, função de validação), dicionário nome do script -> conteúdo)
+    """
     validacoes_f = []
+    conteudos = {}
     if os.path.exists(DIR_VALIDACAO):
         for script_name in os.listdir(DIR_VALIDACAO):
+            if script_name.endswith(('.sql', '.py')):
+                with open(os.path.join(DIR_VALIDACAO, script_name)) as file:
+                    conteudos[script_name] = file.read()
+
             if script_name.endswith('.sql'):
                 validacoes_f.append((script_name, call_sql))
             elif script_name.endswith('.py'):
@@ -201,8 +856,24 @@ def analise_colunas_sql(ambiente, df_colunas_sample, filtro=None):
                 spec.loader.exec_module(module)
                 validacoes_f.append((script_name, module.validate))
 
+    return validacoes_f, conteudos
+
 
+def analise_colunas_sql(ambiente, df_colunas_sample, filtro=None, cache=None, ao_concluir_tabela=None, checkpoint=None,
+                        tempo_tabela=None):
+    """
+    Executa os scripts de validação sobre as colunas de cada tabela.
 
+    :param ao_concluir_tabela: Função chamada com o DataFrame de resultados de cada tabela, à medida que as
+                               tabelas são concluídas.
+    :param checkpoint: Diário da execução (profiler_dq.checkpoint.Checkpoint). Os resultados das tabelas já
+                       concluídas no diário são reaproveitados e os das demais são gravados ao fim de cada tabela.
+    :param tempo_tabela: Se informado, prazo em segundos das consultas de validação de cada tabela (ver 
+                         Ambiente.prazo). As validações que excedem o prazo retornam None.
+    """
+
+    # Carregar todos os arquivos sql da pasta "validacao" (se existir)
+    validacoes_f, conteudos = carregar_validacoes()
 
     df_tabelas_groupby = df_colunas_sample.groupby(['database_name', 'schema_name', 'table_name'])
 
@@ -210,42 +881,107 @@ def analise_colunas_sql(ambiente, df_colunas_sample, filtro=None):
 
     for (database, schema, table), v in df_tabelas_groupby:
         print('**---', database, schema, table, v.shape)
+        inicio_tabela = len(returns)
+
+        registrado = checkpoint.obter_validacao(database, schema, table) if checkpoint is not None else None
+        if registrado is not None:
+            print(f'Usando resultado do checkpoint para as validações de {database}.{schema}.{table}')
+            returns.extend(registrado[0])
+        else:
+            with ambiente.prazo(tempo_tabela):
+                _validar_tabela(ambiente, database, schema, table, v, filtro, cache, validacoes_f, conteudos, returns)
+            if checkpoint is not None:
+                checkpoint.salvar_validacao(database, schema, table, returns[inicio_tabela:])
+
+        if ao_concluir_tabela is not None and len(returns) > inicio_tabela:
+            df_tabela = pd.DataFrame(returns[inicio_tabela:])
+            # O resultado de cada script pode ter um tipo diferente
+            df_tabela['result'] = df_tabela['result'].astype(object)
+            ao_concluir_tabela(df_tabela)
 
+    return pd.DataFrame(returns)
+
+
+def _validar_tabela(ambiente, database, schema, table, v, filtro, cache, validacoes_f, conteudos, returns):
+    """
+    Executa os scripts de validação sobre as colunas de uma tabela, acrescentando os resultados a returns.
+    """
+    canceladas = ambiente.consultas_canceladas
+    retornos = {}
+    chaves = {}
+    if cache is not None:
         for script_name, func in validacoes_f:
-            ret = func(ambiente, database, schema, table, v, script_name)
+            chaves[script_name] = cache.chave_validacao(ambiente.nome, database, schema, table, script_name, conteudos[script_name], v, filtro)
+            cached = cache.obter_validacao(chaves[script_name])
+            if cached is not None:
+                print(f'Usando resultado do cache para {script_name}')
+                retornos[script_name] = cached[0]
+
+    # As combinações de todos os scripts SQL da tabela são executadas em uma única consulta
+    validacoes_sql = []
+    for script_name, func in validacoes_f:
+        if func is call_sql and script_name not in retornos:
+            combinacoes = combinacoes_sql(conteudos[script_name], v, script_name)
+            if combinacoes is None:
+                retornos[script_name] = None
+            else:
+                validacoes_sql.append((script_name, *combinacoes))
 
-            if ret is None:
-                # Não houve retorno
-                continue
+    if validacoes_sql:
+        with desempenho.span('validacoes_sql', database=database, schema=schema, table=table,
+                             scripts=len(validacoes_sql)):
+            retornos.update(executar_validacoes_sql(ambiente, database, schema, table, validacoes_sql))
 
-            for r in ret:
-                columns = r['columns']
-                column_names_strings = ','.join(columns)
-                num_columns = len(columns)
+    for script_name, func in validacoes_f:
+        if script_name in retornos:
+            ret = retornos[script_name]
+        else:
+            with desempenho.span('validacao', database=database, schema=schema, table=table, script=script_name):
+                try:
+                    ret = func(ambiente, database, schema, table, v, script_name)
+                except TimeoutError as e:
+                    print(f'WARNING: Tempo excedido na validação {script_name} de {database}.{schema}.{table}: {e}')
+                    ret = None
+
+        # Resultados incompletos por consultas canceladas não são gravados no cache
+        if cache is not None and script_name in chaves and ambiente.consultas_canceladas == canceladas:
+            cache.salvar_validacao(chaves[script_name], ret)
+
+        if ret is None:
+            # Não houve retorno
+            continue
 
-                title = f"{script_name}[{column_names_strings}]"
+        for r in ret:
+            columns = r['columns']
+            column_names_strings = ','.join(columns)
+            num_columns = len(columns)
 
-                result = {
-                    'database_name': database,
-                    'schema_name': schema,
-                    'table_name': table,
-                    'script': script_name,
-                    'columns': column_names_strings,
-                    'num_columns': num_columns,
+            title = f"{script_name}[{column_names_strings}]"
 
-                    'title': title,
-                    'result': r['result'],
-                }
+            result = {
+                'database_name': database,
+                'schema_name': schema,
+                'table_name': table,
+                'script': script_name,
+                'columns': column_names_strings,
+                'num_columns': num_columns,
 
+                'title': title,
+                'result': r['result'],
+            }
 
-                returns.append(result)
 
-    return pd.DataFrame(returns)
+            returns.append(result)
     
-def call_sql(ambiente, database, schema, table, df_groupby, script_name):
-    with open(os.path.join(DIR_VALIDACAO, script_name)) as file:
-        sql = file.read()
-
+def combinacoes_sql(sql, df_groupby, script_name):
+    """
+    Processa o cabeçalho de um script de validação SQL e gera as combinações de colunas da tabela 
+    selecionadas pelos filtros do cabeçalho.
+
+    :param sql: Conteúdo do script.
+    :return: Tupla (corpo do script, lista de combinações) ou None se não houver combinação a validar. 
+             Cada combinação é um dicionário com as colunas ('columns') e as variáveis do script ('kwargs').
+    """
     #df[k] = None
     # Separete header (all first lines starting with #) from sql body
     lines = sql.split('\n')
@@ -257,8 +993,6 @@ def call_sql(ambiente, database, schema, table, df_groupby, script_name):
     print('****')
     print(sql)
 
-    returns = []
-
     column_vars = {}
 
     DEFAULT_VARIABLE = 'coluna'
@@ -280,7 +1014,7 @@ def call_sql(ambiente, database, schema, table, df_groupby, script_name):
             else:
                 columns = df_groupby.query(filtro)
         except Exception as e:
-            print(f"Erro ao aplicar filtro da validação {sql_name}")
+            print(f"Erro ao aplicar filtro da validação {script_name}")
             print(f"Filtro: {filtro} - ", e)
             continue
 
@@ -323,24 +1057,59 @@ def call_sql(ambiente, database, schema, table, df_groupby, script_name):
 
     print(f"Gerando {num_combinacoes} combinações de colunas")
 
+    combinacoes = []
 
     for r in product(*[[(k,i) for i in v] for k,v in column_vars.items()]):
         kwargs = dict(r)
         column_names = list(kwargs.values())
-        column_names_strings = ','.join(column_names)
         num_columns = len(column_names)
         print(column_names)
 
-        print('---', database, schema, table, kwargs)
         if num_columns == 1 and DEFAULT_VARIABLE not in kwargs:
             # Se houver apenas uma coluna, criamos um alias para ela
             kwargs[DEFAULT_VARIABLE] = kwargs[list(kwargs.keys())[0]]
-        df_validacao = ambiente.read_sql(sql, database=database, schema=schema, table=table, **kwargs)
-        ret = df_validacao.iloc[0,0]  
 
-        returns.append({
+        combinacoes.append({
             'columns': column_names,
-            'result': ret,
+            'kwargs': kwargs,
         })
 
-    return returns      
\ No newline at end of file
+    # O script é usado como subconsulta, por isso o ';' final é removido
+    sql = sql.strip().rstrip(';')
+
+    return sql, combinacoes
+
+
+def executar_validacoes_sql(ambiente, database, schema, table, validacoes):
+    """
+    Executa as combinações de colunas de vários scripts de validação SQL sobre uma tabela. Cada combinação se 
+    torna uma subconsulta escalar e todas são agrupadas em uma única consulta (ver Ambiente.read_sql_escalares).
+
+    :param validacoes: Lista de tuplas (nome do script, corpo do script, combinações), como gerado por combinacoes_sql.
+    :return: Dicionário nome do script -> lista de resultados ({'columns': ..., 'result': ...}).
+    """
+    consultas = []
+    for script_name, sql, combinacoes in validacoes:
+        for c in combinacoes:
+            print('---', database, schema, table, c['kwargs'])
+            consultas.append(ambiente.formatar_sql(sql, database=database, schema=schema, table=table, **c['kwargs']))
+
+    resultados = iter(ambiente.read_sql_escalares(consultas))
+
+    returns = {}
+    for script_name, sql, combinacoes in validacoes:
+        returns[script_name] = [{'columns': c['columns'], 'result': next(resultados)} for c in combinacoes]
+
+    return returns
+
+
+def call_sql(ambiente, database, schema, table, df_groupby, script_name):
+    with open(os.path.join(DIR_VALIDACAO, script_name)) as file:
+        sql = file.read()
+
+    combinacoes = combinacoes_sql(sql, df_groupby, script_name)
+    if combinacoes is None:
+        return None
+
+    sql, combinacoes = combinacoes
+    return executar_validacoes_sql(ambiente, database, schema, table, [(script_name, sql, combinacoes)])[script_name]
@@ -0,0 +1,131 @@
+"""
+Intervalos de confiança das métricas calculadas sobre as amostras, usados na amostragem adaptativa.
+
+- Proporções (missing, unique, CPF/CNPJ, CPF, CNPJ): intervalo de Wilson, que se mantém adequado para proporções
+  próximas de 0 ou 1, com correção para população finita (a amostra é uma fração do número de registros da tabela).
+  A métrica unique não é uma proporção de registros independentes; o intervalo é uma aproximação da sua precisão.
+- Percentis (P25, P50, P75): intervalo de ordem, livre de distribuição: os valores da amostra ordenada nas posições
+  n*(q -/+ z*sqrt(q*(1-q)/n)).
+
+Cada intervalo é reportado pela sua semiamplitude, na escala da métrica. A métrica convergiu quando a semiamplitude
+é no máximo a precisão desejada (nos percentis, relativa à amplitude P01-P99 da coluna; nos textos e datas, medida
+em valores distintos da amostra).
+"""
+import math
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from . import data_types
+
+# Métricas de proporção -> se a proporção é calculada sobre os valores não nulos (True) ou sobre todos os registros
+METRICAS_PROPORCAO = {'missing': False, 'unique': False, 'CPF/CNPJ': True, 'CPF': True, 'CNPJ': True}
+
+PERCENTIS = {'P25': 0.25, 'P50': 0.5, 'P75': 0.75}
+
+COLUNAS_INTERVALOS = [f'ic_{m}' for m in list(METRICAS_PROPORCAO) + list(PERCENTIS)]
+
+
+def z_confianca(confianca):
+    """
+    Quantil da distribuição normal para o nível de confiança (ex.: 1.96 para 0.95).
+    """
+    return NormalDist().inv_cdf((1 + confianca) / 2)
+
+
+def _correcao_finita(n, N):
+    if N is None or N <= 1 or n <= 0:
+        return 1.0
+    return math.sqrt(max(0.0, (N - n) / (N - 1)))
+
+
+def semiamplitude_wilson(p, n, z, N=None):
+    """
+    Semiamplitude do intervalo de Wilson da proporção p observada em n registros de uma população de N registros.
+    """
+    if n <= 0 or pd.isnull(p):
+        return None
+    z2 = z * z
+    semiamplitude = z / (1 + z2 / n) * math.sqrt(p * (1 - p) / n + z2 / (4 * n * n))
+    return semiamplitude * _correcao_finita(n, N)
+
+
+def intervalo_percentil(valores_ordenados, q, z):
+    """
+    :param valores_ordenados: Valores não nulos da coluna, ordenados.
+    :return: Tupla (limite inferior, limite superior) do intervalo de confiança do percentil q.
+    """
+    n = len(valores_ordenados)
+    h = z * math.sqrt(q * (1 - q) / n)
+    inferior = max(0, math.floor(n * (q - h)))
+    superior = min(n - 1, math.ceil(n * (q + h)))
+    return valores_ordenados[inferior], valores_ordenados[superior]
+
+
+def _extremos_amplitude(valores_ordenados):
+    """
+    Percentis P01 e P99 dos valores ordenados, que delimitam a amplitude usada como escala dos percentis.
+    """
+    n = len(valores_ordenados)
+    return valores_ordenados[math.floor(0.01 * n)], valores_ordenados[min(n - 1, math.ceil(0.99 * n))]
+
+
+def intervalos_confianca(v, df_sample, num_registros, confianca, precisao):
+    """
+    Calcula os intervalos de confiança das métricas de cada coluna da amostra.
+
+    :param v: DataFrame de métricas da tabela (ver info_colunas.analise_amostra).
+    :return: Tupla (DataFrame com as colunas COLUNAS_INTERVALOS, indicador de que todas as métricas convergiram).
+    """
+    z = z_confianca(confianca)
+    n = len(df_sample)
+    intervalos = pd.DataFrame(index=v.index, columns=COLUNAS_INTERVALOS, dtype=float)
+    convergiu = True
+    N = None if num_registros is None or num_registros < 0 else num_registros
+
+    for i, c, tipo in zip(v.index, v.column_name, v.tipo):
+        if c not in df_sample.columns:
+            continue
+
+        missing = v.at[i, 'missing'] if 'missing' in v.columns else None
+        n_validos = round(n * (1 - missing)) if pd.notnull(missing) else n
+        for m, sobre_validos in METRICAS_PROPORCAO.items():
+            if m not in v.columns or pd.isnull(v.at[i, m]):
+                continue
+            h = semiamplitude_wilson(float(v.at[i, m]), n_validos if sobre_validos else n, z, N)
+            intervalos.at[i, f'ic_{m}'] = h
+            if h is not None and h > precisao:
+                convergiu = False
+
+        if tipo not in (data_types.NUMERIC, data_types.FLOAT):
+            # Percentis de textos e datas: sem escala de valores, os limites do intervalo são medidos pelas suas
+            # posições entre os valores distintos da amostra, e a semiamplitude é relativa ao número de distintos
+            # entre P01 e P99. Limites iguais ou vizinhos convergem: um percentil na fronteira entre dois valores
+            # (ex.: a mediana de uma coluna com 10 valores igualmente frequentes) oscila entre eles em qualquer amostra
+            valores = np.sort(df_sample[c].dropna().astype(str).to_numpy())
+            if len(valores) == 0:
+                continue
+            distintos = np.unique(valores)
+            inferior, superior = np.searchsorted(distintos, _extremos_amplitude(valores))
+            amplitude = superior - inferior
+            for q in PERCENTIS.values():
+                inferior, superior = np.searchsorted(distintos, intervalo_percentil(valores, q, z))
+                if (superior - inferior) / 2 > max(0.5, precisao * amplitude):
+                    convergiu = False
+            continue
+
+        valores = np.sort(pd.to_numeric(df_sample[c], errors='coerce').dropna().to_numpy(dtype=float))
+        if len(valores) == 0:
+            continue
+        inferior, superior = _extremos_amplitude(valores)
+        amplitude = superior - inferior
+        for m, q in PERCENTIS.items():
+            inferior, superior = intervalo_percentil(valores, q, z)
+            h = (superior - inferior) / 2
+            intervalos.at[i, f'ic_{m}'] = h
+            if h > precisao * amplitude:
+                convergiu = False
+
+    return intervalos, convergiu
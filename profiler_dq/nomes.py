@@ -0,0 +1,143 @@
+"""
+Identificação de nomes de pessoas em colunas de texto.
+
+Os nomes comuns (prenomes e sobrenomes) são compilados em uma única expressão regular, montada a partir de uma
+árvore de prefixos (trie): nomes com o mesmo início compartilham o mesmo ramo da expressão, de modo que o custo
+da busca cresce pouco com o número de nomes. A expressão ignora maiúsculas e delimita os nomes por espaços, como a
+separação em tokens; apenas os textos com caracteres fora do ASCII são normalizados antes da busca (NFKD sem os
+caracteres não ASCII, como em normalizar_nome), o que cobre acentos compostos ou decompostos (NFD), formas de
+largura total e caracteres invisíveis (hífen opcional, espaço de largura zero) no meio dos nomes.
+
+A lista padrão (nomes_comuns.txt) contém os nomes mais frequentes do ranking do Censo 2010 do IBGE
+(https://censo2010.ibge.gov.br/nomes/#/ranking). Uma lista maior pode ser carregada de um arquivo texto (um nome
+por linha), CSV (coluna "nome") ou JSON no formato da API de nomes do IBGE
+(https://servicodados.ibge.gov.br/api/v2/censos/nomes/ranking).
+"""
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+import pandas as pd
+
+ARQUIVO_NOMES_PADRAO = os.path.join(os.path.dirname(__file__), 'nomes_comuns.txt')
+
+def normalizar_nome(nome):
+    """
+    Converte o nome para minúsculas e sem acentos.
+    """
+    nome = unicodedata.normalize('NFKD', nome.strip().lower())
+    return nome.encode('ascii', errors='ignore').decode('utf-8')
+
+
+def _normalizar_texto(x):
+    # Textos ASCII dispensam a normalização (a expressão ignora maiúsculas)
+    if not isinstance(x, str) or x.isascii():
+        return x
+    return normalizar_nome(x)
+
+
+def ler_nomes(arquivo):
+    """
+    Lê uma lista de nomes de um arquivo texto (um nome por linha, linhas iniciadas por # são ignoradas),
+    CSV (coluna "nome" ou a primeira coluna) ou JSON da API de nomes do IBGE.
+
+    :return: Lista de nomes normalizados (minúsculas e sem acentos), sem repetições.
+    """
+    extensao = os.path.splitext(arquivo)[1].lower()
+    if extensao == '.json':
+        with open(arquivo, encoding='utf-8') as f:
+            dados = json.load(f)
+        # A API retorna uma lista de consultas, cada uma com o ranking em "res"
+        if isinstance(dados, dict):
+            dados = [dados]
+        nomes = [r['nome'] for d in dados for r in d.get('res', [])]
+    elif extensao == '.csv':
+        df = pd.read_csv(arquivo, dtype=str)
+        coluna = next((c for c in df.columns if c.strip().lower() == 'nome'), df.columns[0])
+        nomes = df[coluna].dropna().tolist()
+    else:
+        with open(arquivo, encoding='utf-8') as f:
+            nomes = [l for l in f if l.strip() and not l.lstrip().startswith('#')]
+
+    nomes = (normalizar_nome(n) for n in nomes)
+    return list(dict.fromkeys(n for n in nomes if n and ' ' not in n))
+
+
+def _expressao_trie(nomes):
+    """
+    Monta a expressão regular que reconhece os nomes, agrupando os prefixos comuns.
+    """
+    trie = {}
+    for nome in nomes:
+        no = trie
+        for letra in nome:
+            no = no.setdefault(letra, {})
+        no[''] = {}
+
+    def expressao(no):
+        fim = '' in no
+        ramos = [re.escape(l) + expressao(filho) for l, filho in sorted(no.items()) if l != '']
+        if not ramos:
+            return ''
+        if len(ramos) == 1 and not fim:
+            return ramos[0]
+        e = '(?:' + '|'.join(ramos) + ')'
+        return e + '?' if fim else e
+
+    return expressao(trie)
+
+
+class CasadorNomes:
+    """
+    Expressão regular compilada que identifica textos com ao menos um nome da lista como palavra
+    (delimitada por espaços ou pelo início/fim do texto).
+
+    :param nomes: Lista de nomes normalizados (ver ler_nomes).
+    """
+    def __init__(self, nomes):
+        self.nomes = list(nomes)
+        self.assinatura = hashlib.sha1('\n'.join(sorted(self.nomes)).encode('utf-8')).hexdigest()
+        if self.nomes:
+            self._regex = re.compile(r'(?<!\S)' + _expressao_trie(self.nomes) + r'(?!\S)', re.IGNORECASE)
+        else:
+            self._regex = re.compile(r'(?!)')
+
+    def contem_nome(self, s):
+        """
+        :return: Series booleana indicando os valores com ao menos um nome da lista. Nulos resultam em False.
+        """
+        if isinstance(s.dtype, pd.StringDtype):
+            # A expressão (com lookbehind) é avaliada pelo módulo re, sobre objetos Python, em qualquer formato
+            s = s.astype(object)
+        return s.map(_normalizar_texto).str.contains(self._regex, na=False).astype(bool)
+
+
+_casador = None
+_arquivo = None
+
+
+def carregar_nomes(arquivo=None):
+    """
+    Define a lista de nomes usada na análise. Se arquivo não for informado, usa a lista padrão.
+    """
+    global _casador, _arquivo
+    _arquivo = arquivo
+    _casador = CasadorNomes(ler_nomes(arquivo or ARQUIVO_NOMES_PADRAO))
+
+
+def arquivo_nomes():
+    """
+    Arquivo da lista de nomes em uso (None para a lista padrão).
+    """
+    return _arquivo
+
+
+def casador_nomes():
+    """
+    Casador da lista de nomes em uso. A lista padrão é carregada no primeiro uso.
+    """
+    if _casador is None:
+        carregar_nomes(_arquivo)
+    return _casador
@@ -0,0 +1,114 @@
+"""
+Primitivas compartilhadas pelas funções de análise de colunas.
+
+Cada função de análise declara, em analise_colunas, as primitivas de que precisa (ex.: máscara de nulos,
+contagem dos valores distintos). As primitivas de uma coluna são calculadas uma única vez, no primeiro acesso, e
+repassadas a todas as funções, que deixam de percorrer a coluna repetidamente. Primitivas usadas apenas em alguns
+tipos de coluna (ex.: validação de CPF/CNPJ) não são calculadas para os demais.
+
+As funções sobre textos (expressões regulares, validação de CPF/CNPJ) são aplicadas apenas aos valores distintos
+e ponderadas pelas suas frequências.
+"""
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+from .cpf_cnpj import validar_cpf_cnpj
+
+
+class Primitivas:
+    """
+    Primitivas de uma coluna, calculadas no primeiro acesso e mantidas para as demais funções de análise.
+
+    :param s: Series com os valores da coluna.
+    """
+    NOMES = ('nulos', 'contagens', 'cpf_cnpj')
+
+    def __init__(self, s):
+        self.s = s
+        self.l = len(s)
+
+    @cached_property
+    def nulos(self):
+        """
+        Máscara (array booleano) dos valores nulos.
+        """
+        return self.s.isnull().to_numpy()
+
+    @cached_property
+    def n_nulos(self):
+        return int(self.nulos.sum())
+
+    @property
+    def n_validos(self):
+        return self.l - self.n_nulos
+
+    @cached_property
+    def contagens(self):
+        """
+        Series valor distinto -> frequência, sem os nulos, na ordem em que os valores aparecem na coluna.
+        """
+        contagens = self.s.value_counts(dropna=True, sort=False)
+        if isinstance(self.s.dtype, pd.CategoricalDtype):
+            # Categorias sem registros na coluna são descartadas e o índice deixa de ser categórico
+            contagens = contagens[contagens > 0]
+            contagens.index = contagens.index.astype(self.s.cat.categories.dtype)
+        return contagens
+
+    @property
+    def distintos(self):
+        """
+        Series dos valores distintos (sem nulos).
+        """
+        return pd.Series(self.contagens.index, dtype=self.contagens.index.dtype)
+
+    @property
+    def frequencias(self):
+        return self.contagens.to_numpy()
+
+    @property
+    def n_distintos(self):
+        return len(self.contagens)
+
+    @cached_property
+    def cpf_cnpj(self):
+        """
+        Validação dos valores distintos como CPF/CNPJ (ver cpf_cnpj.validar_cpf_cnpj).
+
+        :return: Tupla de arrays (número de dígitos de cada valor distinto, indicador de CPF/CNPJ válido)
+        """
+        return validar_cpf_cnpj(self.distintos)
+
+    def contar(self, mascara_distintos):
+        """
+        Número de registros cujo valor satisfaz a máscara, calculada sobre os valores distintos.
+        """
+        return int(self.frequencias[np.asarray(mascara_distintos, dtype=bool)].sum())
+
+    def moda(self):
+        """
+        Valor mais frequente (o menor deles, em caso de empate), como em Series.mode(dropna=True), ou None.
+        """
+        if self.n_distintos == 0:
+            return None
+        modas = self.contagens.index[self.frequencias == self.frequencias.max()]
+        try:
+            return modas.sort_values()[0]
+        except TypeError:
+            # Valores de tipos não comparáveis entre si
+            return modas[0]
+
+    def percentis(self, qs):
+        """
+        Percentis, como em Series.quantile(qs, interpolation='nearest'), calculados sobre os valores distintos
+        ordenados e as suas frequências acumuladas, sem ordenar a coluna inteira.
+
+        :return: Lista com o valor de cada percentil (NaN se a coluna não tiver valores não nulos).
+        """
+        if self.n_distintos == 0:
+            return [np.nan] * len(qs)
+        contagens = self.contagens.sort_index()
+        acumuladas = np.cumsum(contagens.to_numpy())
+        posicoes = np.quantile(np.arange(acumuladas[-1]), qs, method='nearest').astype(int)
+        return contagens.index.take(np.searchsorted(acumuladas, posicoes, side='right')).tolist()
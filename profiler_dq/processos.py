@@ -0,0 +1,119 @@
+"""
+Execução das funções de análise de colunas em um pool de processos.
+
+As funções de análise são CPU-bound e, em threads, ficam limitadas a um núcleo pelo GIL. Com um pool de
+processos, as colunas da amostra são divididas em grupos analisados em paralelo.
+
+A amostra é repassada aos processos por memória compartilhada (multiprocessing.shared_memory): cada coluna
+é serializada com pickle (protocolo 5) e os buffers de dados (arrays NumPy) são copiados uma única vez para
+um bloco de memória compartilhada, do qual os processos reconstroem as colunas sem cópia. Colunas de objetos
+Python (ex.: textos) não têm buffers separáveis e são serializadas integralmente.
+"""
+import gc
+import pickle
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+from . import nomes
+
+
+def _serializar_colunas(df, colunas):
+    """
+    Serializa as colunas em um bloco de memória compartilhada.
+
+    :return: Tupla (bloco de memória compartilhada, dicionário coluna -> lista de (início, fim) dos trechos do bloco),
+             em que o primeiro trecho de cada coluna é o pickle e os demais são os seus buffers.
+    """
+    partes = []
+    trechos = {}
+    posicao = 0
+    for c in colunas:
+        buffers = []
+        dados = pickle.dumps(df[c], protocol=5, buffer_callback=buffers.append)
+        trechos[c] = []
+        for parte in [memoryview(dados)] + [b.raw() for b in buffers]:
+            partes.append(parte)
+            trechos[c].append((posicao, posicao + parte.nbytes))
+            posicao += parte.nbytes
+
+    memoria = shared_memory.SharedMemory(create=True, size=max(1, posicao))
+    for parte, (inicio, fim) in zip(partes, (t for c in colunas for t in trechos[c])):
+        memoria.buf[inicio:fim] = parte.cast('B')
+
+    return memoria, trechos
+
+
+def _analisar_colunas(nome_memoria, colunas):
+    """
+    Executada nos processos do pool: reconstrói as colunas a partir da memória compartilhada e executa
+    todas as funções de análise (ver info_colunas.analisar_coluna).
+
+    :param colunas: Lista de (nome da coluna, tipo da coluna, trechos do bloco de memória).
+    :return: Tupla (dicionário (nome da função, coluna) -> resultado, dicionário nome da função -> tempo em segundos).
+    """
+    from .info_colunas import analisar_coluna
+
+    memoria = shared_memory.SharedMemory(name=nome_memoria)
+    resultados = {}
+    tempos = {}
+    try:
+        for c, tipo, trechos in colunas:
+            (inicio, fim), *buffers = trechos
+            s = pickle.loads(memoria.buf[inicio:fim], buffers=[memoria.buf[a:b] for a, b in buffers])
+            r, t = analisar_coluna(c, tipo, s)
+            resultados.update(((nome_funcao, c), x) for nome_funcao, x in r.items())
+            for nome_funcao, duracao in t.items():
+                tempos[nome_funcao] = tempos.get(nome_funcao, 0) + duracao
+            del s, r
+    finally:
+        # As colunas reconstruídas referenciam a memória compartilhada e precisam ser liberadas antes de fechá-la
+        gc.collect()
+        memoria.close()
+
+    return resultados, tempos
+
+
+class AnalisadorProcessos:
+    """
+    :param processos: Número de processos do pool.
+    """
+    def __init__(self, processos):
+        self._processos = processos
+        # Os processos são iniciados com spawn: o fork de um processo com várias threads (amostragem e análise)
+        # pode copiar locks adquiridos por outras threads e travar os processos filhos.
+        # Como os módulos são importados novamente, a lista de nomes em uso é recarregada em cada processo.
+        self._executor = ProcessPoolExecutor(max_workers=processos, mp_context=get_context('spawn'),
+                                             initializer=nomes.carregar_nomes, initargs=(nomes.arquivo_nomes(),))
+
+    def analisar(self, df_sample, colunas_tipos):
+        """
+        Executa as funções de análise sobre as colunas da amostra, divididas entre os processos do pool.
+
+        :param colunas_tipos: Series nome da coluna -> tipo da coluna.
+        :return: Tupla (dicionário (nome da função, coluna) -> resultado, dicionário nome da função -> tempo em segundos).
+        """
+        colunas = [c for c in df_sample.columns if c in colunas_tipos.index]
+        if not colunas:
+            return {}, {}
+
+        memoria, trechos = _serializar_colunas(df_sample, colunas)
+        try:
+            grupos = [colunas[i::self._processos] for i in range(min(self._processos, len(colunas)))]
+            futuros = [self._executor.submit(_analisar_colunas, memoria.name,
+                                             [(c, colunas_tipos.loc[c], trechos[c]) for c in grupo])
+                       for grupo in grupos]
+
+            resultados, tempos = {}, {}
+            for f in futuros:
+                r, t = f.result()
+                resultados.update(r)
+                for k, v in t.items():
+                    tempos[k] = tempos.get(k, 0) + v
+            return resultados, tempos
+        finally:
+            memoria.close()
+            memoria.unlink()
+
+    def fechar(self):
+        self._executor.shutdown()
@@ -0,0 +1,203 @@
+"""
+Descoberta de relacionamentos (dependências de inclusão, candidatas a chave estrangeira -> chave primária) entre as
+colunas das tabelas analisadas.
+
+Cada coluna das amostras é resumida por uma assinatura compacta dos seus valores distintos, agrupada pelo tipo da
+coluna (MAP_TYPES nos flavors): apenas colunas do mesmo tipo são comparadas. Os valores são normalizados antes do
+hash (números como float, demais tipos como texto), para que 1, 1.0 e Decimal('1') coincidam entre tabelas.
+
+- Todas as colunas (referenciantes candidatas): os TAMANHO_ASSINATURA menores hashes dos valores distintos (bottom-k,
+  como no MinHash), que formam uma amostra uniforme dos valores distintos da coluna.
+- Colunas únicas e sem nulos na amostra (referenciadas candidatas): filtro de Bloom (sketches.FiltroBloom) com
+  todos os valores distintos da amostra.
+
+A inclusão de A em B é estimada pela fração dos hashes da assinatura de A encontrados no filtro de B, descontados os
+falsos positivos do filtro e dividida pela fração dos registros de B presentes na amostra (a referência a um registro
+de B fora da amostra não é encontrada). Os valores das colunas nunca são comparados entre si: cada par (referenciante,
+referenciada) do mesmo tipo custa TAMANHO_ASSINATURA consultas ao filtro, e apenas as colunas únicas são referenciadas.
+
+As estimativas dependem das amostras: os candidatos mais prováveis podem ser confirmados no SGBD (confirmar), que
+conta os valores de A sem correspondente em B (órfãos) nas tabelas inteiras, sem o filtro (--where) das amostras.
+"""
+import threading
+
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from . import data_types
+from . import desempenho
+from .acumuladores import hash_valores
+from .sketches import FiltroBloom
+
+# Tipos das colunas comparadas (colunas FLOAT, DATE e BLOB raramente são chaves)
+TIPOS_RELACIONAMENTO = (data_types.NUMERIC, data_types.STRING)
+
+# Número de hashes dos valores distintos na assinatura de cada coluna
+TAMANHO_ASSINATURA = 256
+
+# Inclusão estimada mínima dos relacionamentos propostos
+LIMIAR_INCLUSAO = 0.9
+
+# Colunas com menos valores distintos na amostra (ex.: indicadores) estão contidas em quase qualquer chave, e
+# inclusões estimadas com menos hashes encontrados no filtro não são propostas
+MIN_DISTINTOS = 3
+
+# Número máximo de colunas referenciadas propostas para cada coluna
+MAX_CANDIDATOS_COLUNA = 3
+
+COLUNAS_RELACIONAMENTOS = ['database_name', 'schema_name', 'table_name', 'column_name', 'tipo',
+                           'database_ref', 'schema_ref', 'table_ref', 'column_ref',
+                           'inclusao_estimada', 'valores_testados', 'valores_encontrados', 'fracao_amostra_ref']
+
+
+def hashes_distintos(s, tipo):
+    """
+    Hashes de 64 bits dos valores distintos não nulos da coluna, normalizados conforme o tipo (ver
+    acumuladores.hash_valores), em ordem crescente.
+    """
+    return np.unique(hash_valores(s, tipo))
+
+
+class Assinatura:
+    """
+    Assinatura dos valores distintos de uma coluna da amostra.
+
+    :param hashes: Os menores hashes dos valores distintos (no máximo TAMANHO_ASSINATURA).
+    :param filtro: Filtro de Bloom com todos os valores distintos, se a coluna for única na amostra, ou None.
+    :param fracao_amostra: Fração dos registros da tabela presentes na amostra.
+    """
+    def __init__(self, tabela, coluna, tipo, hashes, distintos, filtro, fracao_amostra, num_registros):
+        self.tabela = tabela
+        self.coluna = coluna
+        self.tipo = tipo
+        self.hashes = hashes
+        self.distintos = distintos
+        self.filtro = filtro
+        self.fracao_amostra = fracao_amostra
+        self.num_registros = num_registros
+
+
+class DescobridorRelacionamentos:
+    """
+    Recebe a amostra de cada tabela (como consumidor de amostras, ver info_colunas.analise_colunas_sample), guarda as
+    assinaturas das suas colunas e propõe os relacionamentos entre as colunas de todas as tabelas.
+
+    :param df_colunas: DataFrame de colunas do ambiente (ver Ambiente.obter_colunas), com o tipo de cada coluna.
+    :param df_tabelas: DataFrame de tabelas do ambiente (ver Ambiente.obter_tabelas), com o número de registros.
+    """
+    def __init__(self, df_colunas, df_tabelas):
+        self._tipos = {(d, s, t, c): tipo for d, s, t, c, tipo in
+                       zip(df_colunas.database_name, df_colunas.schema_name, df_colunas.table_name,
+                           df_colunas.column_name, df_colunas.tipo)}
+        self._num_registros = {(d, s, t): n for d, s, t, n in
+                               zip(df_tabelas.database_name, df_tabelas.schema_name, df_tabelas.table_name,
+                                   df_tabelas.num_registros)}
+        self._assinaturas = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def registrar_amostra(self, database, schema, table, df_sample):
+        num_registros = self._num_registros.get((database, schema, table))
+        if num_registros is not None and num_registros > 0:
+            fracao_amostra = min(1.0, len(df_sample) / num_registros)
+        else:
+            num_registros, fracao_amostra = None, 1.0
+
+        assinaturas = []
+        with desempenho.span('assinaturas_colunas', database=database, schema=schema, table=table,
+                             colunas=len(df_sample.columns)):
+            for c in df_sample.columns:
+                tipo = self._tipos.get((database, schema, table, c))
+                if tipo not in TIPOS_RELACIONAMENTO:
+                    continue
+
+                hashes = hashes_distintos(df_sample[c], tipo)
+                if len(hashes) < MIN_DISTINTOS:
+                    continue
+
+                filtro = None
+                if len(hashes) == len(df_sample):
+                    # Coluna única e sem nulos na amostra: candidata a chave referenciada
+                    filtro = FiltroBloom(len(hashes))
+                    filtro.adicionar_hashes(hashes)
+
+                assinaturas.append(Assinatura((database, schema, table), c, tipo, hashes[:TAMANHO_ASSINATURA],
+                                              len(hashes), filtro, fracao_amostra, num_registros))
+
+        with self._lock:
+            for a in assinaturas:
+                self._assinaturas[a.tipo].append(a)
+
+    def relacionamentos(self):
+        """
+        Compara as assinaturas das colunas de cada tipo com os filtros das colunas únicas do mesmo tipo.
+
+        :return: DataFrame com os relacionamentos propostos (COLUNAS_RELACIONAMENTOS), do mais para o menos provável.
+        """
+        with self._lock:
+            grupos = {tipo: list(assinaturas) for tipo, assinaturas in self._assinaturas.items()}
+
+        registros = []
+        with desempenho.span('relacionamentos', colunas=sum(len(g) for g in grupos.values())):
+            for tipo, assinaturas in grupos.items():
+                referenciadas = [b for b in assinaturas if b.filtro is not None]
+                for a in assinaturas:
+                    candidatos = []
+                    for b in referenciadas:
+                        if b is a:
+                            continue
+                        inclusao, encontrados = self._inclusao(a, b)
+                        if inclusao >= LIMIAR_INCLUSAO and encontrados >= MIN_DISTINTOS:
+                            candidatos.append((inclusao, encontrados, b))
+
+                    # Entre as referenciadas que contêm a coluna, as menores (ex.: tabelas de domínio) são as mais prováveis
+                    candidatos.sort(key=lambda x: (-x[0], x[2].num_registros or x[2].distintos))
+                    for inclusao, encontrados, b in candidatos[:MAX_CANDIDATOS_COLUNA]:
+                        registros.append((*a.tabela, a.coluna, tipo, *b.tabela, b.coluna, inclusao, len(a.hashes),
+                                          encontrados, b.fracao_amostra))
+
+        df = pd.DataFrame(registros, columns=COLUNAS_RELACIONAMENTOS)
+        return df.sort_values(['inclusao_estimada', 'valores_encontrados'], ascending=False, kind='stable',
+                              ignore_index=True)
+
+    @staticmethod
+    def _inclusao(a, b):
+        """
+        :return: Tupla (inclusão estimada da coluna a na coluna b, hashes de a encontrados no filtro de b).
+        """
+        encontrados = int(b.filtro.contem(a.hashes).sum())
+        falsos_positivos = b.filtro.taxa_falsos_positivos
+        proporcao = (encontrados / len(a.hashes) - falsos_positivos) / (1 - falsos_positivos)
+        return min(1.0, max(0.0, proporcao) / b.fracao_amostra), encontrados
+
+
+def confirmar(ambiente, df_relacionamentos, n):
+    """
+    Confirma no SGBD os n relacionamentos mais prováveis, contando os valores da coluna sem correspondente na coluna
+    referenciada (ver Ambiente.contar_orfaos).
+
+    :return: DataFrame de relacionamentos com as colunas valores_nao_nulos, orfaos e confirmado (SIM se não há órfãos).
+    """
+    df = df_relacionamentos.copy()
+    df['valores_nao_nulos'] = None
+    df['orfaos'] = None
+    df['confirmado'] = None
+
+    for i in df.index[:n]:
+        r = df.loc[i]
+        try:
+            with desempenho.span('confirmar_relacionamento', database=r.database_name, schema=r.schema_name,
+                                 table=r.table_name, coluna=r.column_name):
+                nao_nulos, orfaos = ambiente.contar_orfaos(r.database_name, r.schema_name, r.table_name, r.column_name,
+                                                           r.database_ref, r.schema_ref, r.table_ref, r.column_ref)
+        except Exception as e:
+            print(f'ERRO: Falha ao confirmar o relacionamento {r.table_name}.{r.column_name} -> '
+                  f'{r.table_ref}.{r.column_ref}: {e}')
+            continue
+
+        df.at[i, 'valores_nao_nulos'] = nao_nulos
+        df.at[i, 'orfaos'] = orfaos
+        df.at[i, 'confirmado'] = ('-', 'SIM')[int(orfaos == 0)]
+
+    return df
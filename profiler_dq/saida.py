@@ -0,0 +1,103 @@
+"""
+Gravação incremental do resultado do profiling em formatos colunares (Parquet, Arrow IPC) e CSV.
+
+Cada planilha (Tabelas, Colunas, Validacao) é gravada em um arquivo próprio, <base>_<planilha>.<extensão>,
+e recebe os registros em lotes, à medida que as tabelas são concluídas. O esquema de cada arquivo é definido
+pelo primeiro lote: os lotes seguintes são convertidos para ele e colunas ausentes são preenchidas com nulos.
+
+Colunas de texto ou com valores de tipos variados (object) são gravadas como texto.
+"""
+import os
+import threading
+
+import pandas as pd
+
+FORMATOS = ('xlsx', 'parquet', 'arrow', 'csv')
+FORMATOS_PYARROW = ('parquet', 'arrow')
+EXTENSOES = {'parquet': '.parquet', 'arrow': '.arrow', 'csv': '.csv'}
+
+
+def _normalizar(df):
+    """
+    Converte as colunas de tipos variados (object) para texto, mantendo os nulos.
+    """
+    df = df.reset_index(drop=True).copy()
+    for c in df.columns:
+        if df[c].dtype == object or isinstance(df[c].dtype, pd.StringDtype):
+            df[c] = pd.array([None if pd.isnull(x) else str(x) for x in df[c]], dtype='string')
+    return df
+
+
+class Saida:
+    """
+    :param arquivo: Nome do arquivo de saída. A extensão é descartada e o restante é usado como base dos nomes dos arquivos.
+    :param formatos: Formatos gravados de forma incremental ('parquet', 'arrow' e/ou 'csv'). O formato 'xlsx' é ignorado.
+    """
+    def __init__(self, arquivo, formatos):
+        self._base = os.path.splitext(arquivo)[0]
+        self._formatos = [f for f in dict.fromkeys(formatos) if f != 'xlsx']
+        self._escritores = {}
+        self._esquemas = {}
+        self._colunas = {}
+        self._lock = threading.Lock()
+
+        if any(f in FORMATOS_PYARROW for f in self._formatos):
+            try:
+                import pyarrow
+            except ImportError:
+                raise ImportError("Os formatos parquet e arrow requerem o pacote pyarrow (pip install pyarrow).")
+
+    def arquivo(self, planilha, formato):
+        return f"{self._base}_{planilha}{EXTENSOES[formato]}"
+
+    def escrever(self, planilha, df):
+        """
+        Acrescenta um lote de registros à planilha em todos os formatos.
+        """
+        if not self._formatos or df is None or len(df) == 0:
+            return
+
+        with self._lock:
+            if planilha not in self._colunas:
+                self._colunas[planilha] = list(df.columns)
+            df = _normalizar(df.reindex(columns=self._colunas[planilha]))
+
+            for formato in self._formatos:
+                try:
+                    self._escrever_formato(planilha, formato, df)
+                except Exception as e:
+                    print(f"ERRO: Falha ao gravar {len(df)} registros em {self.arquivo(planilha, formato)}: {e}")
+
+    def _escrever_formato(self, planilha, formato, df):
+        chave = (planilha, formato)
+        arquivo = self.arquivo(planilha, formato)
+
+        if formato == 'csv':
+            primeiro = chave not in self._escritores
+            df.to_csv(arquivo, mode='w' if primeiro else 'a', header=primeiro, index=False)
+            self._escritores[chave] = None
+            return
+
+        import pyarrow as pa
+
+        tabela = pa.Table.from_pandas(df, preserve_index=False)
+        if chave not in self._escritores:
+            if formato == 'parquet':
+                import pyarrow.parquet as pq
+                escritor = pq.ParquetWriter(arquivo, tabela.schema)
+            else:
+                escritor = pa.ipc.new_file(arquivo, tabela.schema)
+            self._escritores[chave] = escritor
+            self._esquemas[chave] = tabela.schema
+        else:
+            tabela = tabela.cast(self._esquemas[chave], safe=False)
+
+        self._escritores[chave].write_table(tabela)
+
+    def fechar(self):
+        with self._lock:
+            for (planilha, formato), escritor in self._escritores.items():
+                if escritor is not None:
+                    escritor.close()
+                print(f"Arquivo {self.arquivo(planilha, formato)} gravado")
+            self._escritores = {}
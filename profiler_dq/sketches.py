@@ -0,0 +1,230 @@
+"""
+Sketches para estimativas com memória constante sobre todos os registros de uma tabela.
+
+- HyperLogLog: estimativa do número de valores distintos.
+- KLL: estimativa de quantis (percentis).
+- FiltroBloom: teste de pertinência a um conjunto de valores (ver profiler_dq.relacionamentos).
+
+Os sketches podem ser combinados (combinar), permitindo processar a tabela em blocos.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+
+class HyperLogLog:
+    """
+    Estimador de cardinalidade HyperLogLog sobre hashes de 64 bits.
+
+    :param erro: Erro relativo padrão desejado. O número de registradores é m = 2^p, com 1.04/sqrt(m) <= erro.
+    """
+    def __init__(self, erro=0.01):
+        p = math.ceil(math.log2((1.04 / erro) ** 2))
+        self.p = min(max(p, 4), 18)
+        self.m = 1 << self.p
+        self.registradores = np.zeros(self.m, dtype=np.uint8)
+
+    @property
+    def erro(self):
+        """
+        Erro relativo padrão da estimativa.
+        """
+        return 1.04 / math.sqrt(self.m)
+
+    @staticmethod
+    def _bit_length(x):
+        # frexp é exato para inteiros de até 53 bits, por isso o valor é separado em duas metades de 32 bits
+        alto = (x >> np.uint64(32)).astype(np.float64)
+        baixo = (x & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        return np.where(alto > 0, 32 + np.frexp(alto)[1], np.frexp(baixo)[1])
+
+    def adicionar_hashes(self, hashes):
+        if len(hashes) == 0:
+            return
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        bits_restantes = 64 - self.p
+        indices = (hashes >> np.uint64(bits_restantes)).astype(np.int64)
+        restante = hashes & np.uint64((1 << bits_restantes) - 1)
+        # Posição do primeiro bit 1 nos bits restantes
+        rank = (bits_restantes - self._bit_length(restante) + 1).astype(np.uint8)
+        np.maximum.at(self.registradores, indices, rank)
+
+    def combinar(self, outro):
+        if outro.p != self.p:
+            raise ValueError("Não é possível combinar HyperLogLog com precisões diferentes")
+        np.maximum(self.registradores, outro.registradores, out=self.registradores)
+
+    @staticmethod
+    def _sigma(x):
+        if x == 1:
+            return math.inf
+        y, z = 1.0, x
+        while True:
+            x *= x
+            z_anterior = z
+            z += x * y
+            y += y
+            if z == z_anterior:
+                return z
+
+    @staticmethod
+    def _tau(x):
+        if x == 0 or x == 1:
+            return 0.0
+        y, z = 1.0, 1 - x
+        while True:
+            x = math.sqrt(x)
+            z_anterior = z
+            y *= 0.5
+            z -= (1 - x) ** 2 * y
+            if z == z_anterior:
+                return z / 3
+
+    def estimativa(self):
+        """
+        Estimador aprimorado de Ertl ("New cardinality estimation algorithms for HyperLogLog sketches", 2017), a
+        partir do histograma dos registradores. Diferente do estimador original, que corrige as cardinalidades
+        pequenas por linear counting e tem viés de alguns erros padrão na transição (entre 2.5m e 5m), não tem
+        viés relevante em todo o intervalo, sem tabelas empíricas de correção (HLL++).
+        """
+        m = self.m
+        q = 64 - self.p
+        contagens = np.bincount(self.registradores, minlength=q + 2)
+
+        z = m * self._tau(1 - contagens[q + 1] / m)
+        for k in range(q, 0, -1):
+            z = 0.5 * (z + contagens[k])
+        z += m * self._sigma(contagens[0] / m)
+
+        return m * m / (2 * math.log(2)) / z
+
+
+class KLL:
+    """
+    Sketch de quantis KLL (Karnin, Lang e Liberty). Os valores são mantidos em níveis de compactação, em que
+    cada item do nível h representa 2^h valores. Funciona com qualquer tipo de valor ordenável.
+
+    :param erro: Erro de rank (normalizado) desejado. O parâmetro k do sketch é aproximadamente 1.7/erro.
+    """
+    C = 2 / 3
+    CAPACIDADE_MINIMA = 8
+
+    def __init__(self, erro=0.01, seed=None):
+        self.k = max(self.CAPACIDADE_MINIMA, math.ceil(1.7 / erro))
+        self.niveis = [np.empty(0)]
+        self.n = 0
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def erro(self):
+        """
+        Erro de rank (normalizado) aproximado das estimativas.
+        """
+        return 1.7 / self.k
+
+    def _capacidade(self, h):
+        altura = len(self.niveis)
+        return max(self.CAPACIDADE_MINIMA, int(math.ceil(self.k * self.C ** (altura - 1 - h))))
+
+    def _compactar(self):
+        h = 0
+        while h < len(self.niveis):
+            nivel = self.niveis[h]
+            if len(nivel) <= self._capacidade(h):
+                h += 1
+                continue
+
+            if h + 1 == len(self.niveis):
+                self.niveis.append(nivel[:0])
+
+            nivel = np.sort(nivel, kind='stable')
+            # Com um número ímpar de itens, o último permanece no nível
+            resto = nivel[len(nivel) - len(nivel) % 2:]
+            pares = nivel[:len(nivel) - len(nivel) % 2]
+            promovidos = pares[self.rng.integers(2)::2]
+
+            self.niveis[h] = resto
+            self.niveis[h + 1] = np.concatenate([self.niveis[h + 1], promovidos])
+            # A capacidade dos níveis inferiores diminui quando a altura aumenta
+            h = 0
+
+    def adicionar(self, valores):
+        valores = np.asarray(valores)
+        if len(valores) == 0:
+            return
+        self.n += len(valores)
+        self.niveis[0] = np.concatenate([self.niveis[0], valores]) if len(self.niveis[0]) else valores
+        self._compactar()
+
+    def combinar(self, outro):
+        for h, nivel in enumerate(outro.niveis):
+            if h == len(self.niveis):
+                self.niveis.append(nivel)
+            elif len(nivel):
+                self.niveis[h] = np.concatenate([self.niveis[h], nivel]) if len(self.niveis[h]) else nivel
+        self.n += outro.n
+        self._compactar()
+
+    def quantis(self, qs):
+        """
+        Estima os quantis qs (entre 0 e 1), retornando sempre um dos valores observados.
+        """
+        if self.n == 0:
+            return [None] * len(qs)
+
+        itens = np.concatenate([n for n in self.niveis if len(n)])
+        pesos = np.concatenate([np.full(len(n), 1 << h, dtype=np.int64) for h, n in enumerate(self.niveis) if len(n)])
+        ordem = np.argsort(itens, kind='stable')
+        itens, acumulado = itens[ordem], np.cumsum(pesos[ordem])
+
+        total = acumulado[-1]
+        ranks = np.round(np.asarray(qs) * (total - 1))
+        indices = np.searchsorted(acumulado, ranks, side='right')
+        return pd.Series(itens[np.minimum(indices, len(itens) - 1)]).tolist()
+
+
+class FiltroBloom:
+    """
+    Filtro de Bloom sobre hashes de 64 bits: indica se um valor pertence ao conjunto, com uma taxa de falsos
+    positivos, mas sem falsos negativos. As k posições de cada valor são derivadas das duas metades do hash
+    (h1 + i * h2, como em Kirsch e Mitzenmacher).
+
+    :param capacidade: Número de valores distintos previsto.
+    :param bits_por_valor: Tamanho do filtro por valor previsto (10 bits: cerca de 1% de falsos positivos).
+    """
+    def __init__(self, capacidade, bits_por_valor=10):
+        self.m = max(64, int(capacidade * bits_por_valor))
+        self.k = max(1, round(bits_por_valor * math.log(2)))
+        self.bits = np.zeros(self.m, dtype=bool)
+        self.n = 0
+
+    def _posicoes(self, hashes):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        h1 = hashes & np.uint64(0xFFFFFFFF)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        return (h1[:, None] + np.arange(self.k, dtype=np.uint64) * h2[:, None]) % np.uint64(self.m)
+
+    def adicionar_hashes(self, hashes):
+        if len(hashes) == 0:
+            return
+        self.bits[self._posicoes(hashes)] = True
+        self.n += len(hashes)
+
+    def combinar(self, outro):
+        if (outro.m, outro.k) != (self.m, self.k):
+            raise ValueError("Não é possível combinar filtros de Bloom de tamanhos diferentes")
+        np.logical_or(self.bits, outro.bits, out=self.bits)
+        self.n += outro.n
+
+    def contem(self, hashes):
+        """
+        :return: Array booleano indicando os hashes (possivelmente) presentes no filtro.
+        """
+        if len(hashes) == 0:
+            return np.zeros(0, dtype=bool)
+        return self.bits[self._posicoes(hashes)].all(axis=1)
+
+    @property
+    def taxa_falsos_positivos(self):
+        return (1 - math.exp(-self.k * self.n / self.m)) ** self.k
@@ -0,0 +1,34 @@
+import threading
+import time
+
+from profiler_dq.info_colunas import _pipeline
+
+
+def test_pipeline_ordem():
+    tarefas = list(range(20))
+    resultados = list(_pipeline(tarefas, lambda t: t * 2, lambda t, x: (t, x), 4, 2, 2))
+    assert resultados == [(t, t * 2) for t in tarefas]
+
+
+def test_pipeline_interrompido_com_mais_produtores_que_a_fila():
+    produtores, tamanho_fila = 8, 2
+    tarefas = list(range(50))
+
+    def produzir(t):
+        # Os produtores ainda em execução no momento da interrupção encontram a fila cheia
+        time.sleep(0.2)
+        return t
+
+    threads_iniciais = threading.active_count()
+    concluido = threading.Event()
+
+    def executar():
+        for r in _pipeline(tarefas, produzir, lambda t, x: x, produtores, 1, tamanho_fila):
+            if r == 0:
+                break
+        concluido.set()
+
+    threading.Thread(target=executar, daemon=True).start()
+    assert concluido.wait(timeout=10), 'o pipeline não foi encerrado após a interrupção'
+    time.sleep(0.5)
+    assert threading.active_count() <= threads_iniciais